@@ -0,0 +1,497 @@
+''' Banco de pruebas de rendimiento de TRENT. Aplica cada filtro de PDI a
+    imágenes sintéticas de varios tamaños sin abrir la interfaz y reporta en
+    JSON, por filtro y tamaño, el tiempo, los megapixeles por segundo, la
+    memoria máxima del proceso y una suma de verificación del resultado.
+
+    Con --base se comparan los tiempos con los de una ejecución anterior para
+    encontrar regresiones. Las sumas de verificación se comparan siempre con
+    las de referencia (trent_referencia.json, de las imágenes de 0.3
+    megapixeles) para asegurar que una optimización no cambió el resultado
+    de ningún filtro; --referencia usa otro archivo escrito por este mismo
+    programa y --actualiza-referencia reescribe el de referencia cuando un
+    filtro cambia a propósito.
+
+    Con --arranque se mide en cambio el tiempo de arranque: importar
+    trent_procesador en un proceso nuevo (que no debe cargar PIL ni la
+    interfaz) y, con --interfaz o --ejecutable, abrir la ventana de la
+    interfaz o de la aplicación empaquetada. Termina con error si algún
+    tiempo pasa de su presupuesto.
+
+    Ejemplos:
+
+        python trent_benchmark.py -o base.json
+        python trent_benchmark.py --tamanios 0.3,1 --base base.json
+        python trent_benchmark.py --tamanios 0.3 --actualiza-referencia
+        python trent_benchmark.py --arranque --interfaz
+        python trent_benchmark.py --arranque --ejecutable dist/windows/TRENT/TRENT.exe
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import statistics
+import subprocess
+
+import numpy as np
+
+from trent_procesador import FILTROS_CONVOLUCION, PDI
+from trent_lote import PASOS
+
+# Tamaños por omisión de las imágenes sintéticas, en megapixeles
+TAMANIOS = (0.3, 1, 4, 12, 50)
+
+# Directorio de los módulos de TRENT
+DIR_TRENT = os.path.dirname(os.path.abspath(__file__))
+
+# Sumas de verificación correctas de las imágenes de TAMANIO_REFERENCIA megapixeles
+REFERENCIA = os.path.join(DIR_TRENT, 'trent_referencia.json')
+TAMANIO_REFERENCIA = 0.3
+
+# Fuente de la marca de agua, incluida con TRENT
+FUENTE = os.path.join(DIR_TRENT, 'fonts', 'Minecraft.ttf')
+
+# Tolerancia por omisión al comparar tiempos con la base: 0.1 es 10% más lento
+TOLERANCIA = 0.1
+
+# Diferencia en segundos con la base que se toma como ruido de la medición
+RUIDO = 0.002
+
+# Presupuestos de arranque en segundos: importar trent_procesador en un
+# proceso nuevo y mostrar la ventana de la interfaz
+PRESUPUESTO_IMPORTACION = 0.25
+PRESUPUESTO_INTERFAZ = 3.0
+
+# Módulos que importar trent_procesador no debe cargar
+MODULOS_DIFERIDOS = ('PIL', 'tkinter', 'PySimpleGUI', 'matplotlib')
+
+# Variable de entorno con la que la interfaz termina en cuanto muestra la ventana
+VARIABLE_ARRANQUE = 'TRENT_SOLO_ARRANQUE'
+
+
+def casos():
+    ''' Función que regresa los filtros a medir como una lista de tuplas
+        (etiqueta, nombre, argumentos), donde nombre es un paso de
+        trent_lote. La etiqueta identifica el caso entre ejecuciones'''
+
+    lista = [('gris', (tono,)) for tono in range(1, 10)]
+    lista += [('modificar_brillo', (40,)),
+              ('capa_rgb', (255, 128, 0)),
+              ('alto_contraste', ()),
+              ('inverso', ()),
+              ('mosaico', (16, 16))]
+    lista += [('filtros_convolucion', (filtro,)) for filtro in FILTROS_CONVOLUCION]
+    lista += [('erosion', ('maximo',)),
+              ('erosion', ('minimo',)),
+              ('morfologia', ('apertura', 'disco', 9)),
+              ('dit_ord_disp', ('ordenado',)),
+              ('dit_ord_disp', ('disperso',)),
+              ('dit_azar', (1,))]
+    lista += [('dit_bayer', (orden,)) for orden in (2, 4, 8)]
+    lista += [('dit_difusion', ('floyd-steinberg',)),
+              ('dit_difusion', ('atkinson',))]
+    lista += [('semitono', (bib, 8, 8, 16, 16)) for bib in (0, 1, 2)]
+    lista += [('filtros_letras', (16, 16, opcion)) for opcion in ('m-cl', 'm-g', 'ds-t', 'ds-c', 'ds-g',
+                                                                    'dn', 'db', 'nps')]
+    lista += [('filtros_letras', (16, 16, 'tp-cl', 'TRENT')),
+              ('aplica_img_recursiva', ('gris', 32, 32, 32, 32)),
+              ('aplica_img_recursiva', ('color', 32, 32, 32, 32))]
+
+    resultado = [('%s:%s' % (nombre, ','.join(map(str, args))) if args else nombre, nombre, args)
+                 for nombre, args in lista]
+    resultado.append(('marca_de_agua:TRENT,%s,64,50,10,10' % os.path.basename(FUENTE), 'marca_de_agua',
+                      ('TRENT', FUENTE, 64, 50, 10, 10)))
+
+    return resultado
+
+
+def imagen_sintetica(megapixeles, semilla = 0):
+    ''' Función que genera siempre la misma imagen rgb para el tamaño dado,
+        con degradados en el rojo y el verde y ruido en el azul, en
+        proporción 4:3. Regresa un arreglo (alto, ancho, 3) uint8
+
+        megapixeles: float. Tamaño de la imagen en megapixeles
+        semilla: int. Semilla del ruido'''
+
+    ancho = max(1, int(round((megapixeles * 1e6 * 4 / 3) ** 0.5)))
+    alto = max(1, int(round(megapixeles * 1e6 / ancho)))
+
+    img = np.empty((alto, ancho, 3), dtype=np.uint8)
+    img[:, :, 0] = (np.arange(ancho) * 255 // max(1, ancho - 1)).astype(np.uint8)[None, :]
+    img[:, :, 1] = (np.arange(alto) * 255 // max(1, alto - 1)).astype(np.uint8)[:, None]
+    img[:, :, 2] = np.random.default_rng(semilla).integers(0, 256, (alto, ancho), dtype=np.uint8)
+
+    return img
+
+
+def _reinicia_pico():
+    ''' Función que reinicia la memoria máxima del proceso, para medir la de
+        cada filtro por separado. Solo se puede en Linux'''
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as archivo:
+            archivo.write('5')
+    except OSError:
+        pass
+
+
+def pico_memoria():
+    ''' Función que regresa la memoria máxima (RSS) usada por el proceso
+        desde el último reinicio, en MB, o None si no se puede medir'''
+
+    try:
+        with open('/proc/self/status') as archivo:
+            for linea in archivo:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss está en KB en Linux y en bytes en macOS, y no se reinicia
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 2 ** 20 if sys.platform == 'darwin' else pico / 1024
+
+
+def suma_verificacion(arreglo):
+    ''' Función que regresa el SHA-256 de la forma y los pixeles del arreglo
+
+        arreglo: ndarray. Arreglo de la imagen'''
+
+    suma = hashlib.sha256(str(arreglo.shape).encode())
+    suma.update(np.ascontiguousarray(arreglo))
+
+    return suma.hexdigest()
+
+
+def medir(img, nombre, argumentos, repeticiones = 1, hilos = None):
+    ''' Función que aplica el filtro a la imagen y regresa una tupla
+        (segundos, memoria en MB, suma de verificación). Cada repetición usa
+        un PDI nuevo y se toma el menor tiempo
+
+        img: ndarray. Arreglo de la imagen
+        nombre: str. Nombre del paso de trent_lote
+        argumentos: tuple. Argumentos del paso
+        repeticiones: int. Número de veces que se aplica el filtro
+        hilos: int. Número de hilos del PDI, None para el de omisión'''
+
+    mejor = None
+
+    for _ in range(max(1, repeticiones)):
+        pdi = PDI(img)
+
+        if hilos is not None:
+            pdi.set_hilos(hilos)
+
+        _reinicia_pico()
+        inicio = time.perf_counter()
+        PASOS[nombre](pdi, *argumentos)
+        segundos = time.perf_counter() - inicio
+        memoria = pico_memoria()
+
+        if mejor is None or segundos < mejor[0]:
+            mejor = (segundos, memoria)
+
+    return mejor + (suma_verificacion(pdi.get_arreglo()),)
+
+
+def ejecutar(tamanios = TAMANIOS, filtros = None, repeticiones = 1, hilos = None, salida_avance = None):
+    ''' Función que mide todos los filtros en todos los tamaños. Regresa un
+        diccionario listo para guardarse como JSON
+
+        tamanios: tuple. Tamaños de las imágenes en megapixeles
+        filtros: str. Expresión regular que deben cumplir las etiquetas de
+                 los casos a medir, None para medirlos todos
+        repeticiones: int. Número de veces que se aplica cada filtro
+        hilos: int. Número de hilos de cada PDI, None para el de omisión
+        salida_avance: file. Archivo donde se escribe una línea por caso'''
+
+    seleccion = [caso for caso in casos() if filtros is None or re.search(filtros, caso[0])]
+    resultados = []
+
+    for megapixeles in tamanios:
+        img = imagen_sintetica(megapixeles)
+        alto, ancho = img.shape[:2]
+
+        for etiqueta, nombre, argumentos in seleccion:
+            segundos, memoria, suma = medir(img, nombre, argumentos, repeticiones, hilos)
+            resultados.append({'filtro': etiqueta,
+                               'ancho': ancho,
+                               'alto': alto,
+                               'megapixeles': ancho * alto / 1e6,
+                               'segundos': segundos,
+                               'mp_s': ancho * alto / 1e6 / max(segundos, 1e-9),
+                               'memoria_mb': memoria,
+                               'suma': suma})
+
+            if salida_avance is not None:
+                print('%-48s %6.1f MP %9.4f s %8.2f MP/s %8s MB'
+                      % (etiqueta, ancho * alto / 1e6, segundos, ancho * alto / 1e6 / max(segundos, 1e-9),
+                         '-' if memoria is None else '%.0f' % memoria), file=salida_avance)
+
+    return {'entorno': {'python': platform.python_version(),
+                        'numpy': np.__version__,
+                        'plataforma': platform.platform(),
+                        'procesador': platform.processor(),
+                        'nucleos': os.cpu_count(),
+                        'hilos': hilos,
+                        'repeticiones': repeticiones},
+            'resultados': resultados}
+
+
+def referencia(reporte):
+    ''' Función que regresa la referencia con las sumas de verificación de
+        las imágenes de TAMANIO_REFERENCIA megapixeles del reporte, lista
+        para guardarse como JSON
+
+        reporte: dict. Resultado de ejecutar'''
+
+    import PIL
+
+    ancho, alto = imagen_sintetica(TAMANIO_REFERENCIA).shape[1::-1]
+
+    return {'entorno': {'numpy': np.__version__, 'pillow': PIL.__version__},
+            'resultados': [{clave: r[clave] for clave in ('filtro', 'ancho', 'alto', 'suma')}
+                           for r in reporte['resultados'] if (r['ancho'], r['alto']) == (ancho, alto)]}
+
+
+def _por_caso(reporte):
+    return {(r['filtro'], r['ancho'], r['alto']): r for r in reporte['resultados']}
+
+
+def compara_base(reporte, base, tolerancia = TOLERANCIA):
+    ''' Función que regresa la lista de regresiones de tiempo respecto a la
+        base: los casos que tardaron más que el de la base por más de la
+        tolerancia y por más de RUIDO segundos. Cada regresión es una tupla (resultado, resultado base)
+
+        reporte: dict. Resultado de ejecutar
+        base: dict. Resultado de una ejecución anterior
+        tolerancia: float. Fracción de tiempo extra permitida'''
+
+    anteriores = _por_caso(base)
+    regresiones = []
+
+    for clave, actual in _por_caso(reporte).items():
+        anterior = anteriores.get(clave)
+
+        if anterior is not None and actual['segundos'] > anterior['segundos'] * (1 + tolerancia) and \
+                actual['segundos'] - anterior['segundos'] > RUIDO:
+            regresiones.append((actual, anterior))
+
+    return regresiones
+
+
+def compara_referencia(reporte, referencia):
+    ''' Función que regresa la lista de casos cuya suma de verificación no
+        coincide con la de la referencia, como tuplas (resultado, resultado
+        de la referencia). Los casos que no están en la referencia no se
+        comparan
+
+        reporte: dict. Resultado de ejecutar
+        referencia: dict. Resultado de una ejecución con los resultados correctos'''
+
+    correctos = _por_caso(referencia)
+
+    return [(actual, correctos[clave]) for clave, actual in _por_caso(reporte).items()
+            if clave in correctos and actual['suma'] != correctos[clave]['suma']]
+
+
+def medir_comando(comando, repeticiones = 5, entorno = None):
+    ''' Función que ejecuta el comando varias veces en un proceso nuevo.
+        Regresa una tupla (mediana de los segundos, salida de la última vez)
+
+        comando: list. Programa y argumentos
+        repeticiones: int. Número de veces que se ejecuta
+        entorno: dict. Variables de entorno extra del proceso'''
+
+    variables = dict(os.environ, **(entorno or {}))
+    tiempos = []
+
+    for _ in range(max(1, repeticiones)):
+        inicio = time.perf_counter()
+        proceso = subprocess.run(comando, capture_output=True, text=True, env=variables)
+        tiempos.append(time.perf_counter() - inicio)
+
+        if proceso.returncode != 0:
+            error = proceso.stderr.strip().splitlines()
+            raise RuntimeError('%s terminó con error: %s' % (comando[0], error[-1] if error else proceso.returncode))
+
+    return statistics.median(tiempos), proceso.stdout
+
+
+def medir_arranque(repeticiones = 5, interfaz = None, presupuesto_importacion = PRESUPUESTO_IMPORTACION,
+                   presupuesto_interfaz = PRESUPUESTO_INTERFAZ):
+    ''' Función que mide el tiempo de arranque. Regresa un diccionario listo
+        para guardarse como JSON con la mediana de los segundos de cada
+        medición, su presupuesto y si lo cumple
+
+        repeticiones: int. Número de veces que se repite cada medición
+        interfaz: list. Comando que abre la interfaz, None para no medirla
+        presupuesto_importacion: float. Segundos permitidos para importar trent_procesador
+        presupuesto_interfaz: float. Segundos permitidos para mostrar la ventana'''
+
+    codigo = ('import sys, json, trent_procesador; '
+              'print(json.dumps(sorted({modulo.split(".")[0] for modulo in sys.modules})))')
+    segundos, salida = medir_comando([sys.executable, '-c', codigo], repeticiones, {'PYTHONPATH': DIR_TRENT})
+    cargados = [modulo for modulo in MODULOS_DIFERIDOS if modulo in json.loads(salida)]
+
+    arranque = {'importacion': {'segundos': segundos,
+                                'presupuesto': presupuesto_importacion,
+                                'modulos_diferidos_cargados': cargados,
+                                'cumple': segundos <= presupuesto_importacion and not cargados}}
+
+    if interfaz is not None:
+        segundos, salida = medir_comando(interfaz, repeticiones, {VARIABLE_ARRANQUE: '1'})
+        # La interfaz imprime el tiempo desde que empieza a ejecutarse su
+        # código; la diferencia es lo que tarda en iniciar Python o el ejecutable
+        propio = re.search(r'arranque ([\d.]+)', salida)
+
+        arranque['interfaz'] = {'comando': interfaz,
+                                'segundos': segundos,
+                                'segundos_modulos': float(propio.group(1)) if propio else None,
+                                'presupuesto': presupuesto_interfaz,
+                                'cumple': segundos <= presupuesto_interfaz}
+
+    return arranque
+
+
+def _lee_json(ruta):
+    with open(ruta) as archivo:
+        return json.load(archivo)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Mide el tiempo y la memoria de cada filtro de TRENT.')
+    parser.add_argument('-o', '--salida', help='archivo JSON con los resultados (por omisión, la salida estándar)')
+    parser.add_argument('--tamanios', default=','.join(map(str, TAMANIOS)),
+                        help='tamaños de las imágenes en megapixeles separados por ","')
+    parser.add_argument('--filtros', help='expresión regular de los filtros a medir, p. ej. "^gris|dit_"')
+    parser.add_argument('-n', '--repeticiones', type=int, default=1, help='veces que se aplica cada filtro')
+    parser.add_argument('--hilos', type=int, help='hilos de cada PDI (por omisión, uno por núcleo)')
+    parser.add_argument('--base', help='JSON de una ejecución anterior para buscar regresiones de tiempo')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA,
+                        help='fracción de tiempo extra permitida respecto a la base')
+    parser.add_argument('--referencia', default=REFERENCIA,
+                        help='JSON con las sumas de verificación correctas (por omisión, %s)'
+                             % os.path.basename(REFERENCIA))
+    parser.add_argument('--sin-referencia', action='store_true', help='no compara las sumas de verificación')
+    parser.add_argument('--actualiza-referencia', action='store_true',
+                        help='reescribe la referencia con las sumas de esta ejecución en lugar de compararlas')
+    parser.add_argument('-q', '--silencioso', action='store_true', help='no escribe el avance de cada caso')
+    parser.add_argument('--arranque', action='store_true',
+                        help='mide el tiempo de arranque en lugar de los filtros (-n veces, 5 por omisión)')
+    parser.add_argument('--interfaz', action='store_true', help='con --arranque, mide también abrir la interfaz')
+    parser.add_argument('--ejecutable', metavar='RUTA',
+                        help='con --arranque, mide abrir la aplicación empaquetada en lugar de trent_ui.py')
+    parser.add_argument('--presupuesto-importacion', type=float, default=PRESUPUESTO_IMPORTACION, metavar='S',
+                        help='segundos permitidos para importar trent_procesador (por omisión, %(default)s)')
+    parser.add_argument('--presupuesto-interfaz', type=float, default=PRESUPUESTO_INTERFAZ, metavar='S',
+                        help='segundos permitidos para mostrar la ventana (por omisión, %(default)s)')
+    args = parser.parse_args(argv)
+
+    if args.arranque:
+        return main_arranque(args)
+
+    try:
+        tamanios = [float(t) for t in args.tamanios.split(',')]
+        base = _lee_json(args.base) if args.base else None
+        correctos = None if args.sin_referencia or args.actualiza_referencia else _lee_json(args.referencia)
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+
+    if args.actualiza_referencia and TAMANIO_REFERENCIA not in tamanios:
+        parser.error('--actualiza-referencia necesita el tamaño %s en --tamanios' % TAMANIO_REFERENCIA)
+
+    if args.actualiza_referencia and args.filtros:
+        parser.error('--actualiza-referencia necesita medir todos los filtros')
+
+    reporte = ejecutar(tamanios, args.filtros, args.repeticiones, args.hilos,
+                       None if args.silencioso else sys.stderr)
+    errores = 0
+
+    if base is not None:
+        regresiones = compara_base(reporte, base, args.tolerancia)
+        reporte['regresiones'] = [actual['filtro'] + ' @ %dx%d' % (actual['ancho'], actual['alto'])
+                                  for actual, anterior in regresiones]
+
+        for actual, anterior in regresiones:
+            print('REGRESION\t%s @ %dx%d\t%.4f s (base %.4f s)' % (actual['filtro'], actual['ancho'], actual['alto'],
+                                                                  actual['segundos'], anterior['segundos']),
+                  file=sys.stderr)
+
+        errores += len(regresiones)
+
+    if correctos is not None:
+        diferentes = compara_referencia(reporte, correctos)
+        reporte['sumas_diferentes'] = [actual['filtro'] + ' @ %dx%d' % (actual['ancho'], actual['alto'])
+                                       for actual, correcto in diferentes]
+
+        for actual, correcto in diferentes:
+            print('SUMA DIFERENTE\t%s @ %dx%d' % (actual['filtro'], actual['ancho'], actual['alto']),
+                  file=sys.stderr)
+
+        errores += len(diferentes)
+
+    if args.actualiza_referencia:
+        with open(args.referencia, 'w') as archivo:
+            archivo.write(json.dumps(referencia(reporte), indent=2, ensure_ascii=False) + '\n')
+
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            archivo.write(texto + '\n')
+    else:
+        print(texto)
+
+    return 1 if errores else 0
+
+
+def main_arranque(args):
+    if args.ejecutable:
+        interfaz = [os.path.abspath(args.ejecutable)]
+    elif args.interfaz:
+        interfaz = [sys.executable, os.path.join(DIR_TRENT, 'trent_ui.py')]
+    else:
+        interfaz = None
+
+    try:
+        arranque = medir_arranque(args.repeticiones if args.repeticiones > 1 else 5, interfaz,
+                                  args.presupuesto_importacion, args.presupuesto_interfaz)
+    except (OSError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    for nombre, medicion in arranque.items():
+        print('%-12s %7.3f s (presupuesto %.3f s)%s'
+              % (nombre, medicion['segundos'], medicion['presupuesto'], '' if medicion['cumple'] else '\tEXCEDIDO'),
+              file=sys.stderr)
+
+    if arranque['importacion']['modulos_diferidos_cargados']:
+        print('importar trent_procesador carga %s' % ', '.join(arranque['importacion']['modulos_diferidos_cargados']),
+              file=sys.stderr)
+
+    texto = json.dumps({'entorno': {'python': platform.python_version(),
+                                    'plataforma': platform.platform(),
+                                    'nucleos': os.cpu_count()},
+                        'arranque': arranque}, indent=2, ensure_ascii=False)
+
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            archivo.write(texto + '\n')
+    else:
+        print(texto)
+
+    return 0 if all(medicion['cumple'] for medicion in arranque.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+''' Bibliotecas de mosaicos de TRENT para los fotomosaicos. Crea el índice
+    de un directorio de imágenes: una miniatura de cada imagen, recortada al
+    centro con la proporción de los mosaicos, y su color promedio.
+
+    El índice es un directorio con las miniaturas en un arreglo .npy que se
+    mapea en memoria al usarlo, los colores promedio en otro .npy y la lista
+    de imágenes en indice.json, así que se crea una sola vez y se abre al
+    instante con abrir_biblioteca de trent_procesador.
+
+    Ejemplo:
+
+        python trent_biblioteca.py fotos/ fotos_indice/ --tamanio 32x32
+        python trent_lote.py entrada/ salida/ "fotomosaico:fotos_indice,16x16"
+'''
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from trent_procesador import (COLORES_BIBLIOTECA, INDICE_BIBLIOTECA, MINIATURAS_BIBLIOTECA, VERSION_BIBLIOTECA,
+                              abrir_biblioteca)
+from trent_lote import busca_imagenes
+
+# Tamaño por omisión de las miniaturas
+ANCHO_MOSAICO = 32
+ALTO_MOSAICO = 32
+
+# Número de imágenes que se mandan juntas a cada proceso
+IMAGENES_POR_TAREA = 64
+
+
+def miniatura(ruta, ancho, alto):
+    ''' Función que regresa la miniatura de la imagen recortada al centro a
+        la proporción ancho x alto, como arreglo (alto, ancho, 3) uint8, o
+        None si la imagen no se puede leer
+
+        ruta: str. Ruta de la imagen
+        ancho: int. Ancho de la miniatura
+        alto: int. Alto de la miniatura'''
+
+    try:
+        with Image.open(ruta) as img:
+            # Las JPEG se decodifican directamente reducidas
+            img.draft('RGB', (ancho * 2, alto * 2))
+            return np.asarray(ImageOps.fit(img.convert('RGB'), (ancho, alto), Image.LANCZOS))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def _miniaturas(rutas, ancho, alto):
+    return [miniatura(ruta, ancho, alto) for ruta in rutas]
+
+
+def construir_biblioteca(entrada, destino, ancho = ANCHO_MOSAICO, alto = ALTO_MOSAICO, recursivo = True,
+                         procesos = 1):
+    ''' Función que crea el índice de la biblioteca de mosaicos con las
+        imágenes de la entrada y regresa la biblioteca abierta. Las imágenes
+        que no se pueden leer se omiten
+
+        entrada: str. Directorio con las imágenes
+        destino: str. Directorio donde se escribe el índice
+        ancho: int. Ancho de las miniaturas
+        alto: int. Alto de las miniaturas
+        recursivo: bool. Valor que indica si buscar en los subdirectorios
+        procesos: int. Número de procesos para leer las imágenes'''
+
+    if ancho < 1 or alto < 1:
+        raise ValueError("Las miniaturas deben medir al menos 1x1!")
+
+    imagenes = busca_imagenes(entrada, recursivo)
+
+    if not imagenes:
+        raise ValueError("No se encontraron imágenes en %s!" % entrada)
+
+    os.makedirs(destino, exist_ok=True)
+
+    ruta_miniaturas = os.path.join(destino, MINIATURAS_BIBLIOTECA)
+    miniaturas = np.lib.format.open_memmap(ruta_miniaturas, mode='w+', dtype=np.uint8,
+                                           shape=(len(imagenes), alto, ancho, 3))
+    grupos = [[ruta for ruta, _ in imagenes[i:i + IMAGENES_POR_TAREA]]
+              for i in range(0, len(imagenes), IMAGENES_POR_TAREA)]
+
+    if procesos > 1:
+        ejecutor = ProcessPoolExecutor(max_workers=procesos)
+        resultados = ejecutor.map(_miniaturas, grupos, [ancho] * len(grupos), [alto] * len(grupos))
+    else:
+        ejecutor = None
+        resultados = (_miniaturas(grupo, ancho, alto) for grupo in grupos)
+
+    # Las miniaturas se escriben juntas, sin dejar huecos por las que fallan
+    rutas = []
+
+    try:
+        for grupo, leidas in zip(grupos, resultados):
+            for ruta, leida in zip(grupo, leidas):
+                if leida is not None:
+                    miniaturas[len(rutas)] = leida
+                    rutas.append(os.path.relpath(ruta, entrada))
+    finally:
+        if ejecutor is not None:
+            ejecutor.shutdown()
+
+    if not rutas:
+        raise ValueError("No se pudo leer ninguna imagen de %s!" % entrada)
+
+    colores = miniaturas[:len(rutas)].reshape(len(rutas), -1, 3).mean(axis=1)
+
+    if len(rutas) < len(imagenes):
+        completas = np.array(miniaturas[:len(rutas)])
+        del miniaturas
+        np.save(ruta_miniaturas, completas)
+    else:
+        miniaturas.flush()
+        del miniaturas
+
+    np.save(os.path.join(destino, COLORES_BIBLIOTECA), colores)
+
+    # El índice se escribe al final para que un índice a medias no se pueda abrir
+    with open(os.path.join(destino, INDICE_BIBLIOTECA), 'w') as archivo:
+        json.dump({'version': VERSION_BIBLIOTECA,
+                   'ancho': ancho,
+                   'alto': alto,
+                   'entrada': os.path.abspath(entrada),
+                   'rutas': rutas}, archivo, ensure_ascii=False)
+
+    return abrir_biblioteca(destino)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Crea el índice de una biblioteca de mosaicos para fotomosaicos.')
+    parser.add_argument('entrada', help='directorio con las imágenes de los mosaicos')
+    parser.add_argument('destino', help='directorio donde se escribe el índice')
+    parser.add_argument('--tamanio', default='%dx%d' % (ANCHO_MOSAICO, ALTO_MOSAICO),
+                        help='tamaño ANCHOxALTO de cada mosaico (por omisión, %(default)s)')
+    parser.add_argument('-p', '--procesos', type=int, default=os.cpu_count() or 1,
+                        help='número de procesos (por omisión, uno por núcleo)')
+    parser.add_argument('--sin-subdirectorios', action='store_true', help='no busca en los subdirectorios')
+    args = parser.parse_args(argv)
+
+    try:
+        ancho, alto = (int(valor) for valor in args.tamanio.lower().split('x'))
+    except ValueError:
+        parser.error('El tamaño debe tener la forma ANCHOxALTO')
+
+    try:
+        biblioteca = construir_biblioteca(args.entrada, args.destino, ancho, alto, not args.sin_subdirectorios,
+                                          max(1, args.procesos))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print('%d imágenes de %dx%d en %s' % (len(biblioteca), ancho, alto, args.destino))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+''' Procesamiento por bandas de filas de TRENT, para imágenes que no caben
+    en la memoria. Los filtros leen bandas de filas de la imagen de origen
+    (con las filas vecinas que necesitan, de forma cíclica como en PDI) y
+    escriben bandas en el destino, así que la memoria usada depende del
+    tamaño de la banda y no del de la imagen.
+
+    Las imágenes .npy y .ppm (P6) se leen y escriben directamente del disco
+    sin cargarlas completas. Las demás se decodifican con PIL a un archivo
+    temporal mapeado en memoria, y PIL necesita la imagen completa para
+    decodificarlas y codificarlas.
+'''
+
+import os
+
+import numpy as np
+from PIL import Image
+
+from trent_procesador import (FILTROS_CONVOLUCION, MATRIZ_DISPERSO, MATRIZ_ORDENADO, OperacionesPunto,
+                              aplicar_operaciones, arreglo_mapeado, convolucion, decodificar_mapeado,
+                              dither_bayer, dither_ordenado, erosion, marca_de_agua_arreglo, promedios_bloques,
+                              tabla_brillo, tabla_capa_rgb, tono_gris)
+
+# Número de filas de cada banda por omisión
+FILAS_BANDA = 256
+
+
+def _encabezado_ppm(archivo):
+    ''' Función que lee el encabezado de un archivo PPM binario (P6) de 8
+        bits. Regresa una tupla (ancho, alto, posición de los datos)
+
+        archivo: file. Archivo abierto en modo binario'''
+
+    campos = []
+
+    while len(campos) < 4:
+        linea = archivo.readline()
+
+        if not linea:
+            raise ValueError("El archivo PPM está incompleto!")
+
+        campos.extend(linea.split(b'#')[0].split())
+
+    if campos[0] != b'P6' or int(campos[3]) != 255:
+        raise ValueError("Solo se pueden leer archivos PPM P6 de 8 bits!")
+
+    return int(campos[1]), int(campos[2]), archivo.tell()
+
+
+def abrir_bandas(ruta):
+    ''' Función que regresa la imagen como arreglo (alto, ancho, canales)
+        mapeado en memoria, del que se pueden leer bandas de filas
+
+        ruta: str. Ruta de la imagen'''
+
+    extension = os.path.splitext(ruta)[1].lower()
+
+    if extension == '.npy':
+        arreglo = np.load(ruta, mmap_mode='r')
+    elif extension == '.ppm':
+        with open(ruta, 'rb') as archivo:
+            ancho, alto, inicio = _encabezado_ppm(archivo)
+
+        arreglo = np.memmap(ruta, dtype=np.uint8, mode='r', offset=inicio, shape=(alto, ancho, 3))
+    else:
+        with Image.open(ruta) as img_pil:
+            arreglo = decodificar_mapeado(img_pil)
+
+    if arreglo.ndim != 3 or arreglo.shape[2] < 3 or arreglo.dtype != np.uint8:
+        raise ValueError("La imagen debe tener al menos 3 canales de 8 bits!")
+
+    return arreglo
+
+
+def _filas_ciclicas(arreglo, ini, fin):
+    ''' Función que lee las filas de ini a fin del arreglo, tomando las
+        filas fuera de la imagen del otro extremo
+
+        arreglo: ndarray. Arreglo de la imagen
+        ini: int. Primera fila, puede ser negativa
+        fin: int. Fila final (no incluida), puede pasar del alto'''
+
+    alto = arreglo.shape[0]
+
+    if 0 <= ini and fin <= alto:
+        return np.asarray(arreglo[ini:fin])
+
+    return np.asarray(arreglo[np.arange(ini, fin) % alto])
+
+
+class _EscritorArreglo:
+    ''' Destino que escribe las bandas en un arreglo, normalmente mapeado
+        en memoria'''
+
+    def __init__(self, arreglo):
+        self.arreglo = arreglo
+
+    def escribir(self, ini, banda):
+        self.arreglo[ini:ini + len(banda)] = banda
+
+    def cerrar(self):
+        if isinstance(self.arreglo, np.memmap):
+            self.arreglo.flush()
+
+
+class _EscritorPPM:
+    ''' Destino que escribe las bandas en orden en un archivo PPM (P6). Se
+        descarta el canal alfa'''
+
+    def __init__(self, ruta, forma):
+        self.archivo = open(ruta, 'wb')
+        self.archivo.write(b'P6\n%d %d\n255\n' % (forma[1], forma[0]))
+
+    def escribir(self, ini, banda):
+        self.archivo.write(np.ascontiguousarray(banda[:, :, :3]).tobytes())
+
+    def cerrar(self):
+        self.archivo.close()
+
+
+class _EscritorPIL(_EscritorArreglo):
+    ''' Destino que junta las bandas en un arreglo mapeado en memoria y lo
+        guarda con PIL al cerrarlo, en el formato de la extensión'''
+
+    def __init__(self, ruta, forma):
+        _EscritorArreglo.__init__(self, arreglo_mapeado(forma))
+        self.ruta = ruta
+
+    def cerrar(self):
+        Image.fromarray(np.asarray(self.arreglo)).save(self.ruta, quality=95)
+
+
+def _escritor(ruta, forma):
+    ''' Función que regresa el destino adecuado a la extensión de la ruta
+
+        ruta: str. Ruta de la imagen de salida
+        forma: tuple. Forma (alto, ancho, canales) de la imagen'''
+
+    extension = os.path.splitext(ruta)[1].lower()
+
+    if extension == '.npy':
+        return _EscritorArreglo(np.lib.format.open_memmap(ruta, mode='w+', dtype=np.uint8, shape=forma))
+    elif extension == '.ppm':
+        return _EscritorPPM(ruta, forma)
+
+    return _EscritorPIL(ruta, forma)
+
+
+def aplicar_etapa(origen, destino, etapa, filas = FILAS_BANDA):
+    ''' Función que aplica una etapa a toda la imagen banda por banda.
+
+        Una etapa es una tupla (funcion, arriba, abajo, multiplo): la banda
+        que recibe funcion(banda, fila_ini, alto) trae arriba filas extra
+        antes y abajo filas extra después, y funcion regresa los nuevos
+        valores rgb de las filas sin las extra, como arreglo (filas, ancho)
+        o (filas, ancho, 3). Las bandas empiezan en múltiplos de multiplo.
+        El canal alfa se copia sin cambios
+
+        origen: ndarray. Arreglo (alto, ancho, canales) de la imagen
+        destino: object. Destino de las bandas (escribir y cerrar)
+        etapa: tuple. Etapa a aplicar
+        filas: int. Número aproximado de filas de cada banda'''
+
+    alto = origen.shape[0]
+    funcion, arriba, abajo, multiplo = etapa
+    paso = max(multiplo, filas // multiplo * multiplo)
+
+    for ini in range(0, alto, paso):
+        fin = min(alto, ini + paso)
+        banda = _filas_ciclicas(origen, ini - arriba, fin + abajo)
+
+        valor = funcion(banda, ini, alto)
+        salida = np.array(banda[arriba:arriba + fin - ini])
+        salida[:, :, :3] = valor if valor.ndim == 3 else valor[:, :, None]
+
+        destino.escribir(ini, salida)
+
+    destino.cerrar()
+
+
+def _etapa_tono(calcula):
+    ''' Función que regresa la etapa de un filtro que solo depende del pixel
+
+        calcula: function. Función (banda) -> nuevos valores rgb'''
+
+    return (lambda banda, ini, alto: calcula(banda), 0, 0, 1)
+
+
+class FlujoBandas:
+    ''' Clase que aplica filtros de PDI por bandas de filas.
+
+        Tiene los mismos métodos que PDI para los filtros que se pueden
+        aplicar por bandas, así que se puede usar en lugar de un PDI en
+        aplica_cadena de trent_lote. Los filtros se van guardando y se
+        aplican uno tras otro al llamar a guardar; los resultados
+        intermedios se escriben en archivos temporales mapeados en memoria.
+        Los filtros por pixel seguidos se juntan en una sola etapa
+
+        ruta: str. Ruta de la imagen
+        filas: int. Número aproximado de filas de cada banda'''
+
+    def __init__(self, ruta, filas = FILAS_BANDA):
+        if filas < 1:
+            raise ValueError("Las bandas deben tener al menos una fila!")
+
+        self.origen = abrir_bandas(ruta)
+        self.filas = filas
+        self.hilos = 1
+        self.etapas = []
+        self.puntual = None  # (índice de la etapa, OperacionesPunto) de la última etapa por pixel
+
+    def set_hilos(self, num_hilos):
+        ''' Función que cambia el número de hilos de la convolución y la
+            erosión de cada banda
+
+            num_hilos: int. Número de hilos, al menos 1'''
+
+        if num_hilos < 1:
+            raise ValueError("El número de hilos debe ser al menos 1!")
+
+        self.hilos = num_hilos
+
+    def get_tamanio(self):
+        ''' Función que regresa el tamanio de la imagen original'''
+        return (self.origen.shape[1], self.origen.shape[0])
+
+    def fijar_filtro(self):
+        ''' Cada filtro ya se aplica sobre el resultado del anterior'''
+        pass
+
+    def __operaciones(self):
+        ''' Función que regresa las operaciones por pixel de la última etapa,
+            agregando una etapa nueva si la última no es por pixel'''
+
+        if self.puntual is None or self.puntual[0] != len(self.etapas) - 1:
+            self.aplicar_operaciones(OperacionesPunto())
+
+        return self.puntual[1]
+
+    def aplicar_operaciones(self, operaciones, br = False, img = True):
+        self.etapas.append(_etapa_tono(lambda banda: aplicar_operaciones(banda, operaciones, None, self.hilos)))
+        self.puntual = (len(self.etapas) - 1, operaciones)
+
+    def gris(self, tono, br = False):
+        self.__operaciones().gris(tono)
+
+    def modificar_brillo(self, cons, br = False, img = True):
+        self.__operaciones().lut(tabla_brillo(cons))
+
+    def capa_rgb(self, new_r, new_g, new_b, br = False, img = True):
+        self.__operaciones().lut(tabla_capa_rgb(new_r, new_g, new_b))
+
+    def alto_contraste(self, br = False):
+        self.__operaciones().umbral(False)
+
+    def inverso(self, br = False):
+        self.__operaciones().umbral(True)
+
+    def mosaico(self, num_columnas, num_filas):
+        def calcula(banda, ini, alto):
+            promedios = promedios_bloques(banda, num_columnas, num_filas).astype(np.uint8)
+            bloques = np.repeat(np.repeat(promedios, num_filas, axis=0), num_columnas, axis=1)
+            return bloques[:banda.shape[0], :banda.shape[1]]
+
+        self.etapas.append((calcula, 0, 0, num_filas))
+
+    def filtros_convolucion(self, filtro):
+        if filtro not in FILTROS_CONVOLUCION:
+            raise ValueError("Ese filtro de convolucion no existe!")
+
+        matriz, factor, brillo = FILTROS_CONVOLUCION[filtro]
+        n = matriz.shape[0]
+        arriba = (n + 1) // 2
+        abajo = n - 1 - arriba
+
+        def calcula(banda, ini, alto):
+            return convolucion(banda, matriz, factor, brillo, self.hilos)[arriba:len(banda) - abajo]
+
+        self.etapas.append((calcula, arriba, abajo, 1))
+
+    def erosion(self, maxmin):
+        def calcula(banda, ini, alto):
+            return erosion(banda, maxmin, self.hilos)[2:]
+
+        self.etapas.append((calcula, 2, 0, 1))
+
+    def dit_ord_disp(self, tipo):
+        matriz = MATRIZ_ORDENADO if tipo else MATRIZ_DISPERSO
+        self.etapas.append((lambda banda, ini, alto: dither_ordenado(banda[:, :, 0], matriz, ini, alto, self.hilos),
+                            0, 0, 1))
+
+    def dit_bayer(self, orden):
+        self.etapas.append((lambda banda, ini, alto: dither_bayer(tono_gris(banda, 3), orden, ini, self.hilos),
+                            0, 0, 1))
+
+    def marca_de_agua(self, texto, estilo, x, y):
+        def calcula(banda, ini, alto):
+            salida = np.array(banda[:, :, :3])
+            marca_de_agua_arreglo(salida, texto, estilo, x, y - ini)
+            return salida
+
+        self.etapas.append((calcula, 0, 0, 1))
+
+    def guardar(self, ruta):
+        ''' Función que aplica los filtros y guarda el resultado en la ruta,
+            en el formato de su extensión (.ppm y .npy se escriben por
+            bandas). Regresa True
+
+            ruta: str. Ruta donde se va a guardar la imagen'''
+
+        actual = self.origen
+
+        for i, etapa in enumerate(self.etapas):
+            if i == len(self.etapas) - 1:
+                aplicar_etapa(actual, _escritor(ruta, actual.shape), etapa, self.filas)
+                return True
+
+            siguiente = arreglo_mapeado(actual.shape)
+            aplicar_etapa(actual, _EscritorArreglo(siguiente), etapa, self.filas)
+            actual = siguiente
+
+        # Sin filtros solo se copia la imagen
+        aplicar_etapa(actual, _escritor(ruta, actual.shape), _etapa_tono(lambda banda: banda[:, :, :3]), self.filas)
+        return True
+
+
+def _no_por_bandas(nombre):
+    def metodo(self, *args):
+        raise ValueError("El filtro '%s' no se puede aplicar por bandas!" % nombre)
+
+    return metodo
+
+
+for _nombre in ('filtros_letras', 'aplica_img_recursiva', 'semitono', 'fotomosaico', 'dit_azar',
+                'dit_difusion', 'morfologia'):
+    setattr(FlujoBandas, _nombre, _no_por_bandas(_nombre))
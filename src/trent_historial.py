@@ -0,0 +1,289 @@
+''' Historial no destructivo de filtros de TRENT. Guarda la lista de filtros
+    aplicados a una imagen y el resultado de cada uno, para que cambiar un
+    filtro solo vuelva a calcular los que siguen y deshacer o rehacer no
+    tenga que aplicar nada.
+
+    Opcionalmente los filtros se aplican a una vista previa reducida y a la
+    imagen completa solo cuando se va a guardar.
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+
+from trent_procesador import PDI, abrir_biblioteca
+
+# Memoria por omisión para los resultados guardados, en bytes
+MEMORIA_HISTORIAL = 512 * 2 ** 20
+
+
+def _escala_tamanio(valor, escala):
+    return max(1, int(round(valor * escala)))
+
+
+def _escala_mosaico(escala, num_columnas, num_filas):
+    return (_escala_tamanio(num_columnas, escala), _escala_tamanio(num_filas, escala))
+
+
+def _escala_fotomosaico(escala, biblioteca, num_columnas, num_filas, ancho = 0, alto = 0):
+    # Las imágenes también se reducen para que la vista no mida lo mismo que el resultado completo
+    if not ancho or not alto:
+        indice = abrir_biblioteca(biblioteca)
+        ancho, alto = ancho or indice.ancho, alto or indice.alto
+
+    return ((biblioteca,) + _escala_mosaico(escala, num_columnas, num_filas)
+            + _escala_mosaico(escala, ancho, alto))
+
+
+def _escala_puntos(escala, tipo, ancho, alto, num_columnas, num_filas):
+    # Los puntos se reducen junto con las celdas para conservar la proporción de la imagen completa
+    return (tipo,) + _escala_mosaico(escala, ancho, alto) + _escala_mosaico(escala, num_columnas, num_filas)
+
+
+def _escala_filtros_letras(escala, num_columnas, num_filas, opcion, txt = None, escala_fuente = 1.0):
+    return _escala_mosaico(escala, num_columnas, num_filas) + (opcion, txt, escala_fuente * escala)
+
+
+def _escala_marca_de_agua(escala, texto, estilo, x, y):
+    estilo = (estilo[0], _escala_tamanio(estilo[1], escala)) + tuple(estilo[2:])
+    return (texto, estilo, int(round(x * escala)), int(round(y * escala)))
+
+
+def _escala_morfologia(escala, operacion, forma, alto, ancho = 0, ciclico = True):
+    ancho = ancho or alto
+    return (operacion, forma, _escala_tamanio(alto, escala), _escala_tamanio(ancho, escala), ciclico)
+
+
+# Filtros con argumentos en pixeles de la imagen completa que se ajustan al
+# aplicarlos a la vista previa: nombre -> funcion(escala, *argumentos)
+ESCALA_ARGUMENTOS = {
+    'mosaico': _escala_mosaico,
+    'fotomosaico': _escala_fotomosaico,
+    'semitono': _escala_puntos,
+    'aplica_img_recursiva': _escala_puntos,
+    'filtros_letras': _escala_filtros_letras,
+    'marca_de_agua': _escala_marca_de_agua,
+    'morfologia': _escala_morfologia,
+}
+
+
+class Historial:
+    ''' Clase que lleva la pila de filtros aplicados a un PDI.
+
+        Cada paso es el nombre de un método del PDI con sus argumentos. El
+        resultado de cada paso se guarda con una clave que depende de todos
+        los pasos anteriores, así que un resultado sigue siendo válido
+        mientras no cambie nada antes de él. Cuando los resultados ocupan
+        más de la memoria indicada se descartan los usados hace más tiempo
+        y se recalculan a partir del resultado guardado más cercano.
+
+        Con vista, los pasos se aplican a una copia reducida de la imagen
+        (pdi_vista) y a la imagen completa solo al llamar a completa(). Los
+        argumentos siempre se dan en pixeles de la imagen completa.
+
+        pdi: PDI. Imagen sobre la que se aplican los filtros
+        memoria: int. Bytes máximos para los resultados guardados
+        vista: tuple. (ancho, alto) máximo de la vista previa, None para
+               aplicar los filtros siempre a la imagen completa'''
+
+    def __init__(self, pdi, memoria = MEMORIA_HISTORIAL, vista = None):
+        self.pdi = pdi
+        self.memoria = memoria
+        self.usada = 0
+        self.escala = 1.0
+        self.pdi_vista = pdi  # PDI que se muestra en la interfaz
+
+        if vista is not None:
+            ancho, alto = pdi.get_tamanio()
+            self.escala = min(1.0, vista[0] / ancho, vista[1] / alto)
+
+            if self.escala < 1.0:
+                self.pdi_vista = PDI(pdi.get_vista(_escala_tamanio(ancho, self.escala),
+                                                   _escala_tamanio(alto, self.escala)))
+
+        self.original = pdi.get_arreglo('o')
+        self.original.flags.writeable = False
+        self.original_vista = self.pdi_vista.get_arreglo('o')
+        self.original_vista.flags.writeable = False
+        self.pasos = []       # Lista de tuplas (nombre, argumentos)
+        self.claves = []      # Clave del resultado de cada paso
+        self.actual = 0       # Número de pasos activos, los demás se pueden rehacer
+        self.resultados = OrderedDict()  # clave -> arreglo, del menos al más usado
+
+    def __len__(self):
+        return self.actual
+
+    def __clave(self, indice):
+        ''' Función que regresa la clave del resultado del paso anterior
+            al indicado, () para la imagen original
+
+            indice: int. Índice del paso'''
+
+        return self.claves[indice - 1] if indice > 0 else ()
+
+    def __tiene_vista(self):
+        return self.pdi_vista is not self.pdi
+
+    def __guardar(self, clave, arreglo):
+        ''' Función que guarda el resultado de un paso y descarta los menos
+            usados hasta que quepa en la memoria
+
+            clave: tuple. Clave del resultado
+            arreglo: ndarray. Resultado del paso'''
+
+        if arreglo.nbytes > self.memoria:
+            return
+
+        arreglo.flags.writeable = False
+        self.resultados[clave] = arreglo
+        self.usada += arreglo.nbytes
+
+        while self.usada > self.memoria:
+            _, descartado = self.resultados.popitem(last = False)
+            self.usada -= descartado.nbytes
+
+    def __resultado(self, num_pasos, completa = False):
+        ''' Función que regresa la imagen después de los primeros num_pasos
+            pasos, calculando solo los que no estén guardados
+
+            num_pasos: int. Número de pasos a aplicar
+            completa: bool. Valor que indica si aplicarlos a la imagen
+                      completa o a la vista previa'''
+
+        vista = self.__tiene_vista() and not completa
+        pdi = self.pdi_vista if vista else self.pdi
+        claves = [(vista, clave) for clave in self.claves[:num_pasos]]
+        inicio = num_pasos
+
+        while inicio > 0 and claves[inicio - 1] not in self.resultados:
+            inicio -= 1
+
+        if inicio == 0:
+            arreglo = self.original_vista if vista else self.original
+        else:
+            arreglo = self.resultados[claves[inicio - 1]]
+            self.resultados.move_to_end(claves[inicio - 1])
+
+        for i in range(inicio, num_pasos):
+            nombre, argumentos = self.pasos[i]
+
+            if vista and nombre in ESCALA_ARGUMENTOS:
+                argumentos = ESCALA_ARGUMENTOS[nombre](self.escala, *argumentos)
+
+            pdi.set_arreglo(arreglo)
+            getattr(pdi, nombre)(*argumentos)
+
+            arreglo = pdi.get_arreglo('m')
+            self.__guardar(claves[i], arreglo)
+
+        return arreglo
+
+    def __mostrar(self, num_pasos):
+        ''' Función que calcula el resultado de los primeros num_pasos pasos,
+            lo carga en pdi_vista y lo toma como estado actual
+
+            num_pasos: int. Número de pasos activos'''
+
+        arreglo = self.__resultado(num_pasos)
+
+        self.pdi_vista.set_arreglo(arreglo)
+        self.actual = num_pasos
+
+        return arreglo
+
+    def __recalcular_claves(self, indice):
+        ''' Función que actualiza las claves de los pasos a partir del indicado
+
+            indice: int. Índice del primer paso que cambió'''
+
+        del self.claves[indice:]
+
+        for i in range(indice, len(self.pasos)):
+            self.claves.append((self.__clave(i), self.pasos[i]))
+
+    def agregar(self, nombre, *argumentos):
+        ''' Función que aplica un filtro sobre el estado actual. Los pasos
+            que se podían rehacer se descartan. Si el filtro falla o se
+            cancela el historial queda como estaba
+
+            nombre: str. Nombre del método del PDI
+            argumentos: tuple. Argumentos del método'''
+
+        paso = (nombre, tuple(argumentos))
+        pasos, claves = self.pasos, self.claves
+
+        self.pasos = pasos[:self.actual] + [paso]
+        self.claves = claves[:self.actual] + [(self.__clave(self.actual), paso)]
+
+        try:
+            return self.__mostrar(len(self.pasos))
+        except BaseException:
+            self.pasos, self.claves = pasos, claves
+            self.pdi_vista.set_arreglo(self.__resultado(self.actual))
+            raise
+
+    def modificar(self, indice, *argumentos):
+        ''' Función que cambia los argumentos de un paso. Solo se recalculan
+            ese paso y los siguientes que estén activos
+
+            indice: int. Índice del paso a cambiar
+            argumentos: tuple. Nuevos argumentos del método'''
+
+        if not 0 <= indice < len(self.pasos):
+            raise IndexError("Ese paso no existe!")
+
+        pasos, claves = list(self.pasos), list(self.claves)
+
+        self.pasos[indice] = (self.pasos[indice][0], tuple(argumentos))
+        self.__recalcular_claves(indice)
+
+        try:
+            return self.__mostrar(self.actual)
+        except BaseException:
+            self.pasos, self.claves = pasos, claves
+            self.pdi_vista.set_arreglo(self.__resultado(self.actual))
+            raise
+
+    def deshacer(self):
+        ''' Función que quita el último paso activo. Regresa False si no
+            hay pasos que deshacer'''
+
+        if self.actual == 0:
+            return False
+
+        self.__mostrar(self.actual - 1)
+        return True
+
+    def rehacer(self):
+        ''' Función que vuelve a activar el último paso deshecho. Regresa
+            False si no hay pasos que rehacer'''
+
+        if self.actual == len(self.pasos):
+            return False
+
+        self.__mostrar(self.actual + 1)
+        return True
+
+    def completa(self):
+        ''' Función que aplica los pasos activos a la imagen completa y carga
+            el resultado en pdi, por ejemplo para guardarla'''
+
+        if self.__tiene_vista():
+            self.pdi.set_arreglo(self.__resultado(self.actual, True))
+
+        return self.pdi
+
+    def get_pasos(self):
+        ''' Función que regresa la lista de pasos activos'''
+        return self.pasos[:self.actual]
+
+    def limpiar(self):
+        ''' Función que descarta todos los pasos y resultados guardados'''
+
+        self.pasos = []
+        self.claves = []
+        self.actual = 0
+        self.resultados.clear()
+        self.usada = 0
+        self.pdi.set_arreglo(self.original)
+        self.pdi_vista.set_arreglo(self.original_vista)
@@ -0,0 +1,394 @@
+''' Modo por lotes de TRENT. Aplica una cadena de filtros a todas las imágenes
+    de un directorio sin abrir la interfaz gráfica.
+
+    Ejemplo:
+
+        python trent_lote.py fotos/ salida/ "gris:3 | filtros_convolucion:Sharpen | mosaico:8x8"
+'''
+
+import os
+import re
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from trent_procesador import (TAMANIO_CACHE, PDI, OperacionesPunto, activar_perfil, estadisticas_cache, extraer_perfil,
+                              guardar_perfil, resumen_perfil, tabla_brillo, tabla_capa_rgb, usar_cache)
+from trent_flujo import FlujoBandas
+
+EXTENSIONES = ('.png', '.jpg', '.jpeg')
+# Por bandas también se pueden leer imágenes ppm y arreglos npy sin cargarlos completos
+EXTENSIONES_BANDAS = EXTENSIONES + ('.ppm', '.npy')
+
+
+def _paso_gris(pdi, tono):
+    pdi.gris(int(tono), False)
+
+
+def _paso_brillo(pdi, cons):
+    pdi.modificar_brillo(int(cons), False, True)
+
+
+def _paso_mosaico(pdi, num_columnas, num_filas):
+    pdi.mosaico(int(num_columnas), int(num_filas))
+
+
+def _paso_alto_contraste(pdi):
+    pdi.alto_contraste(False)
+
+
+def _paso_inverso(pdi):
+    pdi.inverso(False)
+
+
+def _paso_capa_rgb(pdi, r, g, b):
+    pdi.capa_rgb(int(r), int(g), int(b), False, True)
+
+
+def _paso_convolucion(pdi, filtro):
+    pdi.filtros_convolucion(filtro)
+
+
+def _paso_letras(pdi, num_columnas, num_filas, opcion, texto = None):
+    pdi.filtros_letras(int(num_columnas), int(num_filas), opcion, texto)
+
+
+def _paso_marca_de_agua(pdi, texto, fuente, tamanio, opacidad, x, y):
+    pdi.marca_de_agua(texto, (fuente, int(tamanio), float(opacidad)), int(x), int(y))
+
+
+def _paso_img_recursiva(pdi, tipo, ancho, alto, num_columnas, num_filas):
+    pdi.aplica_img_recursiva(tipo == 'gris', int(ancho), int(alto), int(num_columnas), int(num_filas))
+
+
+def _paso_fotomosaico(pdi, biblioteca, num_columnas, num_filas):
+    pdi.fotomosaico(biblioteca, int(num_columnas), int(num_filas))
+
+
+def _paso_semitono(pdi, bib, ancho, alto, num_columnas, num_filas):
+    pdi.semitono(int(bib), int(ancho), int(alto), int(num_columnas), int(num_filas))
+
+
+def _paso_erosion(pdi, tipo):
+    pdi.erosion(tipo == 'maximo')
+
+
+def _paso_morfologia(pdi, operacion, forma, alto, ancho = 0, borde = 'ciclico'):
+    pdi.morfologia(operacion, forma, int(alto), int(ancho), borde == 'ciclico')
+
+
+def _paso_dithering(pdi, tipo):
+    pdi.dit_ord_disp(tipo == 'ordenado')
+
+
+def _paso_dithering_azar(pdi, semilla = None):
+    pdi.dit_azar(None if semilla is None else int(semilla))
+
+
+def _paso_bayer(pdi, orden):
+    pdi.dit_bayer(int(orden))
+
+
+def _paso_difusion(pdi, metodo = 'floyd-steinberg'):
+    pdi.dit_difusion(metodo)
+
+
+def _punto_gris(operaciones, tono):
+    operaciones.gris(int(tono))
+
+
+def _punto_brillo(operaciones, cons):
+    operaciones.lut(tabla_brillo(int(cons)))
+
+
+def _punto_alto_contraste(operaciones):
+    operaciones.umbral(False)
+
+
+def _punto_inverso(operaciones):
+    operaciones.umbral(True)
+
+
+def _punto_capa_rgb(operaciones, r, g, b):
+    operaciones.lut(tabla_capa_rgb(int(r), int(g), int(b)))
+
+
+# Filtros que solo dependen del pixel; los que van seguidos en la cadena se
+# aplican juntos en una sola pasada: nombre -> funcion(operaciones, *argumentos)
+PASOS_PUNTO = {
+    'gris': _punto_gris,
+    'modificar_brillo': _punto_brillo,
+    'alto_contraste': _punto_alto_contraste,
+    'inverso': _punto_inverso,
+    'capa_rgb': _punto_capa_rgb,
+}
+
+
+# Filtros que se pueden usar en la cadena: nombre -> funcion(pdi, *argumentos)
+PASOS = {
+    'gris': _paso_gris,
+    'modificar_brillo': _paso_brillo,
+    'mosaico': _paso_mosaico,
+    'alto_contraste': _paso_alto_contraste,
+    'inverso': _paso_inverso,
+    'capa_rgb': _paso_capa_rgb,
+    'filtros_convolucion': _paso_convolucion,
+    'filtros_letras': _paso_letras,
+    'marca_de_agua': _paso_marca_de_agua,
+    'aplica_img_recursiva': _paso_img_recursiva,
+    'semitono': _paso_semitono,
+    'fotomosaico': _paso_fotomosaico,
+    'erosion': _paso_erosion,
+    'morfologia': _paso_morfologia,
+    'dit_ord_disp': _paso_dithering,
+    'dit_azar': _paso_dithering_azar,
+    'dit_bayer': _paso_bayer,
+    'dit_difusion': _paso_difusion,
+}
+
+
+def parsea_cadena(cadena):
+    ''' Función que convierte la descripción de la cadena de filtros en una
+        lista de tuplas (nombre, argumentos).
+
+        Los filtros se separan con '|' y los argumentos con ',' después de ':'.
+        Un argumento de la forma NxM se toma como dos argumentos, así que
+        'mosaico:8x8' equivale a 'mosaico:8,8'
+
+        cadena: str. Descripción de la cadena, p. ej. "gris:3 | mosaico:8x8"'''
+
+    pasos = []
+
+    for texto in cadena.split('|'):
+        texto = texto.strip()
+
+        if texto == '':
+            continue
+
+        nombre, _, args = texto.partition(':')
+        nombre = nombre.strip()
+
+        if nombre not in PASOS:
+            raise ValueError("El filtro '%s' no existe!" % nombre)
+
+        argumentos = []
+
+        for arg in args.split(',') if args.strip() else []:
+            arg = arg.strip()
+
+            if re.fullmatch(r'\d+x\d+', arg):
+                argumentos.extend(arg.split('x'))
+            else:
+                argumentos.append(arg)
+
+        pasos.append((nombre, tuple(argumentos)))
+
+    return pasos
+
+
+def aplica_cadena(pdi, pasos):
+    ''' Función que aplica los filtros de la cadena uno tras otro, tomando
+        el resultado de cada uno como la imagen original del siguiente. Los
+        filtros por pixel seguidos se aplican juntos en una sola pasada
+
+        pdi: PDI. Imagen a modificar
+        pasos: list. Lista de tuplas (nombre, argumentos) de parsea_cadena'''
+
+    i = 0
+
+    while i < len(pasos):
+        nombre, argumentos = pasos[i]
+
+        if nombre in PASOS_PUNTO:
+            operaciones = OperacionesPunto()
+
+            while i < len(pasos) and pasos[i][0] in PASOS_PUNTO:
+                PASOS_PUNTO[pasos[i][0]](operaciones, *pasos[i][1])
+                i += 1
+
+            pdi.aplicar_operaciones(operaciones)
+        else:
+            PASOS[nombre](pdi, *argumentos)
+            i += 1
+
+        pdi.fijar_filtro()
+
+
+def busca_imagenes(entrada, recursivo = False, extensiones = EXTENSIONES):
+    ''' Función que regresa las rutas de las imágenes de la entrada, junto
+        con su ruta relativa a la entrada
+
+        entrada: str. Archivo o directorio de imágenes
+        recursivo: bool. Valor que indica si buscar en los subdirectorios
+        extensiones: tuple. Extensiones de las imágenes a buscar'''
+
+    if os.path.isfile(entrada):
+        return [(entrada, os.path.basename(entrada))]
+
+    imagenes = []
+
+    for raiz, dirs, archivos in os.walk(entrada):
+        dirs.sort()
+
+        for archivo in sorted(archivos):
+            if archivo.lower().endswith(extensiones):
+                ruta = os.path.join(raiz, archivo)
+                imagenes.append((ruta, os.path.relpath(ruta, entrada)))
+
+        if not recursivo:
+            break
+
+    return imagenes
+
+
+def procesa_imagen(ruta, salida, pasos, hilos = 1, mapear = False, bandas = None):
+    ''' Función que aplica la cadena de filtros a una imagen y la guarda en
+        su mismo formato. Regresa una tupla (ruta, pixeles, segundos, error,
+        proceso), con proceso una tupla (id del proceso, estadísticas de la
+        cache de resultados del proceso, eventos del perfil de la imagen)
+
+        ruta: str. Ruta de la imagen
+        salida: str. Ruta donde se guarda la imagen modificada
+        pasos: list. Lista de tuplas (nombre, argumentos) de parsea_cadena
+        hilos: int. Número de hilos de cada PDI
+        mapear: bool. Valor que indica si mapear la imagen a un archivo temporal
+        bandas: int. Filas de cada banda para procesar la imagen por bandas
+                con FlujoBandas, None para cargarla completa en un PDI'''
+
+    inicio = time.perf_counter()
+
+    try:
+        pdi = FlujoBandas(ruta, bandas) if bandas else PDI(ruta, mapear=mapear)
+        pdi.set_hilos(hilos)
+        ancho, alto = pdi.get_tamanio()
+
+        aplica_cadena(pdi, pasos)
+
+        os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+
+        if not pdi.guardar(salida):
+            raise ValueError('No se pudo guardar en el formato de la imagen original')
+
+    except Exception as e:
+        return (ruta, 0, time.perf_counter() - inicio, '%s: %s' % (type(e).__name__, e),
+                (os.getpid(), estadisticas_cache(), extraer_perfil()))
+
+    return ruta, ancho * alto, time.perf_counter() - inicio, None, (os.getpid(), estadisticas_cache(), extraer_perfil())
+
+
+def _inicia_proceso(cache, tamanio_cache, perfil, memoria):
+    usar_cache(cache, tamanio_cache)
+
+    if perfil:
+        activar_perfil(memoria)
+
+
+def imprime_cache(caches):
+    ''' Función que imprime las estadísticas de la cache de resultados
+        sumadas de todos los procesos
+
+        caches: dict. Id del proceso -> estadísticas de su cache'''
+
+    total = {}
+
+    for estadisticas in caches.values():
+        for campo in ('aciertos', 'fallos', 'escrituras', 'expulsados'):
+            total[campo] = total.get(campo, 0) + estadisticas[campo]
+
+    consultas = total['aciertos'] + total['fallos']
+
+    print('cache: %d aciertos, %d fallos (%.0f%%), %d resultados guardados y %d sacados'
+          % (total['aciertos'], total['fallos'], 100.0 * total['aciertos'] / max(consultas, 1),
+             total['escrituras'], total['expulsados']))
+
+
+def imprime_perfil(eventos, num_etapas = 10):
+    ''' Función que imprime las etapas en las que se fue más tiempo
+
+        eventos: list. Eventos del perfil de todos los procesos
+        num_etapas: int. Número de etapas a imprimir'''
+
+    for nombre, llamadas, segundos, pixeles in resumen_perfil(eventos)[:num_etapas]:
+        print('perfil: %-28s %6d llamadas %9.3f s%s'
+              % (nombre, llamadas, segundos, '  %.2f MP/s' % (pixeles / 1e6 / segundos) if pixeles and segundos else ''))
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Aplica una cadena de filtros de TRENT a un lote de imágenes.')
+    parser.add_argument('entrada', help='imagen o directorio con imágenes jpg/png')
+    parser.add_argument('salida', help='directorio donde se guardan las imágenes modificadas')
+    parser.add_argument('cadena', help='filtros separados por "|", p. ej. "gris:3 | mosaico:8x8"')
+    parser.add_argument('-p', '--procesos', type=int, default=os.cpu_count() or 1,
+                        help='número de procesos (por omisión, uno por núcleo)')
+    parser.add_argument('--hilos', type=int, default=1,
+                        help='hilos de cada proceso para convolución y erosión')
+    parser.add_argument('-r', '--recursivo', action='store_true', help='busca también en los subdirectorios')
+    parser.add_argument('--mapear', action='store_true',
+                        help='decodifica cada imagen a un archivo temporal mapeado en memoria (imágenes muy grandes)')
+    parser.add_argument('--bandas', type=int, metavar='FILAS',
+                        help='procesa cada imagen por bandas de FILAS filas (imágenes más grandes que la memoria)')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='guarda los resultados de los filtros en DIR y los reutiliza en otras ejecuciones')
+    parser.add_argument('--cache-mb', type=int, default=TAMANIO_CACHE // 2 ** 20, metavar='MB',
+                        help='tamaño máximo de la cache (por omisión, %(default)s MB)')
+    parser.add_argument('--perfil', metavar='ARCHIVO',
+                        help='mide cada etapa de los filtros y la guarda como traza de Chrome (.json) '
+                             'o un evento por línea (.jsonl)')
+    parser.add_argument('--perfil-memoria', action='store_true', help='con --perfil, mide también la memoria')
+    args = parser.parse_args(argv)
+
+    try:
+        pasos = parsea_cadena(args.cadena)
+    except ValueError as e:
+        parser.error(str(e))
+
+    imagenes = busca_imagenes(args.entrada, args.recursivo, EXTENSIONES_BANDAS if args.bandas else EXTENSIONES)
+
+    if not imagenes:
+        parser.error('No se encontraron imágenes en %s' % args.entrada)
+
+    inicio = time.perf_counter()
+    total_pixeles = 0
+    errores = 0
+    caches = {}
+    eventos = []
+
+    with ProcessPoolExecutor(max_workers=max(1, args.procesos), initializer=_inicia_proceso,
+                             initargs=(args.cache, args.cache_mb * 2 ** 20, args.perfil, args.perfil_memoria)) as ejecutor:
+        tareas = [ejecutor.submit(procesa_imagen, ruta, os.path.join(args.salida, relativa), pasos,
+                                  args.hilos, args.mapear, args.bandas)
+                  for ruta, relativa in imagenes]
+
+        for tarea in tareas:
+            ruta, pixeles, segundos, error, (proceso, estadisticas, perfil) = tarea.result()
+
+            if estadisticas is not None:
+                caches[proceso] = estadisticas
+
+            eventos.extend(perfil)
+
+            if error is None:
+                total_pixeles += pixeles
+                print('%s\t%.3f s\t%.2f MP/s' % (ruta, segundos, pixeles / 1e6 / max(segundos, 1e-9)))
+            else:
+                errores += 1
+                print('%s\tERROR\t%s' % (ruta, error), file=sys.stderr)
+
+    total = time.perf_counter() - inicio
+
+    print('%d imágenes (%d con error) en %.3f s: %.2f img/s, %.2f MP/s'
+          % (len(imagenes), errores, total, (len(imagenes) - errores) / total, total_pixeles / 1e6 / total))
+
+    if caches:
+        imprime_cache(caches)
+
+    if args.perfil:
+        imprime_perfil(eventos)
+        guardar_perfil(eventos, args.perfil)
+
+    return 1 if errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
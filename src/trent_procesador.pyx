@@ -1,13 +1,2583 @@
 # cython: language_level=3
+cimport cython
 import io
 import sys
+import json
+import os
 import os.path
-from random import randint
+import time
+import hashlib
+import functools
+import tempfile
+import importlib
+import threading
+import tracemalloc
 import numpy as np
-import PySimpleGUI as sg
-from shutil import rmtree
-from PIL import Image,ImageDraw,ImageFont
-from tkinter import Tk,Canvas
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class _ModuloPerezoso:
+    ''' Módulo que se importa hasta que se usa alguno de sus atributos, para
+        que importar trent_procesador (en los procesos trabajadores o sin
+        interfaz) no cargue las dependencias que solo usan algunos filtros
+
+        nombre: str. Nombre completo del módulo'''
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.modulo = None
+
+    def __getattr__(self, atributo):
+        if self.modulo is None:
+            self.modulo = importlib.import_module(self.nombre)
+
+        return getattr(self.modulo, atributo)
+
+
+# PIL solo se necesita para leer, escalar y guardar imágenes y para dibujar texto
+Image = _ModuloPerezoso('PIL.Image')
+ImageDraw = _ModuloPerezoso('PIL.ImageDraw')
+ImageFont = _ModuloPerezoso('PIL.ImageFont')
+
+# Pesos de cada canal para los tonos de gris ponderados
+PESOS_GRIS = {2: (0.3, 0.59, 0.11),
+              3: (0.2126, 0.7152, 0.0722)}
+
+
+def tono_gris(rgb, int tono):
+    ''' Función que calcula en una sola pasada el tono de gris de todos los
+        pixeles del arreglo. Regresa un arreglo (alto, ancho) de tipo uint8
+
+        rgb: ndarray. Arreglo (alto, ancho, 3) con los valores rgb
+        tono: int. Tono de gris seleccionado'''
+
+    r = rgb[:, :, 0]
+    g = rgb[:, :, 1]
+    b = rgb[:, :, 2]
+
+    if tono == 1:
+        return ((r.astype(np.uint16) + g + b) // 3).astype(np.uint8)
+    elif tono in PESOS_GRIS:
+        # Se suman tablas de productos por canal para obtener exactamente los
+        # mismos flotantes que int(r*p_r + g*p_g + b*p_b)
+        tablas = np.arange(256)[:, None] * np.array(PESOS_GRIS[tono])
+        return (tablas[r, 0] + tablas[g, 1] + tablas[b, 2]).astype(np.uint8)
+    elif tono == 4:
+        return ((np.maximum(np.maximum(r, g), b).astype(np.uint16) +
+                 np.minimum(np.minimum(r, g), b)) // 2).astype(np.uint8)
+    elif tono == 5:
+        return np.maximum(np.maximum(r, g), b)
+    elif tono == 6:
+        return np.minimum(np.minimum(r, g), b)
+    elif tono == 7:
+        return r.copy()
+    elif tono == 8:
+        return g.copy()
+    elif tono == 9:
+        return b.copy()
+    else:
+        raise ValueError("Ese tono de gris no existe!")
+
+
+def tabla_brillo(int cons):
+    ''' Función que regresa la tabla de búsqueda de 256 entradas que suma
+        la constante recibida y limita el resultado a [0, 255]
+
+        cons: int. Constante a sumar para modificar el brillo'''
+
+    return np.clip(np.arange(256) + cons, 0, 255).astype(np.uint8)
+
+
+def tabla_capa_rgb(int new_r, int new_g, int new_b):
+    ''' Función que regresa la tabla de búsqueda (3, 256) que aplica el AND
+        de cada canal con el valor recibido
+
+        new_r: int. Valor del color rojo
+        new_g: int. Valor del color verde
+        new_b: int. Valor del color azul'''
+
+    valores = np.arange(256, dtype=np.int64)
+
+    return np.array([valores & new_r,
+                     valores & new_g,
+                     valores & new_b], dtype=np.uint8)
+
+
+def umbral_rgb(rgb, bint inverso):
+    ''' Función que regresa el tono blanco o negro de cada pixel según si
+        los tres canales superan 127. Regresa un arreglo (alto, ancho) uint8
+
+        rgb: ndarray. Arreglo (alto, ancho, 3) con los valores rgb
+        inverso: bint. Valor que indica si se invierten blanco y negro'''
+
+    claro = (rgb[:, :, 0] > 127) & (rgb[:, :, 1] > 127) & (rgb[:, :, 2] > 127)
+
+    if inverso:
+        claro = ~claro
+
+    return claro.astype(np.uint8) * 255
+
+
+# Matrices de umbrales del dithering ordenado y disperso
+MATRIZ_ORDENADO = np.array([[8, 3, 4],
+                            [6, 1, 2],
+                            [7, 5, 9]])
+MATRIZ_DISPERSO = np.array([[1, 7, 4],
+                            [5, 8, 3],
+                            [6, 2, 9]])
+
+
+def fases_bloques(Py_ssize_t tamanio, int lado, Py_ssize_t ini, Py_ssize_t fin):
+    ''' Función que regresa, para cada posición entre ini y fin de un eje
+        de la imagen, el renglón (o columna) de la matriz de umbrales que le
+        toca al recorrer la imagen en bloques de lado x lado desplazados
+        (lado + 1) // 2 pixeles hacia atrás y de forma cíclica. Si dos
+        bloques cubren la misma posición se queda el último
+
+        tamanio: int. Número de pixeles del eje
+        lado: int. Lado de la matriz de umbrales
+        ini: int. Primera posición
+        fin: int. Posición final (no incluida)'''
+
+    inicios = np.arange(0, tamanio, lado)
+    fases = np.arange(lado)
+    posiciones = ((inicios[:, None] + fases[None, :] - (lado + 1) // 2) % tamanio).ravel()
+
+    # La última escritura de cada posición es la primera del recorrido al revés
+    unicas, primera = np.unique(posiciones[::-1], return_index=True)
+    resultado = np.empty(tamanio, dtype=np.intp)
+    resultado[unicas] = np.tile(fases, len(inicios))[::-1][primera]
+
+    return resultado[ini:fin]
+
+
+def dither_ordenado(rojo, matriz, Py_ssize_t fila_ini = 0, Py_ssize_t alto = -1, int hilos = 1):
+    ''' Función que aplica el dithering con la matriz de umbrales de un
+        solo golpe. Regresa un arreglo (filas, ancho) uint8 con 0 o 255
+
+        rojo: ndarray. Arreglo (filas, ancho) con el canal rojo
+        matriz: ndarray. Matriz cuadrada de umbrales del 1 al 9
+        fila_ini: int. Fila de la imagen donde empieza el arreglo, para
+                  aplicarlo por bandas
+        alto: int. Número de filas de la imagen completa, -1 si el arreglo
+              es la imagen completa
+        hilos: int. Número de hilos a usar'''
+
+    matriz = np.asarray(matriz)
+    lado = matriz.shape[0]
+
+    if alto < 0:
+        alto = rojo.shape[0]
+
+    f_y = fases_bloques(alto, lado, fila_ini, fila_ini + rojo.shape[0])
+    f_x = fases_bloques(rojo.shape[1], lado, 0, rojo.shape[1])
+
+    # int(rojo / 28.3) < m equivale a rojo < 28.3 * m, que nunca es entero
+    return dither_umbrales(rojo, np.ceil(matriz * 28.3), f_y, f_x, hilos)
+
+
+# Número de hilos con el que se crean los PDI
+HILOS = os.cpu_count() or 1
+
+# Número de bandas en las que se divide la imagen por cada hilo, para
+# repartir mejor el trabajo cuando alguna banda tarda más
+BANDAS_POR_HILO = 4
+
+
+class FiltroCancelado(Exception):
+    ''' Excepción que se lanza cuando el suscriptor del progreso pide cancelar
+        el filtro. La imagen modificada puede quedar a medias, así que quien
+        la atrape debe llamar a deshacer_filtro'''
+
+
+class Progreso:
+    ''' Suscriptor del avance de los filtros. Las subclases reciben el
+        avance por bandas de filas o por filas de la cuadrícula, nunca por
+        pixel, y pueden pedir cancelar el filtro regresando False en avance'''
+
+    def inicio(self, titulo):
+        ''' Función que se llama antes de empezar el filtro
+
+            titulo: str. Descripción del trabajo'''
+        pass
+
+    def avance(self, fraccion):
+        ''' Función que se llama cada vez que el filtro avanza. Si regresa
+            False el filtro se detiene lanzando FiltroCancelado
+
+            fraccion: float. Parte del trabajo terminada, entre 0 y 1'''
+        return True
+
+    def fin(self):
+        ''' Función que se llama al terminar el filtro, aunque se haya
+            cancelado o haya fallado'''
+        pass
+
+
+class _ReporteNulo:
+    ''' Reporte que no hace nada, se usa cuando el PDI no tiene suscriptor
+        de progreso para no agregar trabajo a los filtros'''
+
+    activo = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __call__(self, hechos):
+        pass
+
+
+_REPORTE_NULO = _ReporteNulo()
+
+
+class _Reporte:
+    ''' Lleva la cuenta del avance de un filtro y solo avisa al suscriptor
+        cuando se cruza el siguiente de los num_avisos umbrales
+
+        progreso: Progreso. Suscriptor que recibe el avance
+        titulo: str. Descripción del trabajo
+        total: int. Número total de unidades (filas, celdas, imágenes)
+        num_avisos: int. Número de avisos que recibe el suscriptor'''
+
+    activo = True
+
+    def __init__(self, progreso, titulo, total, num_avisos):
+        self.progreso = progreso
+        self.titulo = titulo
+        self.total = max(1, total)
+        self.num_avisos = max(1, num_avisos)
+        self.aviso = 1
+        self.siguiente = self.total / self.num_avisos
+
+    def __enter__(self):
+        self.progreso.inicio(self.titulo)
+        return self
+
+    def __exit__(self, *exc):
+        self.progreso.fin()
+        return False
+
+    def __call__(self, hechos):
+        ''' Función que registra las unidades terminadas y lanza
+            FiltroCancelado si el suscriptor pide cancelar
+
+            hechos: int. Número de unidades terminadas hasta ahora'''
+
+        if hechos < self.siguiente:
+            return
+
+        while self.siguiente <= hechos and self.aviso <= self.num_avisos:
+            self.aviso += 1
+            self.siguiente = self.total * self.aviso / self.num_avisos
+
+        if self.progreso.avance(min(1.0, hechos / self.total)) is False:
+            raise FiltroCancelado(self.titulo)
+
+
+class _EtapaNula:
+    ''' Etapa que no mide nada, se usa cuando no hay perfilador activo para
+        que medir no agregue trabajo'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def anotar(self, pixeles = None, **datos):
+        pass
+
+
+_ETAPA_NULA = _EtapaNula()
+
+
+class _Etapa:
+    ''' Medición de una etapa: su duración, los pixeles que procesa, la
+        memoria que reserva y los datos que se le anoten. Al terminar se
+        agrega como evento al perfilador
+
+        perfilador: Perfilador. Perfilador que recibe el evento
+        nombre: str. Nombre de la etapa
+        categoria: str. Tipo de etapa: 'filtro', 'nucleo', 'entrada', 'salida', 'cache'...
+        pixeles: int. Número de pixeles que procesa la etapa'''
+
+    def __init__(self, perfilador, nombre, categoria, pixeles):
+        self.perfilador = perfilador
+        self.nombre = nombre
+        self.categoria = categoria
+        self.pixeles = pixeles
+        self.datos = {}
+        self.padre = None
+        self.memoria_inicio = 0
+        self.pico_hijos = 0
+        self.inicio = 0.0
+
+    def __enter__(self):
+        pila = self.perfilador.pila()
+        self.padre = pila[-1] if pila else None
+        pila.append(self)
+
+        if self.perfilador.memoria:
+            actual, pico = tracemalloc.get_traced_memory()
+
+            # El pico de tracemalloc se reinicia en cada etapa, así que el
+            # de la etapa de afuera se guarda antes
+            if self.padre is not None:
+                self.padre.pico_hijos = max(self.padre.pico_hijos, pico)
+
+            self.memoria_inicio = actual
+            tracemalloc.reset_peak()
+
+        self.inicio = time.perf_counter()
+
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        fin = time.perf_counter()
+        pila = self.perfilador.pila()
+        pila.pop()
+
+        evento = {'nombre': self.nombre,
+                  'categoria': self.categoria,
+                  'inicio': self.inicio,
+                  'segundos': fin - self.inicio,
+                  'pixeles': self.pixeles,
+                  'proceso': os.getpid(),
+                  'hilo': threading.get_ident(),
+                  'profundidad': len(pila),
+                  'datos': self.datos}
+
+        if tipo is not None:
+            self.datos['error'] = tipo.__name__
+
+        if self.perfilador.memoria:
+            actual, pico = tracemalloc.get_traced_memory()
+            pico = max(pico, self.pico_hijos)
+            evento['memoria'] = {'reservada': actual - self.memoria_inicio, 'pico': pico - self.memoria_inicio}
+
+            if self.padre is not None:
+                self.padre.pico_hijos = max(self.padre.pico_hijos, pico)
+
+        self.perfilador.agregar(evento)
+
+        return False
+
+    def anotar(self, pixeles = None, **datos):
+        ''' Función que agrega datos a la medición de la etapa
+
+            pixeles: int. Número de pixeles que procesa la etapa, si no se
+                     conocía al empezarla
+            datos: dict. Datos extra, p. ej. acierto=True en la cache'''
+
+        if pixeles is not None:
+            self.pixeles = pixeles
+
+        self.datos.update(datos)
+
+
+class Perfilador:
+    ''' Registra la duración de cada etapa de los filtros de los PDI: la
+        decodificación, cada filtro, los núcleos por bandas, los promedios
+        de la cuadrícula, el escalado y la codificación con PIL y las
+        consultas a la cache de resultados. Se activa con activar_perfil
+
+        memoria: bool. Valor que indica si medir también la memoria que
+                 reserva cada etapa con tracemalloc, que hace más lentos
+                 los filtros'''
+
+    def __init__(self, memoria = False):
+        self.memoria = memoria
+        self.eventos = []
+        self.candado = threading.Lock()
+        self.local = threading.local()
+        self.inicio_tracemalloc = memoria and not tracemalloc.is_tracing()
+
+        if self.inicio_tracemalloc:
+            tracemalloc.start()
+
+    def etapa(self, nombre, categoria = 'filtro', pixeles = 0):
+        ''' Función que regresa la medición de una etapa, para usarse con with
+
+            nombre: str. Nombre de la etapa
+            categoria: str. Tipo de etapa
+            pixeles: int. Número de pixeles que procesa la etapa'''
+
+        return _Etapa(self, nombre, categoria, pixeles)
+
+    def pila(self):
+        ''' Función que regresa las etapas abiertas en el hilo actual'''
+
+        pila = getattr(self.local, 'pila', None)
+
+        if pila is None:
+            pila = self.local.pila = []
+
+        return pila
+
+    def agregar(self, evento):
+        with self.candado:
+            self.eventos.append(evento)
+
+    def extraer(self):
+        ''' Función que regresa los eventos registrados y los quita del perfilador'''
+
+        with self.candado:
+            eventos, self.eventos = self.eventos, []
+
+        return eventos
+
+    def detener(self):
+        ''' Función que deja de medir la memoria si la empezó a medir este
+            perfilador'''
+
+        if self.inicio_tracemalloc:
+            tracemalloc.stop()
+            self.inicio_tracemalloc = False
+
+    def guardar(self, ruta):
+        ''' Función que guarda los eventos registrados. Ver guardar_perfil
+
+            ruta: str. Archivo .json (Chrome trace) o .jsonl (un evento por línea)'''
+
+        with self.candado:
+            eventos = list(self.eventos)
+
+        guardar_perfil(eventos, ruta)
+
+
+# Perfilador activo, None si no se mide nada
+PERFILADOR = None
+
+
+def activar_perfil(memoria = False):
+    ''' Función que empieza a medir las etapas de los PDI. Regresa el
+        perfilador con los eventos
+
+        memoria: bool. Valor que indica si medir la memoria de cada etapa'''
+
+    global PERFILADOR
+
+    desactivar_perfil()
+    PERFILADOR = Perfilador(memoria)
+
+    return PERFILADOR
+
+
+def desactivar_perfil():
+    ''' Función que deja de medir. Regresa el perfilador que estaba activo,
+        None si no había'''
+
+    global PERFILADOR
+
+    perfilador, PERFILADOR = PERFILADOR, None
+
+    if perfilador is not None:
+        perfilador.detener()
+
+    return perfilador
+
+
+def extraer_perfil():
+    ''' Función que regresa los eventos del perfilador activo y los quita
+        de él, una lista vacía si no hay perfilador'''
+
+    return [] if PERFILADOR is None else PERFILADOR.extraer()
+
+
+def etapa(nombre, categoria = 'filtro', pixeles = 0):
+    ''' Función que regresa la medición de una etapa con el perfilador
+        activo, o una etapa que no hace nada si no hay perfilador
+
+        nombre: str. Nombre de la etapa
+        categoria: str. Tipo de etapa
+        pixeles: int. Número de pixeles que procesa la etapa'''
+
+    if PERFILADOR is None:
+        return _ETAPA_NULA
+
+    return PERFILADOR.etapa(nombre, categoria, pixeles)
+
+
+def traza_chrome(eventos):
+    ''' Función que convierte los eventos en una traza de Chrome, que se
+        abre en chrome://tracing o en https://ui.perfetto.dev
+
+        eventos: list. Eventos de un Perfilador'''
+
+    traza = []
+
+    for evento in eventos:
+        argumentos = dict(evento['datos'], pixeles=evento['pixeles'])
+
+        if evento['pixeles'] and evento['segundos'] > 0:
+            argumentos['mp_s'] = round(evento['pixeles'] / 1e6 / evento['segundos'], 2)
+
+        if 'memoria' in evento:
+            argumentos.update(evento['memoria'])
+
+        traza.append({'name': evento['nombre'],
+                      'cat': evento['categoria'],
+                      'ph': 'X',
+                      'ts': evento['inicio'] * 1e6,
+                      'dur': evento['segundos'] * 1e6,
+                      'pid': evento['proceso'],
+                      'tid': evento['hilo'],
+                      'args': argumentos})
+
+    return {'traceEvents': traza, 'displayTimeUnit': 'ms'}
+
+
+def resumen_perfil(eventos):
+    ''' Función que suma los eventos por etapa. Regresa una lista de tuplas
+        (nombre, llamadas, segundos, pixeles) de la etapa más lenta a la
+        más rápida
+
+        eventos: list. Eventos de un Perfilador'''
+
+    etapas = {}
+
+    for evento in eventos:
+        llamadas, segundos, pixeles = etapas.get(evento['nombre'], (0, 0.0, 0))
+        etapas[evento['nombre']] = (llamadas + 1, segundos + evento['segundos'], pixeles + evento['pixeles'])
+
+    return sorted(((nombre,) + totales for nombre, totales in etapas.items()), key=lambda etapa: -etapa[2])
+
+
+def guardar_perfil(eventos, ruta):
+    ''' Función que guarda los eventos como traza de Chrome si la ruta
+        termina en .json, o como registro con un evento JSON por línea si
+        termina en .jsonl
+
+        eventos: list. Eventos de un Perfilador
+        ruta: str. Archivo donde se guardan'''
+
+    with open(ruta, 'w') as archivo:
+        if ruta.endswith('.jsonl'):
+            for evento in eventos:
+                archivo.write(json.dumps(evento, ensure_ascii=False) + '\n')
+        else:
+            json.dump(traza_chrome(eventos), archivo)
+
+
+def _bandas(Py_ssize_t alto, int num_bandas):
+    ''' Función que divide las filas de la imagen en bandas contiguas.
+        Regresa una lista de tuplas (fila_ini, fila_fin)
+
+        alto: int. Número de filas de la imagen
+        num_bandas: int. Número de bandas deseado'''
+
+    num_bandas = max(1, min(num_bandas, alto))
+    limites = np.linspace(0, alto, num_bandas + 1).astype(np.intp)
+
+    return list(zip(limites[:-1], limites[1:]))
+
+
+def _ejecutar_en_bandas(funcion, Py_ssize_t alto, int hilos, *args, reporte = _REPORTE_NULO):
+    ''' Función que ejecuta funcion(*args, fila_ini, fila_fin) sobre cada
+        banda de filas de la imagen, repartiendo las bandas entre los hilos.
+
+        Cada banda escribe solo sus propias filas de salida y lee su borde
+        (las filas vecinas que necesita el filtro) directamente de la imagen
+        de origen, que nadie modifica; por eso el resultado es idéntico al
+        de recorrer la imagen en un solo hilo.
+
+        Con un reporte activo la imagen se divide en al menos tantas bandas
+        como avisos tenga, y el avance se reporta al terminar cada banda.
+        Si se cancela, las bandas que no han empezado ya no se ejecutan
+
+        funcion: function. Núcleo que libera el GIL mientras procesa la banda
+        alto: int. Número de filas de la imagen
+        hilos: int. Número de hilos a usar
+        reporte: _Reporte. Reporte de avance en filas terminadas'''
+
+    cdef Py_ssize_t hechos = 0
+
+    with etapa(funcion.__name__, 'nucleo') as medicion:
+        medicion.anotar(filas=alto, hilos=hilos)
+
+        if not reporte.activo:
+            if hilos <= 1:
+                funcion(*args, 0, alto)
+                return
+
+            bandas = _bandas(alto, hilos * BANDAS_POR_HILO)
+        else:
+            bandas = _bandas(alto, max(hilos * BANDAS_POR_HILO, reporte.num_avisos))
+
+        if hilos <= 1:
+            for ini, fin in bandas:
+                funcion(*args, ini, fin)
+                hechos += fin - ini
+                reporte(hechos)
+            return
+
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            tareas = {ejecutor.submit(funcion, *args, ini, fin): fin - ini for ini, fin in bandas}
+
+            try:
+                for tarea in as_completed(tareas):
+                    tarea.result()
+                    hechos += tareas[tarea]
+                    reporte(hechos)
+            except BaseException:
+                for tarea in tareas:
+                    tarea.cancel()
+                raise
+
+
+# Reducciones de las operaciones por pixel: los tonos de gris usan su número
+# (1 al 9) y el umbral de alto contraste e inverso los siguientes
+cdef enum:
+    SIN_REDUCCION = 0
+    UMBRAL = 10
+    UMBRAL_INVERSO = 11
+
+
+class OperacionesPunto:
+    ''' Cadena de operaciones que solo dependen del pixel (tonos de gris,
+        brillo, capas rgb, alto contraste e inverso) compuesta para aplicarse
+        en una sola pasada sobre la imagen.
+
+        Se guarda como una tabla de búsqueda por canal (entrada), una
+        reducción opcional de los tres canales a un solo valor (un tono de
+        gris o el umbral) y otra tabla por canal para ese valor (salida).
+        Después de la reducción los tres canales solo dependen de ese valor,
+        así que cualquier operación que siga se convierte en tabla de salida
+        aplicándola a sus 256 posibles valores'''
+
+    def __init__(self):
+        self.entrada = np.tile(np.arange(256, dtype=np.uint8), (3, 1))
+        self.reduccion = SIN_REDUCCION
+        self.salida = self.entrada.copy()
+
+    def lut(self, tabla):
+        ''' Función que agrega una tabla de búsqueda a la cadena. Regresa
+            la misma cadena
+
+            tabla: ndarray. Tabla (256,) común a los tres canales o (3, 256)
+                            con una tabla por canal'''
+
+        tabla = np.asarray(tabla, dtype=np.uint8)
+
+        if tabla.shape == (256,):
+            tabla = np.tile(tabla, (3, 1))
+        elif tabla.shape != (3, 256):
+            raise ValueError("La tabla debe tener forma (256,) o (3, 256)!")
+
+        canales = np.arange(3)[:, None]
+
+        if self.reduccion == SIN_REDUCCION:
+            self.entrada = tabla[canales, self.entrada]
+        else:
+            self.salida = tabla[canales, self.salida]
+
+        return self
+
+    def gris(self, int tono):
+        ''' Función que agrega el tono de gris a la cadena. Regresa la misma
+            cadena
+
+            tono: int. Tono de gris seleccionado'''
+
+        self.__reducir(tono, tono_gris(self.salida.T[None], tono)[0])
+        return self
+
+    def umbral(self, bint inverso):
+        ''' Función que agrega el umbral de alto contraste o inverso a la
+            cadena. Regresa la misma cadena
+
+            inverso: bint. Valor que indica si se invierten blanco y negro'''
+
+        self.__reducir(UMBRAL_INVERSO if inverso else UMBRAL, umbral_rgb(self.salida.T[None], inverso)[0])
+        return self
+
+    def __reducir(self, int reduccion, tonos):
+        ''' Función que agrega una reducción de los tres canales a la cadena
+
+            reduccion: int. Reducción a aplicar
+            tonos: ndarray. Resultado de la reducción sobre los 256 pixeles
+                            de la tabla de salida'''
+
+        if self.reduccion == SIN_REDUCCION:
+            self.reduccion = reduccion
+        else:
+            self.salida = np.tile(tonos, (3, 1))
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _operaciones_banda(const unsigned char[:, :, :] origen, unsigned char[:, :, :] destino,
+                             const unsigned char[:, ::1] entrada, int reduccion, const double[:, ::1] pesos,
+                             const unsigned char[:, ::1] salida, Py_ssize_t fila_ini, Py_ssize_t fila_fin) noexcept nogil:
+    ''' Núcleo de las operaciones por pixel sobre las filas [fila_ini, fila_fin).
+        pesos tiene los productos por canal de los tonos de gris ponderados,
+        que se suman en el mismo orden que en tono_gris'''
+
+    cdef Py_ssize_t ancho = origen.shape[1]
+    cdef Py_ssize_t x, y
+    cdef unsigned char r, g, b, mayor, menor, valor
+    cdef int z
+
+    for y in range(fila_ini, fila_fin):
+        for x in range(ancho):
+
+            r = entrada[0, origen[y, x, 0]]
+            g = entrada[1, origen[y, x, 1]]
+            b = entrada[2, origen[y, x, 2]]
+
+            if reduccion == SIN_REDUCCION:
+                destino[y, x, 0] = r
+                destino[y, x, 1] = g
+                destino[y, x, 2] = b
+                continue
+
+            mayor = r if r > g else g
+            mayor = mayor if mayor > b else b
+            menor = r if r < g else g
+            menor = menor if menor < b else b
+
+            if reduccion == 1:
+                valor = (r + g + b) // 3
+            elif reduccion == 2 or reduccion == 3:
+                valor = <unsigned char><int>(pesos[0, r] + pesos[1, g] + pesos[2, b])
+            elif reduccion == 4:
+                valor = (mayor + menor) // 2
+            elif reduccion == 5:
+                valor = mayor
+            elif reduccion == 6:
+                valor = menor
+            elif reduccion == 7:
+                valor = r
+            elif reduccion == 8:
+                valor = g
+            elif reduccion == 9:
+                valor = b
+            else:
+                valor = 255 if (r > 127 and g > 127 and b > 127) != (reduccion == UMBRAL_INVERSO) else 0
+
+            for z in range(3):
+                destino[y, x, z] = salida[z, valor]
+
+
+def _operaciones_banda_py(const unsigned char[:, :, :] origen, unsigned char[:, :, :] destino,
+                          const unsigned char[:, ::1] entrada, int reduccion, const double[:, ::1] pesos,
+                          const unsigned char[:, ::1] salida, Py_ssize_t fila_ini, Py_ssize_t fila_fin):
+    ''' Función que ejecuta el núcleo de las operaciones por pixel sin el GIL'''
+
+    with nogil:
+        _operaciones_banda(origen, destino, entrada, reduccion, pesos, salida, fila_ini, fila_fin)
+
+
+def aplicar_operaciones(origen, operaciones, destino = None, int hilos = 1, reporte = _REPORTE_NULO):
+    ''' Función que aplica la cadena de operaciones por pixel recorriendo
+        la imagen una sola vez. Solo escribe los canales rgb del destino, que
+        puede ser el mismo origen. Regresa el destino
+
+        origen: ndarray. Arreglo (alto, ancho, canales) de la imagen
+        operaciones: OperacionesPunto. Cadena de operaciones a aplicar
+        destino: ndarray. Arreglo donde se escribe el resultado, None para
+                 regresar un arreglo (alto, ancho, 3) nuevo
+        hilos: int. Número de hilos a usar
+        reporte: _Reporte. Reporte de avance en filas terminadas'''
+
+    if destino is None:
+        destino = np.empty((origen.shape[0], origen.shape[1], 3), dtype=np.uint8)
+    elif destino.shape[:2] != origen.shape[:2]:
+        raise ValueError("El destino debe tener el tamaño de la imagen!")
+
+    if operaciones.reduccion in PESOS_GRIS:
+        pesos = np.ascontiguousarray((np.arange(256)[:, None] * np.array(PESOS_GRIS[operaciones.reduccion])).T)
+    else:
+        pesos = np.zeros((3, 256))
+
+    _ejecutar_en_bandas(_operaciones_banda_py, origen.shape[0], hilos, origen, destino,
+                        np.ascontiguousarray(operaciones.entrada), operaciones.reduccion, pesos,
+                        np.ascontiguousarray(operaciones.salida), reporte=reporte)
+
+    return destino
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _convolucion_banda(const unsigned char[:, :, ::1] origen, unsigned char[:, :, ::1] destino,
+                             const double[:] coef, const Py_ssize_t[:] t_y, const Py_ssize_t[:] t_x,
+                             double factor, double brillo, Py_ssize_t fila_ini, Py_ssize_t fila_fin) noexcept nogil:
+    ''' Núcleo de la convolución directa sobre las filas [fila_ini, fila_fin).
+        Los desplazamientos ya vienen reducidos a [0, alto) y [0, ancho) y los
+        coeficientes se suman en el orden del filtro'''
+
+    cdef Py_ssize_t alto = origen.shape[0]
+    cdef Py_ssize_t ancho = origen.shape[1]
+    cdef Py_ssize_t x, y, k, img_x, img_y
+    cdef double suma_r, suma_g, suma_b, c, valor
+    cdef double sumas[3]
+    cdef int z
+
+    for y in range(fila_ini, fila_fin):
+        for x in range(ancho):
+
+            suma_r = suma_g = suma_b = 0
+
+            for k in range(coef.shape[0]):
+                img_y = y + t_y[k]
+                if img_y >= alto:
+                    img_y = img_y - alto
+                img_x = x + t_x[k]
+                if img_x >= ancho:
+                    img_x = img_x - ancho
+
+                c = coef[k]
+                suma_r = suma_r + origen[img_y, img_x, 0] * c
+                suma_g = suma_g + origen[img_y, img_x, 1] * c
+                suma_b = suma_b + origen[img_y, img_x, 2] * c
+
+            sumas[0] = suma_r
+            sumas[1] = suma_g
+            sumas[2] = suma_b
+
+            for z in range(3):
+                valor = factor * sumas[z] + brillo
+
+                if valor <= 0:
+                    destino[y, x, z] = 0
+                elif valor >= 255:
+                    destino[y, x, z] = 255
+                else:
+                    destino[y, x, z] = <unsigned char>valor
+
+
+def _convolucion_banda_py(const unsigned char[:, :, ::1] origen, unsigned char[:, :, ::1] destino,
+                          const double[:] coef, const Py_ssize_t[:] t_y, const Py_ssize_t[:] t_x,
+                          double factor, double brillo, Py_ssize_t fila_ini, Py_ssize_t fila_fin):
+    ''' Función que ejecuta el núcleo de la convolución sin el GIL'''
+
+    with nogil:
+        _convolucion_banda(origen, destino, coef, t_y, t_x, factor, brillo, fila_ini, fila_fin)
+
+
+cdef inline unsigned char _elige(unsigned char a, unsigned char b, bint minimo) noexcept nogil:
+    if minimo:
+        return a if a < b else b
+
+    return a if a > b else b
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _min_max_banda(const unsigned char[:, ::1] origen, unsigned char[:, ::1] destino,
+                         Py_ssize_t largo, Py_ssize_t desp, bint minimo, bint ciclico,
+                         unsigned char[::1] g, unsigned char[::1] h,
+                         Py_ssize_t fila_ini, Py_ssize_t fila_fin) noexcept nogil:
+    ''' Núcleo de van Herk/Gil-Werman sobre las filas [fila_ini, fila_fin).
+        destino[y, x] es el mínimo o máximo de origen[y, x + desp] a
+        origen[y, x + desp + largo - 1]. La fila se divide en bloques de
+        largo pixeles y se calculan los acumulados de cada bloque hacia la
+        derecha (g) y hacia la izquierda (h); cada ventana cubre el final de
+        un bloque y el inicio del siguiente, así que cuesta 3 comparaciones
+        por pixel sin importar el largo'''
+
+    cdef Py_ssize_t ancho = origen.shape[1]
+    cdef Py_ssize_t total = ancho + largo - 1
+    cdef Py_ssize_t x, y, j
+
+    for y in range(fila_ini, fila_fin):
+
+        for j in range(total):
+            x = j + desp
+
+            if ciclico:
+                x = x % ancho
+
+                if x < 0:
+                    x += ancho
+            elif x < 0:
+                x = 0
+            elif x >= ancho:
+                x = ancho - 1
+
+            h[j] = origen[y, x]
+            g[j] = h[j] if j % largo == 0 else _elige(g[j - 1], h[j], minimo)
+
+        for j in range(total - 2, -1, -1):
+            if (j + 1) % largo != 0:
+                h[j] = _elige(h[j], h[j + 1], minimo)
+
+        for x in range(ancho):
+            destino[y, x] = _elige(h[x], g[x + largo - 1], minimo)
+
+
+def _min_max_banda_py(const unsigned char[:, ::1] origen, unsigned char[:, ::1] destino,
+                      Py_ssize_t largo, Py_ssize_t desp, bint minimo, bint ciclico,
+                      Py_ssize_t fila_ini, Py_ssize_t fila_fin):
+    ''' Función que ejecuta el núcleo de van Herk/Gil-Werman sin el GIL'''
+
+    cdef unsigned char[::1] g = np.empty(origen.shape[1] + largo - 1, dtype=np.uint8)
+    cdef unsigned char[::1] h = np.empty(origen.shape[1] + largo - 1, dtype=np.uint8)
+
+    with nogil:
+        _min_max_banda(origen, destino, largo, desp, minimo, ciclico, g, h, fila_ini, fila_fin)
+
+
+def min_max_filas(canal, Py_ssize_t largo, Py_ssize_t desp, bint minimo, bint ciclico = True, int hilos = 1):
+    ''' Función que regresa el mínimo o máximo de cada pixel con los
+        largo pixeles de su fila que empiezan desp pixeles después de él
+
+        canal: ndarray. Arreglo (alto, ancho) uint8
+        largo: int. Número de pixeles de la ventana
+        desp: int. Desplazamiento del inicio de la ventana
+        minimo: bint. Valor que indica si tomar el mínimo o el máximo
+        ciclico: bint. Valor que indica si los pixeles fuera de la imagen se
+                 toman del otro extremo o si se repite el pixel del borde
+        hilos: int. Número de hilos a usar'''
+
+    if largo < 1:
+        raise ValueError("La ventana debe tener al menos un pixel!")
+
+    canal = np.ascontiguousarray(canal, dtype=np.uint8)
+    destino = np.empty_like(canal)
+
+    _ejecutar_en_bandas(_min_max_banda_py, canal.shape[0], hilos, canal, destino, largo, desp, minimo, ciclico)
+
+    return destino
+
+
+def _combina_desplazado(resultado, filas, Py_ssize_t desp, bint minimo, bint ciclico):
+    ''' Función que combina en resultado el mínimo o máximo con la fila
+        y + desp de filas para cada fila y, sin copiar filas
+
+        resultado: ndarray. Arreglo (alto, ancho) que se modifica
+        filas: ndarray. Arreglo (alto, ancho) a combinar
+        desp: int. Desplazamiento vertical
+        minimo: bint. Valor que indica si tomar el mínimo o el máximo
+        ciclico: bint. Valor que indica si las filas fuera de la imagen se
+                 toman del otro extremo o si se repite la fila del borde'''
+
+    cdef Py_ssize_t alto = filas.shape[0]
+    cdef Py_ssize_t n
+
+    op = np.minimum if minimo else np.maximum
+
+    if ciclico:
+        desp %= alto
+        op(resultado[:alto - desp], filas[desp:], out=resultado[:alto - desp])
+        op(resultado[alto - desp:], filas[:desp], out=resultado[alto - desp:])
+    elif desp >= 0:
+        n = max(alto - desp, 0)
+        op(resultado[:n], filas[desp:], out=resultado[:n])
+        op(resultado[n:], filas[alto - 1], out=resultado[n:])
+    else:
+        n = min(-desp, alto)
+        op(resultado[:n], filas[0], out=resultado[:n])
+        op(resultado[n:], filas[:alto - n], out=resultado[n:])
+
+
+def elemento_estructurante(forma, int alto, int ancho = 0):
+    ''' Función que regresa un elemento estructurante como arreglo
+        (alto, ancho) de bool, centrado en (alto // 2, ancho // 2)
+
+        forma: str. 'rectangulo', 'cruz' o 'disco' (elipse si alto y ancho
+               son distintos)
+        alto: int. Número de filas del elemento
+        ancho: int. Número de columnas del elemento, 0 para usar el alto'''
+
+    ancho = ancho or alto
+
+    if alto < 1 or ancho < 1:
+        raise ValueError("El elemento estructurante debe tener al menos un pixel!")
+
+    y = (np.arange(alto) - (alto - 1) / 2)[:, None]
+    x = (np.arange(ancho) - (ancho - 1) / 2)[None, :]
+
+    if forma == 'rectangulo':
+        return np.ones((alto, ancho), dtype=bool)
+    elif forma == 'cruz':
+        return (np.abs(y) < 1) | (np.abs(x) < 1)
+    elif forma == 'disco':
+        return (y / (alto / 2)) ** 2 + (x / (ancho / 2)) ** 2 <= 1
+
+    raise ValueError("Esa forma de elemento estructurante no existe!")
+
+
+def _tramos(elemento):
+    ''' Función que descompone el elemento en tramos horizontales. Regresa
+        un diccionario (columna, largo) -> lista de filas con ese tramo
+
+        elemento: ndarray. Arreglo (alto, ancho) de bool'''
+
+    tramos = {}
+
+    for fila in range(elemento.shape[0]):
+        bordes = np.flatnonzero(np.diff(np.concatenate(([0], elemento[fila].astype(np.int8), [0]))))
+
+        for ini, fin in zip(bordes[::2], bordes[1::2]):
+            tramos.setdefault((int(ini), int(fin - ini)), []).append(fila)
+
+    return tramos
+
+
+def filtro_min_max(canal, elemento, bint minimo, centro = None, bint ciclico = True, int hilos = 1):
+    ''' Función que regresa el mínimo o máximo de cada pixel sobre los
+        pixeles que cubre el elemento estructurante colocado con su centro
+        en el pixel.
+
+        Un rectángulo se separa en una ventana horizontal y una vertical de
+        van Herk/Gil-Werman, con costo constante por pixel sin importar su
+        tamaño. Otras formas se descomponen en tramos horizontales: cada
+        tramo distinto es una ventana de van Herk/Gil-Werman y las filas se
+        combinan desplazadas, así que el costo depende del número de tramos
+        y no del número de pixeles del elemento
+
+        canal: ndarray. Arreglo (alto, ancho) uint8
+        elemento: ndarray. Arreglo 2D de bool con el elemento estructurante
+        minimo: bint. Valor que indica si tomar el mínimo o el máximo
+        centro: tuple. (fila, columna) del centro en el elemento, por omisión
+                el centro del arreglo
+        ciclico: bint. Valor que indica si los pixeles fuera de la imagen se
+                 toman del otro extremo o si se repite el pixel del borde
+        hilos: int. Número de hilos a usar'''
+
+    elemento = np.asarray(elemento, dtype=bool)
+
+    if elemento.ndim != 2 or not elemento.any():
+        raise ValueError("El elemento estructurante debe ser un arreglo 2D con al menos un pixel!")
+
+    c_y, c_x = centro if centro is not None else (elemento.shape[0] // 2, elemento.shape[1] // 2)
+
+    if elemento.all():
+        filas = min_max_filas(canal, elemento.shape[1], -c_x, minimo, ciclico, hilos)
+        columnas = min_max_filas(filas.T, elemento.shape[0], -c_y, minimo, ciclico, hilos)
+        return np.ascontiguousarray(columnas.T)
+
+    resultado = np.full(np.shape(canal), 255 if minimo else 0, dtype=np.uint8)
+
+    for (columna, largo), filas_tramo in _tramos(elemento).items():
+        filas = min_max_filas(canal, largo, columna - c_x, minimo, ciclico, hilos)
+
+        for fila in filas_tramo:
+            _combina_desplazado(resultado, filas, fila - c_y, minimo, ciclico)
+
+    return resultado
+
+
+def _reflejado(elemento, centro):
+    ''' Función que regresa el elemento reflejado respecto a su centro y
+        su nuevo centro
+
+        elemento: ndarray. Arreglo 2D de bool
+        centro: tuple. (fila, columna) del centro, None para el del arreglo'''
+
+    elemento = np.asarray(elemento, dtype=bool)
+    c_y, c_x = centro if centro is not None else (elemento.shape[0] // 2, elemento.shape[1] // 2)
+
+    return elemento[::-1, ::-1], (elemento.shape[0] - 1 - c_y, elemento.shape[1] - 1 - c_x)
+
+
+def _erosion_canal(canal, elemento, centro, ciclico, hilos):
+    return filtro_min_max(canal, elemento, True, centro, ciclico, hilos)
+
+
+def _dilatacion_canal(canal, elemento, centro, ciclico, hilos):
+    reflejado, centro = _reflejado(elemento, centro)
+    return filtro_min_max(canal, reflejado, False, centro, ciclico, hilos)
+
+
+def _apertura_canal(canal, elemento, centro, ciclico, hilos):
+    return _dilatacion_canal(_erosion_canal(canal, elemento, centro, ciclico, hilos), elemento, centro, ciclico, hilos)
+
+
+def _cierre_canal(canal, elemento, centro, ciclico, hilos):
+    return _erosion_canal(_dilatacion_canal(canal, elemento, centro, ciclico, hilos), elemento, centro, ciclico, hilos)
+
+
+def _gradiente_canal(canal, elemento, centro, ciclico, hilos):
+    maximo = _dilatacion_canal(canal, elemento, centro, ciclico, hilos).astype(np.int16)
+    return np.clip(maximo - _erosion_canal(canal, elemento, centro, ciclico, hilos), 0, 255).astype(np.uint8)
+
+
+# Operaciones morfológicas: nombre -> funcion(canal, elemento, centro, ciclico, hilos)
+OPERACIONES_MORFOLOGIA = {
+    'erosion': _erosion_canal,
+    'dilatacion': _dilatacion_canal,
+    'apertura': _apertura_canal,
+    'cierre': _cierre_canal,
+    'gradiente': _gradiente_canal,
+}
+
+
+def morfologia(origen, operacion, elemento, centro = None, bint ciclico = True, int hilos = 1,
+               reporte = _REPORTE_NULO):
+    ''' Función que aplica una operación morfológica a cada canal rgb de la
+        imagen. Regresa un arreglo (alto, ancho, 3) uint8
+
+        origen: ndarray. Arreglo (alto, ancho, canales) de la imagen
+        operacion: str. 'erosion', 'dilatacion', 'apertura', 'cierre' o
+                   'gradiente'
+        elemento: ndarray. Arreglo 2D de bool con el elemento estructurante
+        centro: tuple. (fila, columna) del centro en el elemento
+        ciclico: bint. Valor que indica si los pixeles fuera de la imagen se
+                 toman del otro extremo o si se repite el pixel del borde
+        hilos: int. Número de hilos a usar
+        reporte: _Reporte. Reporte de avance en filas terminadas'''
+
+    if operacion not in OPERACIONES_MORFOLOGIA:
+        raise ValueError("Esa operación morfológica no existe!")
+
+    origen = np.asarray(origen)
+    destino = np.empty((origen.shape[0], origen.shape[1], 3), dtype=np.uint8)
+
+    for z in range(3):
+        destino[:, :, z] = OPERACIONES_MORFOLOGIA[operacion](origen[:, :, z], elemento, centro, ciclico, hilos)
+        reporte(origen.shape[0] * (z + 1) // 3)
+
+    return destino
+
+
+# Vecinos que recorre la erosión de TRENT: la ventana de 3x3 sin su centro,
+# con el pixel en la esquina inferior derecha
+ELEMENTO_EROSION = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=bool)
+CENTRO_EROSION = (2, 2)
+
+
+def erosion(origen, bint minimo, int hilos = 1, reporte = _REPORTE_NULO):
+    ''' Función que aplica la erosión mínima o máxima al canal rojo de la
+        imagen. Regresa un arreglo (alto, ancho, 3) uint8 en tonos de gris
+
+        origen: ndarray. Arreglo (alto, ancho, canales) de la imagen
+        minimo: bint. Valor que indica si tomar el mínimo o el máximo
+        hilos: int. Número de hilos a usar
+        reporte: _Reporte. Reporte de avance en filas terminadas'''
+
+    rojo = filtro_min_max(np.asarray(origen)[:, :, 0], ELEMENTO_EROSION, minimo, CENTRO_EROSION, True, hilos)
+    reporte(rojo.shape[0])
+
+    return np.repeat(rojo[:, :, None], 3, axis=2)
+
+
+# Tamaños de las matrices de Bayer disponibles
+ORDENES_BAYER = (2, 4, 8)
+
+
+def matriz_bayer(int orden):
+    ''' Función que regresa la matriz de Bayer de orden x orden con los
+        umbrales del 0 al orden ** 2 - 1
+
+        orden: int. Lado de la matriz, 2, 4 u 8'''
+
+    if orden not in ORDENES_BAYER:
+        raise ValueError("Solo hay matrices de Bayer de 2, 4 y 8!")
+
+    matriz = np.zeros((1, 1), dtype=np.intp)
+
+    while matriz.shape[0] < orden:
+        matriz = np.block([[4 * matriz, 4 * matriz + 2],
+                           [4 * matriz + 3, 4 * matriz + 1]])
+
+    return matriz
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _umbral_banda(const unsigned char[:, :] gris, unsigned char[:, ::1] destino,
+                        const unsigned short[:, ::1] umbrales, const Py_ssize_t[::1] f_y,
+                        Py_ssize_t fila_ini, Py_ssize_t fila_fin) noexcept nogil:
+    ''' Núcleo del dithering con umbrales sobre las filas [fila_ini, fila_fin).
+        umbrales tiene una fila por cada renglón de la matriz, ya repetida
+        a lo ancho de la imagen'''
+
+    cdef Py_ssize_t ancho = gris.shape[1]
+    cdef Py_ssize_t x, y, f
+
+    for y in range(fila_ini, fila_fin):
+        f = f_y[y]
+
+        for x in range(ancho):
+            destino[y, x] = 255 if gris[y, x] >= umbrales[f, x] else 0
+
+
+def _umbral_banda_py(const unsigned char[:, :] gris, unsigned char[:, ::1] destino,
+                     const unsigned short[:, ::1] umbrales, const Py_ssize_t[::1] f_y,
+                     Py_ssize_t fila_ini, Py_ssize_t fila_fin):
+    ''' Función que ejecuta el núcleo del dithering con umbrales sin el GIL'''
+
+    with nogil:
+        _umbral_banda(gris, destino, umbrales, f_y, fila_ini, fila_fin)
+
+
+def dither_umbrales(gris, umbrales, f_y, f_x, int hilos = 1):
+    ''' Función que aplica el dithering con una matriz de umbrales repetida
+        sobre la imagen: cada pixel queda en 255 si su tono es al menos el
+        umbral de su posición y en 0 si no. Regresa un arreglo (filas, ancho)
+        uint8
+
+        gris: ndarray. Arreglo (filas, ancho) uint8 con el tono de cada pixel
+        umbrales: ndarray. Matriz de umbrales enteros del 0 al 256
+        f_y: ndarray. Renglón de la matriz que le toca a cada fila
+        f_x: ndarray. Columna de la matriz que le toca a cada columna
+        hilos: int. Número de hilos a usar'''
+
+    destino = np.empty(np.shape(gris), dtype=np.uint8)
+    filas_umbral = np.ascontiguousarray(np.asarray(umbrales, dtype=np.uint16)[:, f_x])
+
+    _ejecutar_en_bandas(_umbral_banda_py, destino.shape[0], hilos, gris, destino, filas_umbral,
+                        np.ascontiguousarray(f_y, dtype=np.intp))
+
+    return destino
+
+
+def dither_bayer(gris, int orden, Py_ssize_t fila_ini = 0, int hilos = 1):
+    ''' Función que aplica el dithering ordenado con la matriz de Bayer.
+        Regresa un arreglo (filas, ancho) uint8 con 0 o 255
+
+        gris: ndarray. Arreglo (filas, ancho) uint8 con el tono de cada pixel
+        orden: int. Lado de la matriz, 2, 4 u 8
+        fila_ini: int. Fila de la imagen donde empieza el arreglo, para
+                  aplicarlo por bandas
+        hilos: int. Número de hilos a usar'''
+
+    # Umbral (b + 0.5) * 256 / orden ** 2, redondeado hacia arriba porque los tonos son enteros
+    umbrales = -((-(2 * matriz_bayer(orden) + 1) * 128) // (orden * orden))
+    filas, ancho = np.shape(gris)
+
+    return dither_umbrales(gris, umbrales, np.arange(fila_ini, fila_ini + filas) % orden,
+                           np.arange(ancho) % orden, hilos)
+
+
+# Filas de cada banda de números al azar del dithering azaroso
+FILAS_AZAR = 256
+
+
+def dither_azar(gris, semilla = None):
+    ''' Función que aplica el dithering azaroso: cada pixel queda en 0 si un
+        número al azar del 0 al 256 es mayor que su tono. Con la misma semilla
+        el resultado es el mismo. Regresa un arreglo (filas, ancho) uint8
+
+        gris: ndarray. Arreglo (filas, ancho) uint8 con el tono de cada pixel
+        semilla: int. Semilla del generador, None para una al azar'''
+
+    gris = np.asarray(gris)
+    generador = np.random.default_rng(semilla)
+    destino = np.empty(gris.shape, dtype=np.uint8)
+
+    # Se generan los números por bandas de un tamaño fijo para no crear
+    # un arreglo del tamaño de la imagen, sin cambiar la secuencia
+    for ini in range(0, gris.shape[0], FILAS_AZAR):
+        fin = min(gris.shape[0], ini + FILAS_AZAR)
+        azar = generador.integers(0, 257, size=(fin - ini, gris.shape[1]), dtype=np.uint16)
+        np.multiply(azar <= gris[ini:fin], 255, out=destino[ini:fin], casting='unsafe')
+
+    return destino
+
+
+# Número máximo de vecinos que reciben el error en la difusión
+cdef enum:
+    MAX_VECINOS = 8
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _difusion_error(const unsigned char[:, :] gris, unsigned char[:, ::1] destino,
+                          const int[:, ::1] vecinos, double divisor, double[:, ::1] errores) noexcept nogil:
+    ''' Núcleo de la difusión del error: recorre la imagen fila por fila y
+        reparte la diferencia entre el tono (más el error recibido) y el
+        valor elegido entre los vecinos (dy, dx, peso) aún no recorridos.
+        errores guarda el error pendiente de las filas y a y + 2, con dos
+        columnas extra a cada lado'''
+
+    cdef Py_ssize_t alto = gris.shape[0]
+    cdef Py_ssize_t ancho = gris.shape[1]
+    cdef Py_ssize_t num_vecinos = min(vecinos.shape[0], MAX_VECINOS)
+    cdef Py_ssize_t x, y, k, fila
+    cdef Py_ssize_t filas_vecino[MAX_VECINOS]
+    cdef double pesos[MAX_VECINOS]
+    cdef double valor, error
+    cdef unsigned char nuevo
+
+    for k in range(num_vecinos):
+        pesos[k] = vecinos[k, 2] / divisor
+
+    for y in range(alto):
+        fila = y % 3
+
+        for k in range(num_vecinos):
+            filas_vecino[k] = (y + vecinos[k, 0]) % 3
+
+        for x in range(ancho):
+            valor = gris[y, x] + errores[fila, x + 2]
+            nuevo = 255 if valor >= 128 else 0
+            destino[y, x] = nuevo
+            error = valor - nuevo
+
+            for k in range(num_vecinos):
+                errores[filas_vecino[k], x + 2 + vecinos[k, 1]] += error * pesos[k]
+
+        for x in range(ancho + 4):
+            errores[fila, x] = 0
+
+
+# Métodos de difusión del error: nombre -> (divisor, vecinos (dy, dx, peso))
+DIFUSION_ERROR = {
+    'floyd-steinberg': (16, ((0, 1, 7), (1, -1, 3), (1, 0, 5), (1, 1, 1))),
+    'atkinson': (8, ((0, 1, 1), (0, 2, 1), (1, -1, 1), (1, 0, 1), (1, 1, 1), (2, 0, 1))),
+}
+
+
+def dither_difusion(gris, metodo = 'floyd-steinberg'):
+    ''' Función que aplica el dithering por difusión del error. Regresa un
+        arreglo (alto, ancho) uint8 con 0 o 255
+
+        gris: ndarray. Arreglo (alto, ancho) uint8 con el tono de cada pixel
+        metodo: str. 'floyd-steinberg' o 'atkinson' '''
+
+    if metodo not in DIFUSION_ERROR:
+        raise ValueError("Ese método de difusión del error no existe!")
+
+    cdef double divisor = DIFUSION_ERROR[metodo][0]
+    cdef const unsigned char[:, :] origen = np.asarray(gris, dtype=np.uint8)
+    destino = np.empty((origen.shape[0], origen.shape[1]), dtype=np.uint8)
+    cdef unsigned char[:, ::1] salida = destino
+    cdef const int[:, ::1] tabla = np.array(DIFUSION_ERROR[metodo][1], dtype=np.intc)
+    cdef double[:, ::1] errores = np.zeros((3, origen.shape[1] + 4))
+
+    with nogil:
+        _difusion_error(origen, salida, tabla, divisor, errores)
+
+    return destino
+
+
+# Filtros de convolución disponibles: nombre -> (matriz, factor, brillo)
+FILTROS_CONVOLUCION = {}
+
+# Número de coeficientes distintos de cero a partir del cual una matriz
+# entera se aplica con la FFT en lugar de la suma directa
+UMBRAL_FFT = 225
+
+
+def registrar_filtro_convolucion(nombre, matriz, double factor = 1.0, double brillo = 0.0):
+    ''' Función que registra un filtro de convolución para poder aplicarlo
+        por nombre con PDI.filtros_convolucion
+
+        nombre: str. Nombre del filtro
+        matriz: list. Matriz del filtro de convolución
+        factor: double. Valor del factor para aplicar el filtro
+        brillo: double. Valor del brillo'''
+
+    matriz = np.array(matriz)
+
+    if matriz.ndim != 2 or matriz.size == 0:
+        raise ValueError("La matriz del filtro debe ser bidimensional!")
+
+    if np.issubdtype(matriz.dtype, np.integer) or np.array_equal(matriz, np.round(matriz)):
+        matriz = matriz.astype(np.int64)
+    else:
+        matriz = matriz.astype(np.double)
+
+    FILTROS_CONVOLUCION[nombre] = (matriz, factor, brillo)
+
+
+def _desplazamientos(int tamanio):
+    ''' Función que regresa el desplazamiento respecto al pixel de cada
+        posición del filtro. Reproduce el índice (pos - tamanio / 2 + f) con
+        el que siempre se ha recorrido el filtro
+
+        tamanio: int. Número de filas o columnas del filtro'''
+
+    return np.arange(tamanio) - (tamanio + 1) // 2
+
+
+def _factores_separables(matriz):
+    ''' Función que regresa los vectores enteros (columna, fila) cuyo
+        producto exterior es la matriz, o None si la matriz no es separable
+
+        matriz: ndarray. Matriz entera del filtro'''
+
+    filas_nz = np.flatnonzero(np.any(matriz != 0, axis=1))
+
+    if len(filas_nz) == 0:
+        return None
+
+    fila = matriz[filas_nz[0]]
+    fila = fila // np.gcd.reduce(fila[fila != 0])
+    j = np.flatnonzero(fila)[0]
+
+    if np.any(matriz[:, j] % fila[j] != 0):
+        return None
+
+    columna = matriz[:, j] // fila[j]
+
+    if not np.array_equal(np.outer(columna, fila), matriz):
+        return None
+
+    return columna, fila
+
+
+def _convolucion_directa(origen, matriz, d_y, d_x, tipo):
+    ''' Función que suma cada coeficiente distinto de cero por la imagen
+        desplazada, en el mismo orden (fila por fila) del filtro original
+
+        origen: ndarray. Arreglo (alto, ancho, 3) de la imagen
+        matriz: ndarray. Matriz del filtro
+        d_y: ndarray. Desplazamiento vertical de cada fila del filtro
+        d_x: ndarray. Desplazamiento horizontal de cada columna del filtro
+        tipo: dtype. Tipo del acumulador'''
+
+    suma = np.zeros(origen.shape, dtype=tipo)
+
+    for f_y, f_x in zip(*np.nonzero(matriz)):
+        suma += np.roll(origen, (-d_y[f_y], -d_x[f_x]), axis=(0, 1)) * matriz[f_y, f_x]
+
+    return suma
+
+
+def _convolucion_compilada(origen, matriz, d_y, d_x, double factor, double brillo, int hilos, reporte):
+    ''' Función que aplica la convolución directa con el núcleo compilado,
+        repartiendo las bandas de filas entre los hilos
+
+        origen: ndarray. Arreglo (alto, ancho, 3) de la imagen
+        matriz: ndarray. Matriz del filtro
+        d_y: ndarray. Desplazamiento vertical de cada fila del filtro
+        d_x: ndarray. Desplazamiento horizontal de cada columna del filtro
+        factor: double. Valor del factor para aplicar el filtro
+        brillo: double. Valor del brillo
+        hilos: int. Número de hilos a usar
+        reporte: _Reporte. Reporte de avance en filas terminadas'''
+
+    alto, ancho = origen.shape[0], origen.shape[1]
+    f_y, f_x = np.nonzero(matriz)
+
+    coef = matriz[f_y, f_x].astype(np.double)
+    t_y = (d_y[f_y] % alto).astype(np.intp)
+    t_x = (d_x[f_x] % ancho).astype(np.intp)
+    destino = np.empty((alto, ancho, 3), dtype=np.uint8)
+
+    _ejecutar_en_bandas(_convolucion_banda_py, alto, hilos, np.ascontiguousarray(origen), destino,
+                        coef, t_y, t_x, factor, brillo, reporte=reporte)
+
+    return destino
+
+
+def _convolucion_separable(origen, columna, fila, tipo):
+    ''' Función que aplica el filtro como dos pasadas de una dimensión,
+        primero a lo ancho y después a lo alto
+
+        origen: ndarray. Arreglo (alto, ancho, 3) de la imagen
+        columna: ndarray. Vector vertical del filtro
+        fila: ndarray. Vector horizontal del filtro
+        tipo: dtype. Tipo del acumulador'''
+
+    sin_desplazamiento = np.zeros(1, dtype=np.int64)
+
+    parcial = _convolucion_directa(origen, fila[None, :], sin_desplazamiento,
+                                   _desplazamientos(len(fila)), tipo)
+
+    return _convolucion_directa(parcial, columna[:, None], _desplazamientos(len(columna)),
+                                sin_desplazamiento, tipo)
+
+
+def _convolucion_fft(origen, matriz):
+    ''' Función que aplica el filtro con la FFT. La convolución circular
+        coincide con el recorrido cíclico de los bordes, y como la matriz es
+        entera las sumas se redondean al entero exacto
+
+        origen: ndarray. Arreglo (alto, ancho, 3) de la imagen
+        matriz: ndarray. Matriz entera del filtro'''
+
+    alto, ancho = origen.shape[0], origen.shape[1]
+    d_y = _desplazamientos(matriz.shape[0])
+    d_x = _desplazamientos(matriz.shape[1])
+    f_y, f_x = np.nonzero(matriz)
+
+    nucleo = np.zeros((alto, ancho))
+    np.add.at(nucleo, ((-d_y[f_y]) % alto, (-d_x[f_x]) % ancho), matriz[f_y, f_x])
+    nucleo_f = np.fft.rfft2(nucleo)
+
+    suma = np.empty(origen.shape, dtype=np.int64)
+
+    for z in range(origen.shape[2]):
+        canal = np.fft.irfft2(np.fft.rfft2(origen[:, :, z]) * nucleo_f, s=(alto, ancho))
+        suma[:, :, z] = np.rint(canal)
+
+    return suma
+
+
+def convolucion(origen, matriz, double factor, double brillo, int hilos = 1, reporte = _REPORTE_NULO):
+    ''' Función que aplica un filtro de convolución a la imagen recorriendo
+        los bordes de forma cíclica. Regresa un arreglo (alto, ancho, 3) uint8
+
+        Las matrices enteras separables se aplican en dos pasadas y las muy
+        grandes con la FFT, ambas de forma exacta. Las demás se suman con el
+        núcleo compilado en el orden original del filtro, así que se obtienen
+        los mismos redondeos también con decimales
+
+        origen: ndarray. Arreglo (alto, ancho, 3) de la imagen
+        matriz: ndarray. Matriz del filtro
+        factor: double. Valor del factor para aplicar el filtro
+        brillo: double. Valor del brillo
+        hilos: int. Número de hilos a usar
+        reporte: _Reporte. Reporte de avance en filas terminadas, solo lo
+                 usa el núcleo compilado'''
+
+    origen = np.asarray(origen)[:, :, :3]
+    d_y = _desplazamientos(matriz.shape[0])
+    d_x = _desplazamientos(matriz.shape[1])
+
+    if np.issubdtype(matriz.dtype, np.integer):
+        tipo = np.int32 if 255 * np.abs(matriz).sum() < 2 ** 31 else np.int64
+        separable = _factores_separables(matriz)
+        num_coef = np.count_nonzero(matriz)
+
+        if separable is not None and len(separable[0]) + len(separable[1]) < num_coef:
+            suma = _convolucion_separable(origen, separable[0], separable[1], tipo)
+            return np.clip(factor * suma + brillo, 0, 255).astype(np.uint8)
+        elif num_coef > UMBRAL_FFT:
+            suma = _convolucion_fft(origen, matriz)
+            return np.clip(factor * suma + brillo, 0, 255).astype(np.uint8)
+
+    return _convolucion_compilada(origen, matriz, d_y, d_x, factor, brillo, hilos, reporte)
+
+
+registrar_filtro_convolucion('Suave',
+                             [[0.0,0.2,0.0],
+                              [0.2,0.2,0.2],
+                              [0.0,0.2,0.0]])
+registrar_filtro_convolucion('Fuerte',
+                             [[0,0,1,0,0],
+                              [0,1,1,1,0],
+                              [1,1,1,1,1],
+                              [0,1,1,1,0],
+                              [0,0,1,0,0]], 1.0 / 13.0)
+registrar_filtro_convolucion('Motion Blur',
+                             [[1, 0, 0, 0, 0, 0, 0, 0, 0],
+                              [0, 1, 0, 0, 0, 0, 0, 0, 0],
+                              [0, 0, 1, 0, 0, 0, 0, 0, 0],
+                              [0, 0, 0, 1, 0, 0, 0, 0, 0],
+                              [0, 0, 0, 0, 1, 0, 0, 0, 0],
+                              [0, 0, 0, 0, 0, 1, 0, 0, 0],
+                              [0, 0, 0, 0, 0, 0, 1, 0, 0],
+                              [0, 0, 0, 0, 0, 0, 0, 1, 0],
+                              [0, 0, 0, 0, 0, 0, 0, 0, 1]], 1.0 / 9.0)
+registrar_filtro_convolucion('Encontrar bordes',
+                             [[-1,  0, 0,  0,  0],
+                              [ 0, -2, 0,  0,  0],
+                              [ 0,  0, 6,  0,  0],
+                              [ 0,  0, 0, -2,  0],
+                              [ 0,  0, 0,  0, -1]])
+registrar_filtro_convolucion('Sharpen',
+                             [[-1, -1, -1],
+                              [-1,  9, -1],
+                              [-1, -1, -1]])
+registrar_filtro_convolucion('Emboss',
+                             [[-1, -1, -1, -1, 0],
+                              [-1, -1, -1,  0, 1],
+                              [-1, -1,  0,  1, 1],
+                              [-1,  0,  1,  1, 1],
+                              [ 0,  1,  1,  1, 1]], 1.0, 128.0)
+
+
+def promedios_bloques(arr, int num_columnas, int num_filas):
+    ''' Función que calcula el color promedio de todas las regiones de la
+        cuadricula con una reducción por bloques en cada eje. Las regiones
+        del borde pueden ser más pequeñas
+
+        arr: ndarray. Arreglo (alto, ancho, canales) de la imagen
+        num_columnas: int. Ancho de la región
+        num_filas: int. Alto de la región'''
+
+    alto, ancho = arr.shape[0], arr.shape[1]
+    filas = np.arange(0, alto, num_filas)
+    columnas = np.arange(0, ancho, num_columnas)
+
+    sumas = np.add.reduceat(arr[:, :, :3], filas, axis=0, dtype=np.int64)
+    sumas = np.add.reduceat(sumas, columnas, axis=1)
+
+    return sumas // _pixeles_cuadricula(filas, columnas, alto, ancho)
+
+
+def _pixeles_cuadricula(filas, columnas, int alto, int ancho):
+    ''' Función que regresa el número de pixeles de cada región de la
+        cuadricula como arreglo (filas, columnas, 1)
+
+        filas: ndarray. Fila inicial de cada región
+        columnas: ndarray. Columna inicial de cada región
+        alto: int. Alto de la imagen
+        ancho: int. Ancho de la imagen'''
+
+    return np.outer(np.diff(np.append(filas, alto)),
+                    np.diff(np.append(columnas, ancho)))[:, :, None]
+
+
+def imagen_integral(arr):
+    ''' Función que calcula la imagen integral (tabla de áreas sumadas) de
+        cada canal. Regresa un arreglo (alto + 1, ancho + 1, 3) uint32 donde
+        la posición (y, x) es la suma de los pixeles anteriores a (y, x)
+
+        La tabla se acumula con aritmética módulo 2^32, así que la suma de
+        cualquier rectángulo de menos de 2^32 / 255 pixeles es exacta
+
+        arr: ndarray. Arreglo (alto, ancho, canales) de la imagen'''
+
+    integral = np.zeros((arr.shape[0] + 1, arr.shape[1] + 1, 3), dtype=np.uint32)
+
+    np.cumsum(arr[:, :, :3], axis=0, dtype=np.uint32, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, dtype=np.uint32, out=integral[1:, 1:])
+
+    return integral
+
+
+def _sumas_integral(integral, filas_ini, columnas_ini, filas_fin, columnas_fin):
+    ''' Función que regresa la suma de cada canal de los rectángulos
+        indicados usando la imagen integral
+
+        integral: ndarray. Imagen integral de imagen_integral
+        filas_ini, columnas_ini: ndarray. Esquina superior izquierda
+        filas_fin, columnas_fin: ndarray. Esquina inferior derecha (exclusiva)'''
+
+    return (integral[filas_fin, columnas_fin] - integral[filas_ini, columnas_fin] -
+            integral[filas_fin, columnas_ini] + integral[filas_ini, columnas_ini]).astype(np.int64)
+
+
+# Máximo de pixeles de un rectángulo cuya suma es exacta con la imagen integral
+MAX_PIXELES_INTEGRAL = (2 ** 32 - 1) // 255
+
+# Directorio de los archivos temporales de las imágenes mapeadas en memoria,
+# None para usar el directorio temporal del sistema
+DIR_MAPEO = None
+
+# Filas que se copian a la vez al decodificar una imagen mapeada en memoria
+FILAS_MAPEO = 256
+
+
+def arreglo_mapeado(forma):
+    ''' Función que crea un arreglo uint8 respaldado por un archivo temporal
+        mapeado en memoria. El sistema operativo puede sacar de la memoria
+        las partes que no se estén usando, y el archivo se borra al liberar
+        el arreglo
+
+        forma: tuple. Forma del arreglo'''
+
+    archivo = tempfile.TemporaryFile(dir=DIR_MAPEO)
+
+    return np.memmap(archivo, dtype=np.uint8, mode='w+', shape=forma)
+
+
+def decodificar_mapeado(img_pil):
+    ''' Función que decodifica una imagen de PIL a un arreglo mapeado en
+        memoria, copiando bandas de FILAS_MAPEO filas para no tener al mismo
+        tiempo una segunda copia completa en la memoria
+
+        img_pil: Image. Imagen a decodificar'''
+
+    cdef int y
+    cdef int ancho = img_pil.width
+    cdef int alto = img_pil.height
+
+    primera = np.asarray(img_pil.crop((0, 0, ancho, min(alto, FILAS_MAPEO))))
+    destino = arreglo_mapeado((alto,) + primera.shape[1:])
+    destino[:len(primera)] = primera
+
+    for y in range(FILAS_MAPEO, alto, FILAS_MAPEO):
+        destino[y:y + FILAS_MAPEO] = np.asarray(img_pil.crop((0, y, ancho, min(alto, y + FILAS_MAPEO))))
+
+    return destino
+
+
+# Tamaño máximo de la imagen que se muestra en la interfaz
+ANCHO_VISTA = 720
+ALTO_VISTA = 450
+
+
+def tamanio_vista(int ancho, int alto):
+    ''' Función que regresa el tamaño (ancho, alto) con el que se muestra una
+        imagen en la interfaz. Se reduce primero para caber en 700x700 y
+        luego en cuadros 100 pixeles más chicos cada vez, hasta caber en
+        ANCHO_VISTA x ALTO_VISTA
+
+        ancho: int. Ancho de la imagen
+        alto: int. Alto de la imagen'''
+
+    cdef int lado = 700
+    cdef double escala
+
+    while ancho > ANCHO_VISTA or alto > ALTO_VISTA:
+        escala = min(lado / alto, lado / ancho)
+        ancho = int(ancho * escala)
+        alto = int(alto * escala)
+        lado -= 100
+
+    return ancho, alto
+
+
+def codificar_vista(img_pil):
+    ''' Función que codifica una imagen para mostrarla en la interfaz.
+        Regresa los bytes de un PNG sin compresión, que se genera mucho más
+        rápido que uno comprimido
+
+        img_pil: Image. Imagen a codificar'''
+
+    bio = io.BytesIO()
+
+    with etapa('codificar_vista', 'salida', img_pil.width * img_pil.height):
+        img_pil.save(bio,format = "PNG",compress_level = 0)
+
+    return bio.getvalue()
+
+
+# Imágenes de puntos de cada tipo de semitono, de la más oscura a la más clara
+IMAGENES_SEMITONO = {
+    0: ['./resources/img/b%d.jpg' % i for i in range(9, -1, -1)],
+    1: ['./resources/img/c%d.jpg' % i for i in range(4, -1, -1)],
+    2: ['./resources/img/a%d.jpg' % i for i in range(1, 11)],
+}
+
+# Tonos en los que cambia la imagen de puntos de cada tipo de semitono
+LIMITES_SEMITONO = {
+    0: [26, 52, 77, 103, 128, 154, 179, 205, 230],
+    1: [52, 103, 154, 205],
+    2: [26, 52, 77, 103, 128, 154, 179, 205, 230],
+}
+
+# Memoria máxima para los atlas guardados, en bytes
+MEMORIA_ATLAS = 64 * 2 ** 20
+
+_atlas = OrderedDict()  # (rutas, ancho, alto) -> atlas, del menos al más usado
+_memoria_atlas = 0
+
+
+def cargar_atlas(rutas, int ancho, int alto):
+    ''' Función que carga las imágenes escaladas a ancho x alto en un solo
+        arreglo (imagenes, alto, ancho, 3) uint8
+
+        rutas: list. Rutas de las imágenes
+        ancho: int. Ancho de cada imagen
+        alto: int. Alto de cada imagen'''
+
+    with etapa('cargar_atlas', 'entrada', len(rutas) * ancho * alto):
+        atlas = np.empty((len(rutas), alto, ancho, 3), dtype=np.uint8)
+
+        for i, ruta in enumerate(rutas):
+            with Image.open(ruta) as img:
+                if img.size != (ancho, alto):
+                    img = img.resize((ancho, alto), Image.LANCZOS)
+
+                atlas[i] = np.asarray(img.convert('RGB'))
+
+    return atlas
+
+
+def atlas_imagenes(rutas, int ancho, int alto):
+    ''' Función que regresa el atlas de las imágenes escaladas a ancho x
+        alto. Cada atlas se carga y escala una sola vez; cuando ocupan más
+        de MEMORIA_ATLAS se descartan los usados hace más tiempo
+
+        rutas: list. Rutas de las imágenes, que no deben cambiar
+        ancho: int. Ancho de cada imagen
+        alto: int. Alto de cada imagen'''
+
+    global _memoria_atlas
+
+    clave = (tuple(rutas), ancho, alto)
+
+    if clave in _atlas:
+        _atlas.move_to_end(clave)
+        return _atlas[clave]
+
+    atlas = cargar_atlas(rutas, ancho, alto)
+    atlas.flags.writeable = False
+
+    if atlas.nbytes <= MEMORIA_ATLAS:
+        _atlas[clave] = atlas
+        _memoria_atlas += atlas.nbytes
+
+        while _memoria_atlas > MEMORIA_ATLAS:
+            _, descartado = _atlas.popitem(last = False)
+            _memoria_atlas -= descartado.nbytes
+
+    return atlas
+
+
+def mosaico_atlas(atlas, indices):
+    ''' Función que arma una imagen con una cuadricula de imágenes del
+        atlas en una sola operación. Regresa un arreglo
+        (filas * alto, columnas * ancho, 3) uint8
+
+        atlas: ndarray. Arreglo (imagenes, alto, ancho, 3) de cargar_atlas
+        indices: ndarray. Arreglo (filas, columnas) con la imagen de cada celda'''
+
+    filas, columnas = indices.shape
+    _, alto, ancho, canales = atlas.shape
+
+    return atlas[indices].transpose(0, 2, 1, 3, 4).reshape(filas * alto, columnas * ancho, canales)
+
+
+# Número máximo de colores en cada hoja del árbol k-d
+COLORES_HOJA = 8
+
+
+def arbol_colores(colores, int hoja = COLORES_HOJA):
+    ''' Función que construye un árbol k-d balanceado de los colores para
+        buscar el más cercano a muchos colores a la vez. Regresa una tupla
+        (puntos, orden, nodos, cortes): los colores reordenados por hoja, el
+        índice original de cada uno, una fila (inicio, fin, eje, izquierdo,
+        derecho) por nodo con eje -1 en las hojas y el valor de corte de
+        cada nodo
+
+        colores: ndarray. Arreglo (n, 3) con los colores
+        hoja: int. Número máximo de colores en cada hoja'''
+
+    puntos = np.asarray(colores, dtype=np.float64).reshape(-1, 3)
+    orden = np.arange(len(puntos), dtype=np.intp)
+    nodos = []
+    cortes = []
+
+    def construye(Py_ssize_t ini, Py_ssize_t fin):
+        nodo = len(nodos)
+        nodos.append([ini, fin, -1, -1, -1])
+        cortes.append(0.0)
+
+        if fin - ini <= hoja:
+            return nodo
+
+        sub = orden[ini:fin]
+        rangos = np.ptp(puntos[sub], axis=0)
+        eje = int(np.argmax(rangos))
+
+        # Si todos los colores son iguales no se pueden separar
+        if rangos[eje] == 0:
+            return nodo
+
+        medio = (fin - ini) // 2
+        orden[ini:fin] = sub[np.argpartition(puntos[sub, eje], medio)]
+
+        cortes[nodo] = puntos[orden[ini + medio], eje]
+        nodos[nodo][2] = eje
+        nodos[nodo][3] = construye(ini, ini + medio)
+        nodos[nodo][4] = construye(ini + medio, fin)
+
+        return nodo
+
+    construye(0, len(puntos))
+
+    return (np.ascontiguousarray(puntos[orden]), orden, np.array(nodos, dtype=np.intp),
+            np.array(cortes, dtype=np.float64))
+
+
+cdef enum:
+    # Profundidad máxima de la pila de la búsqueda en el árbol k-d; el árbol
+    # está balanceado, así que su profundidad es a lo más log2 de los colores
+    MAX_PILA = 128
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _vecinos_banda(const double[:, ::1] puntos, const Py_ssize_t[::1] orden, const Py_ssize_t[:, ::1] nodos,
+                         const double[::1] cortes, const double[:, ::1] consultas, Py_ssize_t[::1] resultado,
+                         Py_ssize_t ini, Py_ssize_t fin) noexcept nogil:
+    ''' Núcleo de la búsqueda del color más cercano de las consultas
+        [ini, fin). Se baja primero por el lado de la consulta y solo se
+        visita el otro lado si el plano de corte está más cerca que el mejor
+        color encontrado'''
+
+    cdef Py_ssize_t pila[MAX_PILA]
+    cdef double cota[MAX_PILA]
+    cdef Py_ssize_t q, k, nodo, cerca, lejos, mejor, indice
+    cdef int tope, eje
+    cdef double distancia, mejor_distancia, diferencia, d_r, d_g, d_b
+
+    for q in range(ini, fin):
+        mejor = -1
+        mejor_distancia = 1e300
+        tope = 1
+        pila[0] = 0
+        cota[0] = 0
+
+        while tope > 0:
+            tope -= 1
+            nodo = pila[tope]
+
+            # Con la misma distancia se visita para quedarse con el menor índice
+            if cota[tope] > mejor_distancia:
+                continue
+
+            eje = nodos[nodo, 2]
+
+            if eje < 0:
+                for k in range(nodos[nodo, 0], nodos[nodo, 1]):
+                    d_r = puntos[k, 0] - consultas[q, 0]
+                    d_g = puntos[k, 1] - consultas[q, 1]
+                    d_b = puntos[k, 2] - consultas[q, 2]
+                    distancia = d_r * d_r + d_g * d_g + d_b * d_b
+                    indice = orden[k]
+
+                    if distancia < mejor_distancia or (distancia == mejor_distancia and indice < mejor):
+                        mejor_distancia = distancia
+                        mejor = indice
+                continue
+
+            diferencia = consultas[q, eje] - cortes[nodo]
+
+            if diferencia <= 0:
+                cerca, lejos = nodos[nodo, 3], nodos[nodo, 4]
+            else:
+                cerca, lejos = nodos[nodo, 4], nodos[nodo, 3]
+
+            pila[tope] = lejos
+            cota[tope] = diferencia * diferencia
+            pila[tope + 1] = cerca
+            cota[tope + 1] = 0
+            tope += 2
+
+        resultado[q] = mejor
+
+
+def _vecinos_banda_py(const double[:, ::1] puntos, const Py_ssize_t[::1] orden, const Py_ssize_t[:, ::1] nodos,
+                      const double[::1] cortes, const double[:, ::1] consultas, Py_ssize_t[::1] resultado,
+                      Py_ssize_t ini, Py_ssize_t fin):
+    ''' Función que ejecuta el núcleo de la búsqueda en el árbol k-d sin el GIL'''
+
+    with nogil:
+        _vecinos_banda(puntos, orden, nodos, cortes, consultas, resultado, ini, fin)
+
+
+def vecinos_cercanos(arbol, consultas, int hilos = 1):
+    ''' Función que regresa, para cada color de las consultas, el índice
+        del color más cercano (distancia euclidiana) del árbol. Si hay
+        varios a la misma distancia se toma el de menor índice
+
+        arbol: tuple. Árbol k-d de arbol_colores
+        consultas: ndarray. Arreglo (..., 3) con los colores a buscar
+        hilos: int. Número de hilos a usar'''
+
+    puntos, orden, nodos, cortes = arbol
+    consultas = np.asarray(consultas)
+    planas = np.ascontiguousarray(consultas.reshape(-1, 3), dtype=np.float64)
+    resultado = np.full(len(planas), -1, dtype=np.intp)
+
+    if len(puntos) > 0:
+        _ejecutar_en_bandas(_vecinos_banda_py, len(planas), hilos, puntos, orden, nodos, cortes, planas, resultado)
+
+    return resultado.reshape(consultas.shape[:-1])
+
+
+# Archivos del índice de una biblioteca de mosaicos
+INDICE_BIBLIOTECA = 'indice.json'
+MINIATURAS_BIBLIOTECA = 'miniaturas.npy'
+COLORES_BIBLIOTECA = 'colores.npy'
+VERSION_BIBLIOTECA = 1
+
+# Número máximo de bibliotecas abiertas al mismo tiempo
+MAX_BIBLIOTECAS = 4
+
+_bibliotecas = OrderedDict()  # (ruta, fecha del índice) -> BibliotecaMosaicos
+
+
+class BibliotecaMosaicos:
+    ''' Biblioteca de imágenes para los fotomosaicos, leída de un índice
+        escrito por trent_biblioteca. Las miniaturas se mapean en memoria,
+        así que solo se leen del disco las que se usan; el árbol k-d de los
+        colores promedio se construye la primera vez que se busca
+
+        ruta: str. Directorio del índice'''
+
+    def __init__(self, ruta):
+        with open(os.path.join(ruta, INDICE_BIBLIOTECA)) as archivo:
+            datos = json.load(archivo)
+
+        if datos.get('version') != VERSION_BIBLIOTECA:
+            raise ValueError("El índice de la biblioteca es de otra versión, hay que volver a crearlo!")
+
+        self.ruta = ruta
+        self.ancho = datos['ancho']
+        self.alto = datos['alto']
+        self.rutas = datos['rutas']
+        self.colores = np.load(os.path.join(ruta, COLORES_BIBLIOTECA))
+        self.miniaturas = np.load(os.path.join(ruta, MINIATURAS_BIBLIOTECA), mmap_mode='r')
+        self.arbol = None
+
+        if len(self.colores) == 0:
+            raise ValueError("La biblioteca no tiene imágenes!")
+
+    def __len__(self):
+        return len(self.colores)
+
+    def elegir(self, colores, int hilos = 1):
+        ''' Función que regresa el índice de la imagen de color promedio más
+            cercano a cada color
+
+            colores: ndarray. Arreglo (..., 3) con los colores
+            hilos: int. Número de hilos a usar'''
+
+        if self.arbol is None:
+            self.arbol = arbol_colores(self.colores)
+
+        return vecinos_cercanos(self.arbol, colores, hilos)
+
+    def mosaico(self, promedios, int hilos = 1, int ancho = 0, int alto = 0):
+        ''' Función que arma el fotomosaico con la imagen más parecida a cada
+            celda. Regresa un arreglo (filas * alto, columnas * ancho, 3)
+
+            promedios: ndarray. Arreglo (filas, columnas, 3) con el color de
+                       cada celda
+            hilos: int. Número de hilos a usar
+            ancho: int. Ancho de cada imagen, 0 para el de las miniaturas
+            alto: int. Alto de cada imagen, 0 para el de las miniaturas'''
+
+        indices = self.elegir(promedios, hilos)
+        ancho = ancho or self.ancho
+        alto = alto or self.alto
+
+        if ancho == self.ancho and alto == self.alto:
+            return mosaico_atlas(self.miniaturas, indices)
+
+        # Solo se escalan las miniaturas que se usan
+        usadas, indices = np.unique(indices, return_inverse=True)
+        atlas = np.empty((len(usadas), alto, ancho, 3), dtype=np.uint8)
+
+        for i, usada in enumerate(usadas):
+            atlas[i] = np.asarray(Image.fromarray(self.miniaturas[usada]).resize((ancho, alto), Image.LANCZOS))
+
+        return mosaico_atlas(atlas, indices.reshape(promedios.shape[:2]))
+
+
+def abrir_biblioteca(ruta):
+    ''' Función que regresa la biblioteca de mosaicos del índice. Cada
+        índice se abre una sola vez mientras no cambie; se guardan las
+        últimas MAX_BIBLIOTECAS usadas
+
+        ruta: str. Directorio del índice'''
+
+    clave = (os.path.abspath(ruta), os.path.getmtime(os.path.join(ruta, INDICE_BIBLIOTECA)))
+
+    if clave in _bibliotecas:
+        _bibliotecas.move_to_end(clave)
+        return _bibliotecas[clave]
+
+    biblioteca = BibliotecaMosaicos(ruta)
+    _bibliotecas[clave] = biblioteca
+
+    if len(_bibliotecas) > MAX_BIBLIOTECAS:
+        _bibliotecas.popitem(last = False)
+
+    return biblioteca
+
+
+# Letras de los filtros de texto de la más oscura a la más clara y los
+# tonos en los que cambia la letra
+LETRAS_16 = 'MNH#QUAD0Y2$%+. '
+LIMITES_16 = [16, 32, 48, 64, 80, 96, 112, 128, 144, 160, 176, 192, 210, 226, 240]
+LETRAS_NAIPES = 'JIHGFEDCBA'
+LIMITES_NAIPES = [26, 51, 76, 101, 126, 151, 176, 201, 226]
+LIMITES_DOMINO = [37, 73, 109, 145, 181, 217]
+
+# Fichas de dominó de cada opción: opción -> (fichas izquierdas, fichas derechas)
+FICHAS_DOMINO = {
+    'db': ('6543210', '^%$#@!)'),
+    'dn': ('0123456', ')!@#$%^'),
+}
+
+_fuentes = {}  # (ruta, tamaño) -> ImageFont
+_mascaras = OrderedDict()  # (ruta, tamaño, texto) -> (mascara, dy, dx), de la menos a la más usada
+
+# Número máximo de máscaras de texto guardadas
+MAX_MASCARAS = 1024
+
+
+def cargar_fuente(ruta, int tamanio):
+    ''' Función que regresa la fuente de letra, cargándola solo la primera
+        vez que se pide
+
+        ruta: str. Ruta del archivo de la fuente
+        tamanio: int. Tamaño de la fuente'''
+
+    clave = (ruta, tamanio)
+
+    if clave not in _fuentes:
+        _fuentes[clave] = ImageFont.truetype(ruta, tamanio)
+
+    return _fuentes[clave]
+
+
+def mascara_texto(ruta, int tamanio, texto):
+    ''' Función que regresa la máscara del texto como la dibuja
+        ImageDraw.text, recortada a sus pixeles visibles, y su posición
+        respecto al punto donde se dibuja. Regresa una tupla (mascara, dy, dx).
+        Cada texto se dibuja una sola vez y se guardan los últimos
+        MAX_MASCARAS usados
+
+        ruta: str. Ruta del archivo de la fuente
+        tamanio: int. Tamaño de la fuente
+        texto: str. Texto a dibujar, puede tener varias líneas'''
+
+    clave = (ruta, tamanio, texto)
+
+    if clave in _mascaras:
+        _mascaras.move_to_end(clave)
+        return _mascaras[clave]
+
+    with etapa('dibujar_texto', 'entrada'):
+        fnt = cargar_fuente(ruta, tamanio)
+        izq, arr, der, aba = ImageDraw.Draw(Image.new('L', (1, 1))).textbbox((0, 0), texto, font=fnt)
+        margen = 4
+
+        img = Image.new('L', (der - izq + 2 * margen, aba - arr + 2 * margen), 0)
+        ImageDraw.Draw(img).text((margen - izq, margen - arr), texto, fill=255, font=fnt)
+
+        caja = img.getbbox()
+
+        if caja is None:
+            mascara = (np.zeros((0, 0), dtype=np.uint8), 0, 0)
+        else:
+            mascara = (np.array(img.crop(caja)), caja[1] - margen + arr, caja[0] - margen + izq)
+
+    mascara[0].flags.writeable = False
+    _mascaras[clave] = mascara
+
+    if len(_mascaras) > MAX_MASCARAS:
+        _mascaras.popitem(last = False)
+
+    return mascara
+
+
+def marca_de_agua_arreglo(arreglo, texto, estilo, int x, int y):
+    ''' Función que aplica la marca de agua al arreglo en su lugar: mezcla
+        el texto negro con la imagen con la opacidad del estilo, solo en los
+        pixeles que cubre el texto. Como la máscara del texto se guarda, la
+        misma marca en muchas imágenes solo cuesta la mezcla de su región
+
+        arreglo: ndarray. Arreglo (alto, ancho, canales) de la imagen
+        texto: str. Texto de la marca de agua
+        estilo: tuple. Tupla con la ruta y el tamaño de la fuente y la opacidad
+        x: int. Coordenada x en la imagen
+        y: int. Coordenada y en la imagen'''
+
+    mascara, dy, dx = mascara_texto(estilo[0], estilo[1], texto)
+    alpha = estilo[2] / 100
+
+    y_0, x_0 = y + dy, x + dx
+    y_ini, x_ini = max(y_0, 0), max(x_0, 0)
+    y_fin = min(y_0 + mascara.shape[0], arreglo.shape[0])
+    x_fin = min(x_0 + mascara.shape[1], arreglo.shape[1])
+
+    if y_ini >= y_fin or x_ini >= x_fin:
+        return
+
+    m = mascara[y_ini - y_0:y_fin - y_0, x_ini - x_0:x_fin - x_0]
+    region = arreglo[y_ini:y_fin, x_ini:x_fin, :3]
+
+    # El texto negro sobre blanco vale 255 - m en los tres canales
+    mezcla = (region * alpha + (255 - m)[:, :, None].astype(np.float64) * (1.0 - alpha)).astype(np.uint8)
+    visible = m > 0
+    region[visible] = mezcla[visible]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _compone_glifos(unsigned char[:, :, ::1] lienzo, const unsigned char[::1] mascaras,
+                          const Py_ssize_t[:, ::1] glifos, const Py_ssize_t[:, ::1] celdas,
+                          const unsigned char[:, ::1] colores) noexcept nogil:
+    ''' Núcleo que dibuja la letra de cada celda en orden, mezclándola con
+        lo que ya está dibujado igual que ImageDraw.text (las letras pueden
+        salirse de su celda). glifos tiene (inicio, alto, ancho, dy, dx) de
+        cada máscara en mascaras y celdas tiene (y, x, glifo) de cada celda'''
+
+    cdef Py_ssize_t alto = lienzo.shape[0]
+    cdef Py_ssize_t ancho = lienzo.shape[1]
+    cdef Py_ssize_t n, g, a, b, x, y, z, ini, alto_g, ancho_g, y_0, x_0
+    cdef unsigned int m, t
+
+    for n in range(celdas.shape[0]):
+        g = celdas[n, 2]
+        ini = glifos[g, 0]
+        alto_g = glifos[g, 1]
+        ancho_g = glifos[g, 2]
+        y_0 = celdas[n, 0] + glifos[g, 3]
+        x_0 = celdas[n, 1] + glifos[g, 4]
+
+        for a in range(alto_g):
+            y = y_0 + a
+
+            if y < 0 or y >= alto:
+                continue
+
+            for b in range(ancho_g):
+                x = x_0 + b
+                m = mascaras[ini + a * ancho_g + b]
+
+                if m == 0 or x < 0 or x >= ancho:
+                    continue
+
+                for z in range(3):
+                    t = lienzo[y, x, z] * (255 - m) + colores[n, z] * m + 128
+                    lienzo[y, x, z] = ((t >> 8) + t) >> 8
+
+
+def dibuja_letras(lienzo, ruta, int tamanio, letras, indices, colores, int num_columnas, int num_filas):
+    ''' Función que dibuja una letra en la esquina de cada celda de la
+        cuadricula, en el orden en que las dibujaría ImageDraw.text recorriendo
+        la cuadricula por filas, con el mismo resultado
+
+        lienzo: ndarray. Arreglo (alto, ancho, 3) uint8 donde se dibuja
+        ruta: str. Ruta del archivo de la fuente
+        tamanio: int. Tamaño de la fuente
+        letras: str. Letras que se pueden dibujar
+        indices: ndarray. Arreglo (filas, columnas) con la letra de cada celda
+        colores: ndarray. Arreglo (filas, columnas, 3) con el color de cada celda
+        num_columnas: int. Ancho de cada celda
+        num_filas: int. Alto de cada celda'''
+
+    mascaras = [mascara_texto(ruta, tamanio, letra) for letra in letras]
+    inicios = np.cumsum([0] + [m.size for m, _, _ in mascaras])
+    glifos = np.array([(inicios[i], m.shape[0], m.shape[1], dy, dx) for i, (m, dy, dx) in enumerate(mascaras)],
+                      dtype=np.intp)
+
+    filas, columnas = indices.shape
+    celdas = np.empty((filas * columnas, 3), dtype=np.intp)
+    celdas[:, 0] = np.repeat(np.arange(filas) * num_filas, columnas)
+    celdas[:, 1] = np.tile(np.arange(columnas) * num_columnas, filas)
+    celdas[:, 2] = indices.ravel()
+
+    cdef unsigned char[:, :, ::1] destino = lienzo
+    cdef const unsigned char[::1] plano = np.concatenate([m.ravel() for m, _, _ in mascaras] +
+                                                         [np.zeros(1, dtype=np.uint8)])
+    cdef const Py_ssize_t[:, ::1] tabla = glifos
+    cdef const Py_ssize_t[:, ::1] posiciones = celdas
+    cdef const unsigned char[:, ::1] tintas = np.ascontiguousarray(colores, dtype=np.uint8).reshape(-1, 3)
+
+    with nogil:
+        _compone_glifos(destino, plano, tabla, posiciones, tintas)
+
+
+def letras_celdas(opcion, promedios, texto = None):
+    ''' Función que elige la letra y el color de cada celda para la opción
+        de filtros_letras. Regresa una tupla (letras, indices, colores) para
+        dibuja_letras
+
+        opcion: str. Opción seleccionada por el usuario
+        promedios: ndarray. Arreglo (filas, columnas, 3) con el color
+                   promedio de cada celda
+        texto: str. Texto personalizado ingresado por el usuario'''
+
+    filas, columnas = promedios.shape[0], promedios.shape[1]
+    cont = np.arange(filas * columnas).reshape(filas, columnas)
+    tonos = promedios[:, :, 0]
+    negro = np.zeros_like(promedios)
+
+    if opcion.startswith('m'):
+        return 'M', np.zeros((filas, columnas), dtype=np.intp), promedios
+    elif opcion == 'ds-t':
+        return LETRAS_16, np.searchsorted(LIMITES_16, tonos, side='right'), negro
+    elif opcion == 'ds-c':
+        return LETRAS_16, np.searchsorted(LIMITES_16, promedios.sum(axis=2) // 3, side='right'), promedios
+    elif opcion == 'ds-g':
+        return LETRAS_16, np.searchsorted(LIMITES_16, tonos, side='right'), promedios
+    elif opcion == 'tp-cl':
+        return texto, cont % len(texto), promedios
+    elif opcion in FICHAS_DOMINO:
+        izquierdas, derechas = FICHAS_DOMINO[opcion]
+        indices = np.searchsorted(LIMITES_DOMINO, tonos, side='right') + len(izquierdas) * (cont % 2)
+        return izquierdas + derechas, indices, negro
+    elif opcion == 'nps':
+        return LETRAS_NAIPES, np.searchsorted(LIMITES_NAIPES, tonos, side='right'), negro
+
+    raise ValueError("Esa opción de letras no existe!")
+
+
+# Versión de los filtros. Se cambia cada vez que algún filtro cambia su
+# resultado, para no usar los resultados guardados por versiones anteriores
+VERSION_FILTROS = 1
+
+# Tamaño máximo por omisión de la cache de resultados
+TAMANIO_CACHE = 1024 * 2 ** 20
+
+# Fracción del tamaño máximo que queda ocupada después de sacar resultados
+FRACCION_CACHE = 0.9
+
+# Segundos después de los cuales un archivo temporal de la cache se toma
+# como abandonado por un proceso que terminó a medias
+VIDA_TEMPORALES = 3600
+
+
+class CacheResultados:
+    ''' Cache en disco de los resultados de los filtros, compartida entre
+        sesiones y procesos.
+
+        Cada resultado se guarda en un archivo .npy cuyo nombre es el hash
+        de los pixeles de la imagen original, del filtro con sus argumentos
+        y de VERSION_FILTROS. Los archivos se escriben en un temporal que se
+        renombra al terminar, así que otro proceso nunca lee un resultado a
+        medias. Al pasar del tamaño máximo se borran los resultados usados
+        hace más tiempo
+
+        ruta: str. Directorio de la cache
+        tamanio_maximo: int. Bytes máximos que ocupan los resultados'''
+
+    def __init__(self, ruta, tamanio_maximo = TAMANIO_CACHE):
+        os.makedirs(ruta, exist_ok=True)
+
+        self.ruta = ruta
+        self.tamanio_maximo = tamanio_maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self.escrituras = 0
+        self.expulsados = 0
+        self.tamanio = sum(tamanio for _, tamanio, _ in self.__archivos())
+
+    def clave(self, huella, filtro, args, kwargs):
+        ''' Función que regresa la clave del resultado del filtro
+
+            huella: bytes. Hash de los pixeles de la imagen original
+            filtro: str. Nombre del filtro
+            args: tuple. Argumentos del filtro
+            kwargs: dict. Argumentos con nombre del filtro'''
+
+        descripcion = repr((VERSION_FILTROS, filtro, args, sorted(kwargs.items())))
+
+        return hashlib.blake2b(huella + descripcion.encode('utf-8'), digest_size=20).hexdigest()
+
+    def leer(self, clave, mapear = False):
+        ''' Función que regresa el resultado guardado con la clave, None si
+            no está en la cache
+
+            clave: str. Clave de clave()
+            mapear: bool. Valor que indica si mapear el archivo en memoria
+                    en lugar de leerlo completo'''
+
+        archivo = self.__archivo(clave)
+
+        try:
+            arreglo = np.load(archivo, mmap_mode='c' if mapear else None)
+            # La fecha de modificación marca cuándo se usó por última vez
+            os.utime(archivo)
+        except (OSError, ValueError):
+            self.fallos += 1
+            return None
+
+        self.aciertos += 1
+
+        return arreglo
+
+    def escribir(self, clave, arreglo):
+        ''' Función que guarda el resultado con la clave. Si no se puede
+            escribir en el directorio la cache solo no lo guarda
+
+            clave: str. Clave de clave()
+            arreglo: ndarray. Resultado del filtro'''
+
+        archivo = self.__archivo(clave)
+        directorio = os.path.dirname(archivo)
+
+        try:
+            os.makedirs(directorio, exist_ok=True)
+            descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+        except OSError:
+            return
+
+        try:
+            with os.fdopen(descriptor, 'wb') as salida:
+                np.save(salida, arreglo)
+
+            os.replace(temporal, archivo)
+        except OSError:
+            if os.path.exists(temporal):
+                os.unlink(temporal)
+            return
+
+        self.escrituras += 1
+        self.tamanio += os.path.getsize(archivo)
+
+        if self.tamanio > self.tamanio_maximo:
+            self.__reducir()
+
+    def vaciar(self):
+        ''' Función que borra todos los resultados de la cache'''
+
+        for archivo, _, _ in self.__archivos():
+            self.__borrar(archivo)
+
+        self.tamanio = 0
+
+    def estadisticas(self):
+        ''' Función que regresa los aciertos, fallos, escrituras y
+            resultados sacados de la cache en este proceso, y los bytes que
+            ocupa la cache'''
+
+        consultas = self.aciertos + self.fallos
+
+        return {'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+                'escrituras': self.escrituras,
+                'expulsados': self.expulsados,
+                'tamanio': self.tamanio,
+                'tamanio_maximo': self.tamanio_maximo}
+
+    def __archivo(self, clave):
+        return os.path.join(self.ruta, clave[:2], clave + '.npy')
+
+    def __archivos(self):
+        ''' Función que regresa una lista de tuplas (ruta, tamaño, último
+            uso) de los resultados guardados y borra los temporales
+            abandonados'''
+
+        archivos = []
+        limite = time.time() - VIDA_TEMPORALES
+
+        for raiz, _, nombres in os.walk(self.ruta):
+            for nombre in nombres:
+                archivo = os.path.join(raiz, nombre)
+
+                try:
+                    datos = os.stat(archivo)
+                except OSError:
+                    continue
+
+                if nombre.endswith('.npy'):
+                    archivos.append((archivo, datos.st_size, datos.st_mtime))
+                elif nombre.endswith('.tmp') and datos.st_mtime < limite:
+                    self.__borrar(archivo)
+
+        return archivos
+
+    def __reducir(self):
+        # Otros procesos también escriben en la cache, así que el tamaño se
+        # vuelve a medir del disco antes de borrar
+        archivos = sorted(self.__archivos(), key=lambda datos: datos[2])
+        self.tamanio = sum(tamanio for _, tamanio, _ in archivos)
+
+        for archivo, tamanio, _ in archivos:
+            if self.tamanio <= self.tamanio_maximo * FRACCION_CACHE:
+                break
+
+            if self.__borrar(archivo):
+                self.tamanio -= tamanio
+                self.expulsados += 1
+
+    def __borrar(self, archivo):
+        try:
+            os.unlink(archivo)
+        except OSError:
+            return False
+
+        return True
+
+
+# Cache de resultados de los filtros, None si no se usa
+CACHE_RESULTADOS = None
+
+
+def usar_cache(ruta, tamanio_maximo = TAMANIO_CACHE):
+    ''' Función que activa la cache de resultados en el directorio, o la
+        desactiva si la ruta es None. Regresa la cache
+
+        ruta: str. Directorio de la cache
+        tamanio_maximo: int. Bytes máximos que ocupan los resultados'''
+
+    global CACHE_RESULTADOS
+
+    CACHE_RESULTADOS = None if ruta is None else CacheResultados(ruta, tamanio_maximo)
+
+    return CACHE_RESULTADOS
+
+
+def estadisticas_cache():
+    ''' Función que regresa las estadísticas de la cache de resultados de
+        este proceso, None si no se usa la cache'''
+
+    return None if CACHE_RESULTADOS is None else CACHE_RESULTADOS.estadisticas()
+
+
+def _en_cache(metodo = None, argumentos = None):
+    ''' Decorador de los filtros de PDI que busca su resultado en la cache
+        antes de calcularlo y lo guarda al terminar. Solo se usa la cache si
+        la imagen modificada no tiene cambios sin fijar, porque los filtros
+        escriben sobre ella; los filtros que llama otro filtro no se guardan
+        por separado
+
+        metodo: function. Filtro de PDI cuyo resultado depende solo de la
+                imagen original y de sus argumentos
+        argumentos: function. Función que recibe los argumentos del filtro y
+                    regresa la tupla (args, kwargs) con la que se identifica
+                    el resultado, para los filtros cuyos argumentos son
+                    nombres de valores que se pueden redefinir'''
+
+    if metodo is None:
+        return functools.partial(_en_cache, argumentos=argumentos)
+
+    nombre = metodo.__name__
+
+    @functools.wraps(metodo)
+    def filtro(PDI self, *args, **kwargs):
+        cache = CACHE_RESULTADOS
+
+        if cache is None or self.en_filtro or not self.__img_m_sin_cambios():
+            return metodo(self, *args, **kwargs)
+
+        with etapa('huella', 'cache', self.ancho * self.alto):
+            if argumentos is None:
+                clave = cache.clave(self.__huella(), nombre, args, kwargs)
+            else:
+                clave = cache.clave(self.__huella(), nombre, *argumentos(*args, **kwargs))
+
+        with etapa('leer_cache', 'cache') as medicion:
+            arreglo = cache.leer(clave, self.mapear)
+            medicion.anotar(filtro=nombre, acierto=arreglo is not None)
+
+        if arreglo is not None:
+            self.img_m = arreglo
+            self.__img_m_modificada()
+            return
+
+        self.en_filtro = True
+
+        try:
+            metodo(self, *args, **kwargs)
+        finally:
+            self.en_filtro = False
+
+        with etapa('escribir_cache', 'cache'):
+            cache.escribir(clave, np.asarray(self.img_m))
+
+    return filtro
+
+
+def _argumentos_convolucion(filtro):
+    ''' Función que identifica un filtro de convolución por su matriz, su
+        factor y su brillo en lugar de por su nombre, que se puede volver a
+        registrar con otra matriz
+
+        filtro: str. Nombre del filtro'''
+
+    if filtro not in FILTROS_CONVOLUCION:
+        return (filtro,), {}
+
+    matriz, factor, brillo = FILTROS_CONVOLUCION[filtro]
+
+    return (matriz.dtype.str, matriz.shape, matriz.tobytes(), factor, brillo), {}
+
+
+def _perfilado(metodo):
+    ''' Decorador de los filtros de PDI que mide cada llamada con el
+        perfilador activo. Sin perfilador solo llama al filtro
+
+        metodo: function. Filtro de PDI'''
+
+    nombre = metodo.__name__
+
+    @functools.wraps(metodo)
+    def filtro(PDI self, *args, **kwargs):
+        if PERFILADOR is None:
+            return metodo(self, *args, **kwargs)
+
+        with PERFILADOR.etapa(nombre, 'filtro', self.ancho * self.alto) as medicion:
+            medicion.anotar(argumentos=', '.join(map(repr, args)))
+            return metodo(self, *args, **kwargs)
+
+    return filtro
+
 
 cdef class PDI:
     ''' Clase que se encarga de la lógica de cada uno de los filtros y modificaciones'''
@@ -18,38 +2588,268 @@ cdef class PDI:
     cdef int ancho                           # Número de pixeles a lo ancho de la imagen original
     cdef int alto                            # Número de pixeles a lo alto de la imagen original
     cdef str img_formato                     # Formato de la imagen original
+    cdef object integral_o                   # Imagen integral de img_o, se calcula al usarse
+    cdef object integral_m                   # Imagen integral de img_m, se calcula al usarse
+    cdef list piramide                       # Reducciones sucesivas a la mitad de img_o, se calculan al usarse
+    cdef int hilos                           # Número de hilos para los filtros que se reparten por bandas
+    cdef object progreso                     # Suscriptor del avance de los filtros, None si no hay
+    cdef int num_avisos                      # Número de avisos de avance por filtro
+    cdef bint mapear                         # Indica si las copias de la imagen se mapean a archivos temporales
+    cdef bytes huella_o                      # Hash de los pixeles de img_o, se calcula al usarse
+    cdef bint en_filtro                      # Indica si se está calculando un filtro que se guarda en la cache
+
+
+    def __cinit__(self, ruta, progreso = None, bint mapear = False, reducir = None, bint copiar = True):
+        ''' Carga la imagen en un arreglo de acuerdo a la ruta. También
+            recibe directamente un arreglo, en cuyo caso la imagen no tiene
+            formato nativo.
+
+            La imagen se decodifica una sola vez. La imagen modificada y su
+            copia comparten memoria con la original hasta que un filtro
+            escribe en la modificada
+
+            ruta: str o ndarray. Ruta de la imagen o arreglo (alto, ancho, canales)
+            progreso: Progreso. Suscriptor del avance de los filtros. Sin él
+                      los filtros no reportan nada
+            mapear: bint. Valor que indica si decodificar la imagen (y las
+                    copias que hagan los filtros) a archivos temporales
+                    mapeados en memoria, para imágenes muy grandes
+            reducir: tuple. (ancho, alto) mínimo de la imagen. Si se da, la
+                     imagen se decodifica reducida (las JPEG directamente a
+                     1/2, 1/4 o 1/8 de su tamaño), para vistas previas
+            copiar: bint. Valor que indica si copiar el arreglo recibido. Sin
+                    copiarlo (si es uint8 y se puede escribir) el PDI lo usa
+                    como imagen original, que los filtros nunca modifican, así
+                    que no debe cambiar mientras se use el PDI '''
+
+        self.mapear = mapear
+
+        if isinstance(ruta, np.ndarray):
+            self.img_formato = None
+
+            if copiar or ruta.dtype != np.uint8 or not ruta.flags.writeable:
+                self.img_o = self.__copia(ruta)
+            else:
+                self.img_o = ruta
+        else:
+            with etapa('decodificar', 'entrada') as medicion:
+                img_pil = Image.open(ruta)
+                self.img_formato = img_pil.format
+
+                if reducir is not None:
+                    img_pil.draft(img_pil.mode, tuple(reducir))
+                    factor = max(1, min(img_pil.width // reducir[0], img_pil.height // reducir[1]))
+
+                    if factor > 1:
+                        img_pil = img_pil.reduce(factor)
+
+                if mapear:
+                    self.img_o = decodificar_mapeado(img_pil)
+                else:
+                    self.img_o = np.array(img_pil)
+
+                img_pil.close()
+                medicion.anotar(pixeles=self.img_o.shape[0] * self.img_o.shape[1], formato=self.img_formato)
+
+        self.img_m = self.img_o
+        self.img_m_copia = self.img_o
+        self.ancho = np.size(self.img_o,axis = 1)  
+        self.alto = np.size(self.img_o,axis = 0)  
+        self.hilos = HILOS
+        self.set_progreso(progreso)
+
+
+    def set_hilos(self, int num_hilos):
+        ''' Función que cambia el número de hilos con el que se aplican los
+            filtros que se reparten por bandas (convolución y erosión)
+
+            num_hilos: int. Número de hilos, al menos 1'''
+
+        if num_hilos < 1:
+            raise ValueError("El número de hilos debe ser al menos 1!")
+
+        self.hilos = num_hilos
+
+
+    def set_progreso(self, progreso, int num_avisos = 20):
+        ''' Función que cambia el suscriptor del avance de los filtros. Los
+            filtros largos le avisan num_avisos veces, por bandas de filas o
+            por filas de la cuadrícula, y se cancelan con FiltroCancelado si
+            el suscriptor lo pide
+
+            progreso: Progreso. Suscriptor, None para no reportar el avance
+            num_avisos: int. Número de avisos por filtro, al menos 1'''
+
+        if num_avisos < 1:
+            raise ValueError("El número de avisos debe ser al menos 1!")
+
+        self.progreso = progreso
+        self.num_avisos = num_avisos
+
+
+    def __reporte(self, titulo, total, bint br = True):
+        ''' Función que regresa el reporte de avance de un filtro. Si no hay
+            suscriptor o br es False regresa un reporte que no hace nada
+
+            titulo: str. Descripción del trabajo
+            total: int. Número total de unidades del filtro
+            br: bint. Valor que indica si reportar o no el avance'''
+
+        if self.progreso is None or not br:
+            return _REPORTE_NULO
+
+        return _Reporte(self.progreso,titulo,total,self.num_avisos)
+
+
+    cdef __copia(self, arreglo):
+        ''' Función que regresa una copia uint8 del arreglo, mapeada en
+            memoria si el PDI se creó con mapear
+
+            arreglo: ndarray. Arreglo a copiar'''
+
+        if not self.mapear:
+            return np.array(arreglo, dtype=np.uint8)
+
+        copia = arreglo_mapeado(np.shape(arreglo))
+        copia[...] = arreglo
+
+        return copia
+
+
+    cdef void __img_m_escribible(self):
+        ''' Función que copia la imagen original en img_m si todavía
+            comparten memoria. Se llama antes de escribir en img_m'''
+
+        if self.img_m.shape[0] == 0 or self.img_m.shape[1] == 0:
+            return
+
+        if &self.img_m[0, 0, 0] == &self.img_o[0, 0, 0]:
+            self.img_m = self.__copia(self.img_o)
+
+
+    def fijar_filtro(self):
+        ''' Función que toma la imagen modificada como la nueva imagen
+            original, para que el siguiente filtro se aplique sobre ella'''
+
+        self.img_o = self.img_m
+        self.img_m_copia = self.img_m
+        self.ancho = np.size(self.img_o,axis = 1)
+        self.alto = np.size(self.img_o,axis = 0)
+        self.__img_o_modificada()
+
+
+    def set_arreglo(self, arreglo):
+        ''' Función que carga un arreglo como imagen original y modificada,
+            descartando los cambios que no se hayan fijado
+
+            arreglo: ndarray. Arreglo (alto, ancho, canales) uint8 de la imagen'''
+
+        self.img_o = self.__copia(arreglo)
+        self.img_m = self.img_o
+        self.img_m_copia = self.img_m
+        self.ancho = np.size(self.img_o,axis = 1)
+        self.alto = np.size(self.img_o,axis = 0)
+        self.__img_o_modificada()
+        self.__img_m_modificada()
+
+
+    def get_arreglo(self, tipo_img = 'm'):
+        ''' Función que regresa una copia de la imagen original o modificada
+            como arreglo de numpy, sin cambiar su tamanio
+
+            tipo_img: char. 'o' para la imagen original, 'm' para la modificada'''
+
+        if tipo_img == 'o':
+            return np.array(self.img_o)
+
+        return np.array(self.img_m)
+
+
+    cdef void __img_o_modificada(self):
+        ''' Función que descarta los datos calculados a partir de img_o.
+            Se llama cada vez que img_o cambia'''
+
+        self.integral_o = None
+        self.piramide = None
+        self.huella_o = None
+
+
+    cdef void __img_m_modificada(self):
+        ''' Función que descarta los datos calculados a partir de img_m.
+            Se llama cada vez que img_m cambia'''
+
+        self.integral_m = None
+
+
+    cdef bint __img_m_sin_cambios(self):
+        ''' Función que indica si img_m todavía comparte memoria con img_o,
+            es decir, si no hay un filtro sin fijar'''
+
+        if self.img_m.shape[0] == 0 or self.img_m.shape[1] == 0:
+            return False
+
+        return &self.img_m[0, 0, 0] == &self.img_o[0, 0, 0] and tuple(self.img_m.shape) == tuple(self.img_o.shape)
+
+
+    cdef bytes __huella(self):
+        ''' Función que regresa el hash de los pixeles de img_o'''
 
+        if self.huella_o is None:
+            arreglo = np.ascontiguousarray(self.img_o)
+            huella = hashlib.blake2b(repr(arreglo.shape).encode('ascii'), digest_size=20)
+            huella.update(memoryview(arreglo).cast('B'))
+            self.huella_o = huella.digest()
 
-    def __cinit__(self, ruta):
-        ''' Carga la imagen en un arreglo de acuerdo a la ruta 
+        return self.huella_o
 
-            ruta: str. Ruta de la imagen '''
 
-        self.img_formato = Image.open(ruta).format 
-        self.img_o = np.array(Image.open(ruta))            
-        self.img_m = self.img_o.copy()
-        self.img_m_copia = self.img_m.copy()
-        self.ancho = np.size(self.img_o,axis = 1)  
-        self.alto = np.size(self.img_o,axis = 0)  
+    def __integral(self, bint doble_f):
+        ''' Función que regresa la imagen integral de la imagen original o
+            modificada. Se calcula una sola vez y se guarda hasta que la
+            imagen cambia
 
+            doble_f: bint. Valor que indica si usar la imagen modificada'''
 
-    def __crear_barra_de_progreso(self, titulo = None):
-        ''' Funcion que crea una barra de progreso
-            
-            titulo: str. Titulo de la ventana'''
+        if doble_f:
+            if self.integral_m is None:
+                self.integral_m = imagen_integral(np.asarray(self.img_m))
+            return self.integral_m
 
-        total_pixeles = self.ancho * self.alto
+        if self.integral_o is None:
+            self.integral_o = imagen_integral(np.asarray(self.img_o))
+        return self.integral_o
 
-        layout_bp = [[sg.Text('Procesando...')],
-              [sg.ProgressBar(100,orientation='h',size=(20, 20),key='progress')],
-        ]
-        
-        if titulo == None:
-            window = sg.Window('Aplicando filtro', layout_bp).Finalize()
-        else:
-            window = sg.Window(titulo, layout_bp).Finalize()
 
-        return window
+    def __promedios_cuadricula(self, int num_columnas, int num_filas, bint doble_f):
+        ''' Función que calcula el color promedio de cada región de la
+            cuadricula en una sola operación. Regresa un arreglo
+            (filas, columnas, 3) donde la posición [f, c] es el promedio de la
+            región que inicia en (c * num_columnas, f * num_filas)
+
+            num_columnas: int. Ancho de la región
+            num_filas: int. Alto de la región
+            doble_f: bint. Valor que indica si usar la imagen modificada'''
+
+        with etapa('promedios_cuadricula', 'nucleo', self.ancho * self.alto):
+            aux = np.asarray(self.img_m) if doble_f else np.asarray(self.img_o)
+            alto, ancho = aux.shape[0], aux.shape[1]
+
+            # La imagen original no cambia, así que conviene calcular su integral
+            # una vez y reutilizarla en cada cuadricula que se pida
+            if (not doble_f or self.integral_m is not None) and \
+                    num_columnas * num_filas <= MAX_PIXELES_INTEGRAL:
+                filas = np.arange(0, alto, num_filas)
+                columnas = np.arange(0, ancho, num_columnas)
+                f_fin = np.minimum(filas + num_filas, alto)[:, None]
+                c_fin = np.minimum(columnas + num_columnas, ancho)[None, :]
+
+                sumas = _sumas_integral(self.__integral(doble_f), filas[:, None], columnas[None, :],
+                                        f_fin, c_fin)
+                prom = sumas // _pixeles_cuadricula(filas, columnas, alto, ancho)
+            else:
+                prom = promedios_bloques(aux, num_columnas, num_filas)
+
+            return prom.astype(np.intc)
 
 
     def __modificar_rgb(self, int x, int y, rgb):
@@ -60,16 +2860,20 @@ cdef class PDI:
 
         cdef int z
 
+        self.__img_m_escribible()
+
         for z in range(0,3):
             self.img_m[x,y,z] = rgb[z]
 
+        self.__img_m_modificada()
+
 
     def __modificar_pixeles(self, ec, pb, img):
         ''' Función que aplica la función recibida a los valores RGB del pixel y
             los nuevos valores generados por esta función se aplican al pixel
 
             ec. function. Función a aplicar
-            pb. boolean. Valor que indica si crear o no una barra de progreso
+            pb. boolean. Valor que indica si reportar o no el avance
             img. boolean. Valor que indica de que imagen tomar los valores rgb'''
 
         cdef int i, j
@@ -77,114 +2881,148 @@ cdef class PDI:
         cdef int ancho_m = np.size(self.img_o,axis = 1) if img else np.size(self.img_m,axis = 1)
         cdef int alto_m = np.size(self.img_o,axis = 0) if img else np.size(self.img_m,axis = 0)
 
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = (self.ancho * self.alto) / 20
+        with self.__reporte('Aplicando filtro',ancho_m,pb) as reporte:
+            for i in range(0,ancho_m):
+                for j in range(0,alto_m):
 
-        if pb:
-            win = self.__crear_barra_de_progreso()
-            pb = win.FindElement('progress')
-        # Variables de la barra de progreso. Fin
+                    if img:
+                        r = self.img_o[j,i,0]
+                        g = self.img_o[j,i,1]
+                        b = self.img_o[j,i,2]
+                    else:
+                        r = self.img_m[j,i,0]
+                        g = self.img_m[j,i,1]
+                        b = self.img_m[j,i,2]
 
-        for i in range(0,ancho_m):
-            for j in range(0,alto_m):
+                    new_rgb = ec(r,g,b)
 
-                if img:
-                    r = self.img_o[j,i,0]
-                    g = self.img_o[j,i,1]
-                    b = self.img_o[j,i,2]
-                else:
-                    r = self.img_m[j,i,0]
-                    g = self.img_m[j,i,1]
-                    b = self.img_m[j,i,2]
+                    self.__modificar_rgb(j,i,new_rgb)
+
+                reporte(i + 1)
+
+
+    def __aplicar_tono(self, tono):
+        ''' Función que asigna el mismo valor a los tres canales de cada pixel
+
+            tono: ndarray. Arreglo (alto, ancho) con el nuevo valor de cada pixel'''
+
+        self.__img_m_escribible()
+        np.asarray(self.img_m)[:, :, :3] = tono[:, :, None]
+        self.__img_m_modificada()
+
+
+    @_perfilado
+    def aplicar_lut(self, lut, bint img = True):
+        ''' Función que aplica a la imagen una tabla de búsqueda de 256
+            entradas, común o por canal
+
+            lut: ndarray. Tabla (256,) o (3, 256) con los nuevos valores
+            img: bint. Valor que indica de que imagen tomar los valores rgb'''
+
+        lut = np.asarray(lut)
+
+        if lut.shape not in ((256,), (3, 256)):
+            raise ValueError("La tabla debe tener forma (256,) o (3, 256)!")
+
+        self.aplicar_operaciones(OperacionesPunto().lut(lut),False,img)
+
+
+    @_perfilado
+    def aplicar_operaciones(self, operaciones, bint br = False, bint img = True):
+        ''' Función que aplica una cadena de operaciones por pixel en una
+            sola pasada sobre la imagen, en lugar de una pasada por operación
+
+            operaciones: OperacionesPunto. Cadena de operaciones a aplicar
+            br: bint. Valor que indica si reportar o no el avance
+            img: bint. Valor que indica de que imagen tomar los valores rgb'''
+
+        self.__img_m_escribible()
+
+        origen = np.asarray(self.img_o) if img else np.asarray(self.img_m)
 
-                new_rgb = ec(r,g,b)
+        with self.__reporte('Aplicando filtro',origen.shape[0],br) as reporte:
+            aplicar_operaciones(origen,operaciones,np.asarray(self.img_m),self.hilos,reporte)
+        self.__img_m_modificada()
 
-                self.__modificar_rgb(j,i,new_rgb)
 
-            if pb:
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += (self.ancho * self.alto) / 20
+    @_perfilado
+    def aplicar_funcion(self, ec, bint br, bint img = True):
+        ''' Función que aplica pixel por pixel una función definida por el
+            usuario. Es el camino lento, solo para funciones que no se pueden
+            expresar como tabla de búsqueda
 
-                num_pixel += 1
-                # Avance barra de progreso. Fin              
-        if pb:
-            win.close()
+            ec: function. Función que recibe (r, g, b) y regresa los nuevos valores
+            br: bint. Valor que indica si reportar o no el avance
+            img: bint. Valor que indica de que imagen tomar los valores rgb'''
+
+        self.__modificar_pixeles(ec,br,img)
 
 
     def deshacer_filtro(self):
         ''' Función que deshace los cambios realizados a la imagen'''
 
-        self.img_m = self.img_o.copy()
+        self.img_m = self.img_o
+        self.__img_m_modificada()
 
 
+    @_perfilado
     def gris(self, char tono, bint br):
         ''' Función que aplica el filtro gris seleccionado a la imagen
 
             tono: str. Tono de gris seleccionado para aplicar
-            br: bint. Valor que indica si crear o no una barra de progreso'''
-
-        if tono == 1:
-            self.__modificar_pixeles(lambda r, g, b : tuple([(r + g + b) // 3]*3),br,True)
-        elif tono == 2:
-            self.__modificar_pixeles(lambda r, g, b : tuple([int(r*0.3 + g*0.59 + b*0.11)]*3),br,True)
-        elif tono == 3:
-            self.__modificar_pixeles(lambda r, g, b : tuple([int(r*0.2126 + g*0.7152 + b*0.0722)]*3),br,True)
-        elif tono == 4:
-            self.__modificar_pixeles(lambda r, g, b : tuple([(max(r,g,b) + min(r,g,b)) // 2]*3),br,True)
-        elif tono == 5:
-            self.__modificar_pixeles(lambda r, g, b : tuple([max(r,g,b)]*3),br,True)
-        elif tono == 6:
-            self.__modificar_pixeles(lambda r, g, b : tuple([min(r,g,b)]*3),br,True)
-        elif tono == 7:
-            self.__modificar_pixeles(lambda r, g, b : tuple([r]*3),br,True)
-        elif tono == 8:
-            self.__modificar_pixeles(lambda r, g, b : tuple([g]*3),br,True)
-        elif tono == 9:
-            self.__modificar_pixeles(lambda r, g, b : tuple([b]*3),br,True)
-        else:
-            raise ValueError("Ese tono de gris no existe!")
+            br: bint. Valor que indica si reportar o no el avance'''
+
+        self.aplicar_operaciones(OperacionesPunto().gris(tono),br)
 
 
+    @_perfilado
     def modificar_brillo(self, int cons, bint br, bint img):
         ''' Función que modifica el brillo de la imagen de acuerdo a la constante recibida
 
             cons: int. Constante a sumar para modificar el brillo
-            br: bint. Valor que indica si crear o no una barra de progreso
+            br: bint. Valor que indica si reportar o no el avance
             img: bint. Valor que indica de que imagen tomar los valores rgb'''
 
-        func = lambda r, g, b: (min(max(int(r+cons), 0), 255),
-                                min(max(int(g+cons), 0), 255),
-                                min(max(int(b+cons), 0), 255))
+        self.aplicar_operaciones(OperacionesPunto().lut(tabla_brillo(cons)),br,img)
 
-        self.__modificar_pixeles(func,br,img)
 
+    def __vista(self, int ancho, int alto):
+        ''' Función que regresa la imagen original reducida al tamanio
+            indicado. Parte del nivel más chico de la pirámide de reducciones
+            que no sea menor al tamanio pedido y lo redimensiona en un solo
+            paso, así que el tiempo no depende del tamanio de la imagen
 
-    def __resize_img(self,aux,alto_nuevo,ancho_nuevo):
-        ''' Función que cambia el tamanio de la imagen de acuerdo a las nuevas
-            medidas recibidas. Regresa la imagen con el tamanio modificado en
-            forma de bytes y formarno PNG
-            
-            alto_nuevo: int. Nueva medida del alto
-            ancho_nuevo: int. Nueva medida del ancho
-            '''
-        w,h = aux.size
+            ancho: int. Ancho de la vista
+            alto: int. Alto de la vista'''
+
+        with etapa('escalar_vista', 'salida', self.ancho * self.alto):
+            if self.piramide is None:
+                self.piramide = [Image.fromarray(np.asarray(self.img_o))]
+
+            nivel = self.piramide[-1]
 
-        while w > 720 or h > 450:
-            scale = min(alto_nuevo/h, ancho_nuevo/w)
-            aux = aux.resize((int(w*scale),int(h*scale)),Image.ANTIALIAS)
-            alto_nuevo -= 100
-            ancho_nuevo -= 100
-            w,h = aux.size
+            while nivel.width >= 2 * ancho and nivel.height >= 2 * alto:
+                nivel = nivel.reduce(2)
+                self.piramide.append(nivel)
 
-        bio = io.BytesIO()
-        aux.save(bio,format = "PNG")
+            for nivel in reversed(self.piramide):
+                if nivel.width >= ancho and nivel.height >= alto:
+                    break
 
-        return bio.getvalue()
+            if nivel.size == (ancho, alto):
+                return nivel
+
+            return nivel.resize((ancho,alto),Image.LANCZOS)
+
+
+    def get_vista(self, int ancho, int alto):
+        ''' Función que regresa la imagen original reducida al tamanio
+            indicado como arreglo de numpy
+
+            ancho: int. Ancho de la vista
+            alto: int. Alto de la vista'''
+
+        return np.array(self.__vista(ancho,alto))
 
 
     def get_img(self, tipo_img, deshacer = True):
@@ -198,13 +3036,18 @@ cdef class PDI:
             tipo_img: char. Imagen que se requiere regresar
             deshacer: boolean. Valor que indica si hay que deshacer el filtro'''
 
-        if tipo_img == 'o':
-            aux = Image.fromarray(np.array(self.img_o))
-        elif tipo_img == 'm':
-            aux = Image.fromarray(np.array(self.img_m))
+        with etapa('get_img', 'salida'):
+            if tipo_img == 'o':
+                aux = self.__vista(*tamanio_vista(self.ancho,self.alto))
+            elif tipo_img == 'm':
+                aux = Image.fromarray(np.asarray(self.img_m))
+                tamanio = tamanio_vista(aux.width,aux.height)
+
+                if aux.size != tamanio:
+                    aux = aux.resize(tamanio,Image.LANCZOS,reducing_gap = 3.0)
+
+            rsz = codificar_vista(aux)
 
-        rsz = self.__resize_img(aux,700,700)
-        
         self.img_m_copia = self.img_m
 
         if deshacer:
@@ -226,77 +3069,41 @@ cdef class PDI:
             
             ruta: str. Ruta donde se va a guardar la imagen'''
 
-        img_pil = Image.fromarray(np.array(self.img_m_copia))
+        with etapa('guardar', 'salida', self.ancho * self.alto):
+            img_pil = Image.fromarray(np.asarray(self.img_m_copia))
 
-        if self.img_formato == 'PNG':
-            if ruta.endswith('.png'):
-                img_pil.save(ruta,format = self.img_formato,quality=95)
-                return True
+            if self.img_formato == 'PNG':
+                if ruta.endswith('.png'):
+                    img_pil.save(ruta,format = self.img_formato,quality=95)
+                    return True
 
-        elif self.img_formato == 'JPEG':
-            if ruta.endswith((".jpg",".jpeg")):
-                img_pil.save(ruta, format = self.img_formato,quality=95)
-                return True
+            elif self.img_formato == 'JPEG':
+                if ruta.endswith((".jpg",".jpeg")):
+                    img_pil.save(ruta, format = self.img_formato,quality=95)
+                    return True
 
-        elif self.img_formato == None:
-            img_pil.save(ruta,quality=95)
-            return True
+            elif self.img_formato == None:
+                img_pil.save(ruta,quality=95)
+                return True
 
-        return False
+            return False
 
 
+    @_perfilado
+    @_en_cache
     def mosaico(self, int num_columnas, int num_filas):
         '''Función que aplica el filtro de mosaico a la imagen
 
             num_columnas: int. Ancho del mosaico
             num_filas: int. alto del mosaico '''
 
-        cdef int i,j,c,f
-        cdef int[:] new_rgb
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
-
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')
-        # Variables de la barra de progreso. Fin
-
-        for j in range(0,self.alto,num_filas):
-            for i in range(0,self.ancho,num_columnas):    
-
-                if (i + num_columnas > self.ancho) and (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,self.alto,False)
-
-                elif (i + num_columnas > self.ancho):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,j+num_filas,False)
-
-                elif (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,self.alto,False)
-
-                else:
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,j+num_filas,False)
-
-                c = i
-
-                while (c < i + num_columnas) and (c < self.ancho):
-                    f = j
-                    while (f < j + num_filas) and (f < self.alto):
-                        self.__modificar_rgb(f,c,new_rgb)
-                        f += 1
-                    c += 1
-
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
+        promedios = self.__promedios_cuadricula(num_columnas,num_filas,False).astype(np.uint8)
 
-                num_pixel += 1
-                # Avance barra de progreso. Fin
+        bloques = np.repeat(np.repeat(promedios,num_filas,axis=0),num_columnas,axis=1)
 
-        win.close()
+        self.__img_m_escribible()
+        np.asarray(self.img_m)[:, :, :3] = bloques[:self.alto, :self.ancho]
+        self.__img_m_modificada()
 
 
     cdef int[:] __color_promedio(self, int columna_ini, int fila_ini, int columna_fin, int fila_fin, bint doble_f):
@@ -310,61 +3117,38 @@ cdef class PDI:
         columna_fin: int. Valor de la columna final
         fila_fin: int. Valor de la columna inicial'''
 
-        cdef int total_pixeles = (columna_fin - columna_ini) * (fila_fin - fila_ini)
-        cdef int total_r = 0
-        cdef int total_g = 0
-        cdef int total_b = 0
+        cdef long total_pixeles = <long>(columna_fin - columna_ini) * (fila_fin - fila_ini)
 
-        cdef int i,j,r,g,b
-        cdef unsigned char[:, :, :] aux
-
-        if doble_f:
-            aux = self.img_m
+        if total_pixeles <= MAX_PIXELES_INTEGRAL:
+            sumas = _sumas_integral(self.__integral(doble_f),fila_ini,columna_ini,fila_fin,columna_fin)
         else:
-            aux = self.img_o
-
-        for j in range(fila_ini,fila_fin):
-            for i in range(columna_ini,columna_fin):
-
-                r = aux[j,i,0]
-                g = aux[j,i,1]
-                b = aux[j,i,2]
+            aux = np.asarray(self.img_m) if doble_f else np.asarray(self.img_o)
+            sumas = aux[fila_ini:fila_fin, columna_ini:columna_fin, :3].sum(axis=(0, 1), dtype=np.int64)
 
-                total_r += r
-                total_g += g
-                total_b += b
-
-        cdef int[:] prom = np.array((total_r // total_pixeles,
-                                     total_g // total_pixeles,
-                                     total_b // total_pixeles),dtype=np.intc)
+        cdef int[:] prom = (sumas // total_pixeles).astype(np.intc)
 
         return prom
 
 
+    @_perfilado
     def alto_contraste(self, bint br):
         ''' Función que aplica el filtro de alto contraste a la imagen original
 
-            br: bint. Valor que indica si crear o no una barra de progreso'''
-
-        self.gris(1,False)
+            br: bint. Valor que indica si reportar o no el avance'''
 
-        func = lambda r, g, b: (255,255,255) if r > 127 and g > 127 and b > 127 else (0,0,0)
-
-        self.__modificar_pixeles(func,br,True)
+        self.aplicar_operaciones(OperacionesPunto().umbral(False),br)
 
     
+    @_perfilado
     def inverso(self, bint br):
         ''' Función que aplica el filtro inverso a la imagen original
 
-            br: bint. Valor que indica si crear o no una barra de progreso'''
-
-        self.gris(1,False)
+            br: bint. Valor que indica si reportar o no el avance'''
 
-        func = lambda r, g, b: (0,0,0) if r > 127 and g > 127 and b > 127 else (255,255,255)
-
-        self.__modificar_pixeles(func,br,True)
+        self.aplicar_operaciones(OperacionesPunto().umbral(True),br)
 
 
+    @_perfilado
     def capa_rgb(self, int new_r, int new_g, int new_b, bint br, bint img):
         ''' Función que aplica la capa RGB con los valores recibidos a 
         la imagen original
@@ -372,379 +3156,30 @@ cdef class PDI:
         new_r: int. Valor del color rojo
         new_g: int. Valor del color verde
         new_b: int. Valor del color azul
-        br: bint. Valor que indica si crear o no una barra de progreso
+        br: bint. Valor que indica si reportar o no el avance
         img: bint. Valor que indica de que imagen tomar los valores rgb'''
         
-        func = lambda r, g, b: (new_r & r,new_g & g,new_b & b)
-
-        self.__modificar_pixeles(func,br,img)
-
-
-    cdef void __aplicar_convolucion(self, int[:, :] filtro, double factor, double brillo):
-        ''' Función que aplica a la imagen el filtro de convolución con el valor
-            de brillo y factor recibidos
-            
-            filtro: list. Matriz del filtro de convolución
-            factor: int. Valor del factor para aplicar el filtro
-            brillo: int. Valor del brillo'''
-
-        cdef int x,y
-        cdef int suma_r, suma_g, suma_b,f_x,f_y
-        cdef int img_x,img_y,r,g,b
-
-        cdef int[:] new_rgb
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = (self.ancho * self.alto) / 20
-
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')  
-        # Variables de la barra de progreso. Fin        
-
-        for y in range(0,self.alto):
-            for x in range(0,self.ancho):
-                
-                suma_r = suma_g = suma_b = 0
-
-                for f_y in range(0,len(filtro)):
-                    for f_x in range(0,len(filtro[0])):
-                        
-                        img_x = int((x - len(filtro[0]) / 2 + f_x + self.ancho) % self.ancho)
-                        img_y = int((y - len(filtro) / 2 + f_y + self.alto) % self.alto)
-
-                        r = self.img_o[img_y,img_x,0]
-                        g = self.img_o[img_y,img_x,1]
-                        b = self.img_o[img_y,img_x,2]
-
-                        suma_r += r * filtro[f_y][f_x]
-                        suma_g += g * filtro[f_y][f_x]
-                        suma_b += b * filtro[f_y][f_x]
-                    
-                new_rgb = np.array((min(max(int(factor * suma_r + brillo), 0), 255),
-                                    min(max(int(factor * suma_g + brillo), 0), 255),
-                                    min(max(int(factor * suma_b + brillo), 0), 255)), dtype = np.intc)
-
-                self.__modificar_rgb(y,x,new_rgb)
-                
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += (self.ancho * self.alto) / 20
-
-                num_pixel += 1                
-                # Avance barra de progreso. Fin
-
-        win.close()                     
-
-
-    cdef void __aplicar_convolucion_d(self, double[:, :] filtro, double factor, double brillo):
-        ''' Función que aplica a la imagen el filtro de convolución con el valor
-            de brillo y factor recibidos
-            
-            filtro: list. MatSriz del filtro de convolución
-            factor: int. Valor del factor para aplicar el filtro
-            brillo: int. Valor del brillo'''
-
-        cdef int x,y
-        cdef double suma_r, suma_g, suma_b
-        cdef int img_x,img_y,f_x,f_y,r,g,b
-
-        cdef int[:] new_rgb
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = (self.ancho * self.alto) / 20
-
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')        
-        # Variables de la barra de progreso. Fin
-
-        for y in range(0,self.alto):
-            for x in range(0,self.ancho):
-
-                suma_r = suma_g = suma_b = 0
-
-                for f_y in range(0,len(filtro)):
-                    for f_x in range(0,len(filtro[0])):
-                        
-                        img_x = int((x - len(filtro[0]) / 2 + f_x + self.ancho) % self.ancho)
-                        img_y = int((y - len(filtro) / 2 + f_y + self.alto) % self.alto)
-
-                        r = self.img_o[img_y,img_x,0]
-                        g = self.img_o[img_y,img_x,1]
-                        b = self.img_o[img_y,img_x,2]
-
-                        suma_r += r * filtro[f_y][f_x]
-                        suma_g += g * filtro[f_y][f_x]
-                        suma_b += b * filtro[f_y][f_x]
-                    
-                new_rgb = np.array((min(max(int(factor * suma_r + brillo), 0), 255),
-                                    min(max(int(factor * suma_g + brillo), 0), 255),
-                                    min(max(int(factor * suma_b + brillo), 0), 255)), dtype = np.intc)
-
-                self.__modificar_rgb(y,x,new_rgb)
-
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += (self.ancho * self.alto) / 20
-
-                num_pixel += 1                
-                # Avance barra de progreso. Fin
-
-        win.close()                
+        self.aplicar_operaciones(OperacionesPunto().lut(tabla_capa_rgb(new_r,new_g,new_b)),br,img)
 
 
+    @_perfilado
+    @_en_cache(argumentos=_argumentos_convolucion)
     def filtros_convolucion(self,filtro):
         ''' Funcion que recibe un tipo de filtro de convolución y lo aplica con la matriz
             y valores correspondientes
             
             filtro: str. Filtro seleccionado que se va a aplicar'''
 
-        if filtro == 'Suave':
-            self.__aplicar_convolucion_d(
-                np.array([[0.0,0.2,0.0],
-                 [0.2,0.2,0.2],
-                 [0.0,0.2,0.0]],dtype=np.double), 1.0, 0.0
-            )
-        elif filtro == 'Fuerte':
-            self.__aplicar_convolucion(
-                np.array([[0,0,1,0,0],
-                 [0,1,1,1,0],
-                 [1,1,1,1,1],
-                 [0,1,1,1,0],
-                 [0,0,1,0,0]],dtype=np.intc), 1.0 / 13.0, 0.0
-            )
-        elif filtro == 'Motion Blur':
-            self.__aplicar_convolucion(
-                np.array([[1, 0, 0, 0, 0, 0, 0, 0, 0],
-                 [0, 1, 0, 0, 0, 0, 0, 0, 0],
-                 [0, 0, 1, 0, 0, 0, 0, 0, 0],
-                 [0, 0, 0, 1, 0, 0, 0, 0, 0],
-                 [0, 0, 0, 0, 1, 0, 0, 0, 0],
-                 [0, 0, 0, 0, 0, 1, 0, 0, 0],
-                 [0, 0, 0, 0, 0, 0, 1, 0, 0],
-                 [0, 0, 0, 0, 0, 0, 0, 1, 0],
-                 [0, 0, 0, 0, 0, 0, 0, 0, 1]],dtype=np.intc), 1.0 / 9.0, 0.0
-            )
-        elif filtro == 'Encontrar bordes':
-            self.__aplicar_convolucion(
-               np.array([[-1,  0, 0,  0,  0],
-                [ 0, -2, 0,  0,  0],
-                [ 0,  0, 6,  0,  0],
-                [ 0,  0, 0, -2,  0],
-                [ 0,  0, 0,  0, -1]],dtype=np.intc), 1.0, 0.0
-            )
-        elif filtro == 'Sharpen':
-            self.__aplicar_convolucion(
-               np.array([[-1, -1, -1],
-                [-1,  9, -1],
-                [-1, -1, -1]],dtype=np.intc), 1.0, 0.0
-            )
-        elif filtro == 'Emboss':
-            self.__aplicar_convolucion(
-               np.array([[-1, -1, -1, -1, 0],
-                [-1, -1, -1,  0, 1],
-                [-1, -1,  0,  1, 1],
-                [-1,  0,  1,  1, 1],
-                [ 0,  1,  1,  1, 1]],dtype=np.intc), 1.0, 128.0
-            )
-        else:
+        if filtro not in FILTROS_CONVOLUCION:
             raise ValueError("Ese filtro de convolucion no existe!")
 
+        matriz, factor, brillo = FILTROS_CONVOLUCION[filtro]
 
-    def __selecciona_letra(self, int t_gris):
-        ''' Función que regresa una letra de acuerdo al tono de gris ingresado
-            
-            t_gris: int. Valor de tono de gris'''
-
-        if 0 <= t_gris < 16:
-            return 'M'
-        elif 16 <= t_gris < 32:
-            return 'N'
-        elif 32 <= t_gris < 48:
-            return 'H'
-        elif 48 <= t_gris < 64:
-            return '#'
-        elif 64 <= t_gris < 80:
-            return 'Q'
-        elif 80 <= t_gris < 96:
-            return 'U'
-        elif 96 <= t_gris < 112:
-            return 'A'
-        elif 112 <= t_gris < 128:
-            return 'D'
-        elif 128 <= t_gris < 144:
-            return '0'
-        elif 144 <= t_gris < 160:
-            return 'Y'
-        elif 160 <= t_gris < 176:
-            return '2'
-        elif 176 <= t_gris < 192:
-            return '$'
-        elif 192 <= t_gris < 210:
-            return '%'
-        elif 210 <= t_gris < 226:
-            return '+'
-        elif 226 <= t_gris < 240:
-            return '.'
-        elif 240 <= t_gris < 256:
-            return ' '
-
-
-    def __selecciona_domino_b(self, int tono, int cont):
-        ''' Funcion que regresa una letra con fuente de letra de domino
-            blanco de acuerdo al valor del tono y si se necesita ficha 
-            izquierda o derecha
-            
-            tono: int. Valor del tono 
-            cont: int. Contador de letras colocadas'''
-
-        if (cont + 1) % 2 == 0:
-            if 0 <= tono < 37:
-                return '^'
-            elif 37 <= tono < 73:
-                return '%'
-            elif 73 <= tono < 109:
-                return '$'
-            elif 109 <= tono < 145:
-                return '#'
-            elif 145 <= tono < 181:
-                return '@'
-            elif 181 <= tono < 217:
-                return '!'
-            elif 217 <= tono < 256:
-                return ')'
-        else:
-            if 0 <= tono < 37:
-                return '6'
-            elif 37 <= tono < 73:
-                return '5'
-            elif 73 <= tono < 109:
-                return '4'
-            elif 109 <= tono < 145:
-                return '3'
-            elif 145 <= tono < 181:
-                return '2'
-            elif 181 <= tono < 217:
-                return '1'
-            elif 217 <= tono < 256:
-                return '0'
-
-
-    def __selecciona_domino_n(self, int tono, int cont):
-        ''' Funcion que regresa una letra con fuente de letra de domino
-            negro de acuerdo al valor del tono y si se necesita ficha 
-            izquierda o derecha
-            
-            tono: int. Valor del tono 
-            cont: int. Contador de letras colocadas'''
-
-        if (cont + 1) % 2 == 0:
-            if 0 <= tono < 37:
-                return ')'
-            elif 37 <= tono < 73:
-                return '!'
-            elif 73 <= tono < 109:
-                return '@'
-            elif 109 <= tono < 145:
-                return '#'
-            elif 145 <= tono < 181:
-                return '$'
-            elif 181 <= tono < 217:
-                return '%'
-            elif 217 <= tono < 256:
-                return '^'
-        else:
-            if 0 <= tono < 37:
-                return '0'
-            elif 37 <= tono < 73:
-                return '1'
-            elif 73 <= tono < 109:
-                return '2'
-            elif 109 <= tono < 145:
-                return '3'
-            elif 145 <= tono < 181:
-                return '4'
-            elif 181 <= tono < 217:
-                return '5'
-            elif 217 <= tono < 256:
-                return '6'
-
-
-    def __selecciona_naipe(self, int t_gris):
-        ''' Función que regresa una letra de acuerdo al tono de gris ingresado
-            
-            t_gris: int. Valor de tono de gris'''
-
-        if 0 <= t_gris < 26:
-            return 'J'
-        elif 26 <= t_gris < 51:
-            return 'I'
-        elif 51 <= t_gris < 76:
-            return 'H'
-        elif 76 <= t_gris < 101:
-            return 'G'
-        elif 101 <= t_gris < 126:
-            return 'F'
-        elif 126 <= t_gris < 151:
-            return 'E'
-        elif 151 <= t_gris < 176:
-            return 'D'
-        elif 176 <= t_gris < 201:
-            return 'C'
-        elif 201 <= t_gris < 226:
-            return 'B'
-        elif 226 <= t_gris < 256:
-            return 'A'
-
-
-    def coloca_letra(self, d, int i, int j, int[:] new_rgb, int cont, opcion, fnt, texto):
-        ''' Función que dibuja una letra en la posición indicada y se 
-            modifica de acuerdo a la opcion seleccionada por el usuario
-            
-            d: ImageDraw. Canvas para dibujar las letras
-            i: int. Valor de x en el canvas
-            j: int. Valor de y en el canvas
-            new_rgb: int. Color promedio de la cuadricula
-            cont: int. Contador de letras colocadas
-            opcion: str. Opcion seleccionada por el ususario
-            texto: str. Texto personalizado ingresado por el usuario'''
-
-        cdef int r,g,b
-
-        if opcion.startswith('m'):
-            d.text((i,j),'M',fill=tuple(new_rgb),font=fnt)
-            
-        elif opcion == 'ds-t':
-            d.text((i,j),self.__selecciona_letra(new_rgb[0]),fill=(0,0,0),font=fnt)
-
-        elif opcion == 'ds-c':
-            r = new_rgb[0]
-            g = new_rgb[1]
-            b = new_rgb[2]
-
-            d.text((i,j),self.__selecciona_letra((r + g + b) // 3),fill=tuple(new_rgb),font=fnt)
-
-        elif opcion == 'ds-g':
-            d.text((i,j),self.__selecciona_letra(new_rgb[0]),fill=tuple(new_rgb),font=fnt)
-
-        elif opcion == 'tp-cl':
-            d.text((i,j),texto[cont % len(texto)],fill=tuple(new_rgb),font=fnt)
+        self.__img_m_escribible()
 
-        elif opcion == 'db':
-            d.text((i,j),self.__selecciona_domino_b(new_rgb[0],cont),fill=(0,0,0),font=fnt)
-
-        elif opcion == 'dn':
-            d.text((i,j),self.__selecciona_domino_n(new_rgb[0],cont),fill=(0,0,0),font=fnt)
-
-        elif opcion == 'nps':
-            d.text((i,j),self.__selecciona_naipe(new_rgb[0]),fill=(0,0,0),font=fnt)
+        with self.__reporte('Aplicando filtro',self.alto) as reporte:
+            np.asarray(self.img_m)[:, :, :3] = convolucion(self.img_o,matriz,factor,brillo,self.hilos,reporte)
+        self.__img_m_modificada()
 
 
     def __ruta_recurso(self, rtv):
@@ -753,22 +3188,25 @@ cdef class PDI:
 
 
     def selecciona_fuente(self, opcion):
-        ''' Funcion que selecciona la fuente de letra de acuerdo
-            a la opcion elegida
+        ''' Funcion que regresa la ruta y el tamanio de la fuente de letra
+            de acuerdo a la opcion elegida
             
             opcion: str. Opcion elegida por el usuario'''
 
         if opcion == 'db':
-            return ImageFont.truetype(self.__ruta_recurso('fonts/Lasvwd__.otf'),11)
+            return self.__ruta_recurso('fonts/Lasvwd__.otf'),11
         elif opcion == 'dn':
-            return ImageFont.truetype(self.__ruta_recurso('fonts/Lasvbld_.otf'),11)
+            return self.__ruta_recurso('fonts/Lasvbld_.otf'),11
         elif opcion == 'nps':
-            return ImageFont.truetype(self.__ruta_recurso('fonts/PLAYCRDS.otf'),17)
+            return self.__ruta_recurso('fonts/PLAYCRDS.otf'),17
         else:
-            return ImageFont.truetype(self.__ruta_recurso('fonts/Minecraft.ttf'),10)
+            return self.__ruta_recurso('fonts/Minecraft.ttf'),10
 
 
-    def genera_texto(self, int num_columnas, int num_filas, bint doble_f, opcion, texto = None):
+    @_perfilado
+    @_en_cache
+    def genera_texto(self, int num_columnas, int num_filas, bint doble_f, opcion, texto = None,
+                     double escala_fuente = 1.0):
         ''' Función que cuadricula la imagen, calcula el color promedio de 
             cada region y por cada una de ellas genera el texto indicado
             del color promedio correpondiente
@@ -778,60 +3216,25 @@ cdef class PDI:
             doble_f: bint. Valor que determina si se van aplicar dos filtros
                            consecutivos
             opcion: str. Opcion seleccionada por el usuario
-            texto: str. Texto personalizado ingresado por el usuario'''
-
-        fnt = self.selecciona_fuente(opcion)
-
-        img_letras = Image.new("RGB",(self.ancho,self.alto),(255, 255, 255))
-        l = ImageDraw.Draw(img_letras)
-
-        cdef int i,j,c
-        cdef int[:] new_rgb
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
-        # Variables de la barra de progreso. Fin
+            texto: str. Texto personalizado ingresado por el usuario
+            escala_fuente: double. Factor del tamaño de la fuente de la opción'''
 
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')
+        ruta, tamanio = self.selecciona_fuente(opcion)
+        tamanio = max(1, <int>round(tamanio * escala_fuente))
 
-        c = 0
+        promedios = self.__promedios_cuadricula(num_columnas,num_filas,doble_f)
+        letras, indices, colores = letras_celdas(opcion,promedios,texto)
 
-        for j in range(0,self.alto,num_filas):
-            for i in range(0,self.ancho,num_columnas):
+        img_letras = np.full((self.alto,self.ancho,3),255,dtype=np.uint8)
+        dibuja_letras(img_letras,ruta,tamanio,letras,indices,colores,num_columnas,num_filas)
 
-                if (i + num_columnas > self.ancho) and (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,self.alto,doble_f)
+        self.img_m = img_letras
+        self.__img_m_modificada()
 
-                elif (i + num_columnas > self.ancho):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,j+num_filas,doble_f)
 
-                elif (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,self.alto,doble_f)
-
-                else:
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,j+num_filas,doble_f)
-                
-                self.coloca_letra(l,i,j,new_rgb,c,opcion,fnt,texto)
-
-                c += 1
-
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
-
-                num_pixel += 1
-                # Avance barra de progreso. Fin
-                
-        win.close()
-        self.img_m = np.array(img_letras)
-
-
-    def filtros_letras(self, num_columnas, num_filas, opcion, txt = None):
+    @_perfilado
+    @_en_cache
+    def filtros_letras(self, num_columnas, num_filas, opcion, txt = None, escala_fuente = 1.0):
         ''' Funcion que realiza la llamada correspondiente para generar texto 
             en el canvas de acuerdo a la opcion seleccionada
             
@@ -839,215 +3242,55 @@ cdef class PDI:
             num_filas: int. alto de la seccion             
             opcion: str. Opcion seleccionada por el usuario
             txt: str. Texto personalizado ingresado por el usuario
+            escala_fuente: float. Factor del tamaño de la fuente de la opción
             '''
         
         if opcion in ['m-cl','ds-c','tp-cl']:
-            self.genera_texto(num_columnas,num_filas,False,opcion,txt)
+            self.genera_texto(num_columnas,num_filas,False,opcion,txt,escala_fuente)
 
         if opcion in ['m-g','ds-t','ds-g','dn','db','nps']:
             self.gris(1,False)
-            self.genera_texto(num_columnas,num_filas,True,opcion)
-
-
-    def __genera_img_texto(self, texto, estilo, int x, int y):
-        ''' Funcion que crea una imagen en blanco del mismo tamanio que la original
-            con el texto personalizado en las coordenadas indicadas
-            
-            texto: str. Texto que se va a escribir en la imagen
-            estilo: tuple. Tupla con la ruta y el tamaño de la fuente
-            x: int. Coordenada x en la imagen
-            y: int. Coordenada y en la imagen'''
-
-        img_texto = Image.new("RGB",(self.ancho,self.alto),(255, 255, 255))
-        draw_texto = ImageDraw.Draw(img_texto)
-
-        ruta = estilo[0]
-        tmn = estilo[1]
-
-        fnt = ImageFont.truetype(ruta,tmn)
-
-        draw_texto.text((x,y),texto,font = fnt, fill = (0,0,0))
+            self.genera_texto(num_columnas,num_filas,True,opcion,None,escala_fuente)
 
-        return img_texto
-        
 
+    @_perfilado
+    @_en_cache
     def marca_de_agua(self, texto, estilo, int x, int y):
-        ''' Funcion que procesa la imagen modificada y la imagen en blanco
-            con texto para crear la marca de agua
+        ''' Funcion que aplica la marca de agua con el texto en las
+            coordenadas indicadas
         
             texto: str. Texto de la marca de agua
-            estilo: tuple. Tupla con la ruta y el tamaño de la fuente
+            estilo: tuple. Tupla con la ruta y el tamaño de la fuente y la opacidad
             x: int. Coordenada x en la imagen
             y: int. Coordenada y en la imagen'''
 
-        img_texto = np.array(self.__genera_img_texto(texto,estilo,x,y))
-
-        cdef int i, j
-        cdef int r, g, b, n_r, n_g, n_b
-        cdef double alpha = estilo[2] / 100
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = (self.ancho * self.alto) / 20
-        # Variables de la barra de progreso. Fin
-
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')
-
-        for i in range(0,self.ancho):
-            for j in range(0,self.alto):
-
-                r_img = self.img_m[j,i,0]
-                g_img = self.img_m[j,i,1]
-                b_img = self.img_m[j,i,2]
-
-                r_txt = img_texto[j,i,0]
-                g_txt = img_texto[j,i,1]
-                b_txt = img_texto[j,i,2]
-
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += (self.ancho * self.alto) / 20
-
-                num_pixel += 1
-                # Avance barra de progreso. Fin
-
-                if r_txt == 255 & g_txt == 255 & b_txt == 255:
-                    continue
-                else:
-                    n_r = int(r_img * alpha + r_txt * (1.0 - alpha))
-                    n_g = int(g_img * alpha + g_txt * (1.0 - alpha))
-                    n_b = int(b_img * alpha + b_txt * (1.0 - alpha))
-
-                    self.__modificar_rgb(j,i,(n_r,n_g,n_b))
-
-        win.close()
+        self.__img_m_escribible()
+        marca_de_agua_arreglo(np.asarray(self.img_m),texto,estilo,x,y)
+        self.__img_m_modificada()
 
 
     def imgs_recursivas_gris(self, int ancho, int alto):
         ''' Funcion que crea 30 imagenes del tamanio ingresado con brillo 
-            modificado simulando distintos tonos de gris.
+            modificado simulando distintos tonos de gris. Regresa un arreglo
+            (30, alto, ancho, 3) uint8 de la imagen mas oscura a la mas clara
             
             ancho: int. Ancho de la imagen con brillo modificado
             alto: int. Alto de la imagen con brillo modificado
             '''
-        try:
-            rmtree("./out/gris")
-            os.makedirs("./out/gris",exist_ok=True)
-        except:
-            os.makedirs("./out/gris",exist_ok=True)
-            pass
 
-        cdef int i,j
-        cdef int[:] new_rgb
-        cdef int brillo = -180
+        aux = np.array(self.img_o)
+        aux[:, :, :3] = tono_gris(aux,1)[:, :, None]
 
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef double pb_progress = 1.5
+        img_recursiva = np.asarray(Image.fromarray(aux,'RGB').resize((ancho,alto),Image.LANCZOS))
 
-        win = self.__crear_barra_de_progreso("Creando imagenes")
-        pb = win.FindElement('progress')
-        # Variables de la barra de progreso. Fin        
+        # Una tabla de brillo por imagen, de -180 a 168 de 12 en 12
+        tablas = np.stack([tabla_brillo(brillo) for brillo in range(-180,180,12)])
 
-        self.gris(1,False)
+        return tablas[:, img_recursiva]
 
-        img_recursiva = Image.fromarray(np.array(self.img_m),'RGB').resize((ancho,alto),Image.ANTIALIAS)
-
-        self.img_m = np.array(img_recursiva)
-
-        for i in range(30):
-            self.modificar_brillo(brillo,False,False)
-            img_pil = Image.fromarray(np.array(self.img_m),'RGB')
-
-            img_pil.save('out/gris/' + str(i+1) + '.png',quality = 95)
-
-            brillo += 12
-
-            self.img_m = np.array(img_recursiva)
-
-            # Avance barra de progreso. Inicio
-            if i == int(pb_progress):
-                pb.update(pb_value)
-                pb_value += 5
-                pb_progress += 1.5
-            # Avance barra de progreso. Fin
-
-        self.deshacer_filtro()
-        win.close()
-
-
-    def __selecciona_img_gris(self, int tono):
-        ''' Funcion que selecciona la imagen con brillo modificado
-            de acuerdo al tono de gris ingresado
-            
-            tono: int. Tono de gris'''
-
-        if 0 <= tono < 9:
-            return './out/gris/1.png'
-        elif 9 <= tono < 17:
-            return './out/gris/2.png'
-        elif 17 <= tono < 25:
-            return './out/gris/3.png'
-        elif 25 <= tono < 33:
-            return './out/gris/4.png'
-        elif 33 <= tono < 41:
-            return './out/gris/5.png'
-        elif 41 <= tono < 49:
-            return './out/gris/6.png'
-        elif 49 <= tono < 57:
-            return './out/gris/7.png'
-        elif 57 <= tono < 65:
-            return './out/gris/8.png'
-        elif 65 <= tono < 73:
-            return './out/gris/9.png'
-        elif 73 <= tono < 81:
-            return './out/gris/10.png'
-        elif 81 <= tono < 89:
-            return './out/gris/11.png'
-        elif 89 <= tono < 97:
-            return './out/gris/12.png'
-        elif 97 <= tono < 105:
-            return './out/gris/13.png'
-        elif 105 <= tono < 113:
-            return './out/gris/14.png'
-        elif 113 <= tono < 121:
-            return './out/gris/15.png'
-        elif 121 <= tono < 129:
-            return './out/gris/16.png'
-        elif 129 <= tono < 137:
-            return './out/gris/17.png'
-        elif 137 <= tono < 145:
-            return './out/gris/18.png'
-        elif 145 <= tono < 153:
-            return './out/gris/19.png'
-        elif 153 <= tono < 161:
-            return './out/gris/20.png'
-        elif 161 <= tono < 169:
-            return './out/gris/21.png'
-        elif 169 <= tono < 177:
-            return './out/gris/22.png'
-        elif 177 <= tono < 185:
-            return './out/gris/23.png'
-        elif 185 <= tono < 193:
-            return './out/gris/24.png'
-        elif 193 <= tono < 201:
-            return './out/gris/25.png'
-        elif 201 <= tono < 209:
-            return './out/gris/26.png'
-        elif 209 <= tono < 217:
-            return './out/gris/27.png'
-        elif 217 <= tono < 225:
-            return './out/gris/28.png'
-        elif 225 <= tono < 233:
-            return './out/gris/29.png'
-        elif 233 <= tono < 256:
-            return './out/gris/30.png'
-        
 
+    @_perfilado
+    @_en_cache
     def dibuja_imgs_gris(self, int ancho, int alto, int num_columnas, int num_filas):
         ''' Funcion que dibuja una imagen con el tamanio ingresado seleccionada 
             (de acuerdo al tono en gris) por cada color promedio calculado con los 
@@ -1058,66 +3301,18 @@ cdef class PDI:
             num_columnas: int. Ancho de la cuadricula
             num_filas: int. Alto de la cuadricula'''
 
-        num_imgs_ancho = self.ancho // num_columnas + (1 if self.ancho % num_columnas > 0 else 0)
-        num_imgs_alto = self.alto // num_filas + (1 if self.alto % num_filas > 0 else 0)
-
-        cnv_recursiva = Image.new("RGBA",(num_imgs_ancho * ancho,num_imgs_alto * alto),(255, 255, 255))
-
-        self.gris(1,False)
-
-        cdef int i,j
-        cdef int pos_x = 0
-        cdef int pos_y = 0
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
-
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')
-        # Variables de la barra de progreso. Fin
+        tonos = self.__promedios_cuadricula(num_columnas,num_filas,False)[:, :, 0]
 
-        for j in range(0,self.alto,num_filas):
-            for i in range(0,self.ancho,num_columnas):
+        # La imagen i corresponde a los tonos de 1 + 8 * i a 8 + 8 * i, con
+        # los extremos en la primera y la última
+        indices = np.clip((tonos - 1) // 8, 0, 29)
 
-                if (i + num_columnas > self.ancho) and (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,self.alto,False)
-
-                elif (i + num_columnas > self.ancho):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,j+num_filas,False)
-
-                elif (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,self.alto,False)
-
-                else:
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,j+num_filas,False)
-
-                tono = new_rgb[0]
-
-                img_gris = Image.open(self.__selecciona_img_gris(tono)).convert("RGBA")
-                cnv_recursiva.paste(img_gris,(pos_x,pos_y))
-                pos_x += ancho
-
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
-
-                num_pixel += 1
-                # Avance barra de progreso. Fin
-
-            pos_x = 0
-            pos_y += alto
-
-        r,g,b,a = cnv_recursiva.split()
-        cnv_recursiva = Image.merge("RGB",(r,g,b))
-        self.img_m = np.array(cnv_recursiva)
-        
-        win.close()
+        self.img_m = mosaico_atlas(self.imgs_recursivas_gris(ancho,alto),indices)
+        self.__img_m_modificada()
 
 
+    @_perfilado
+    @_en_cache
     def imgs_recursivas_color(self, int ancho, int alto, int num_columnas, int num_filas):
         ''' Funcion que dibuja una imagen con el tamanio ingresado seleccionada 
             de acuerdo al color promedio calculado con los valores de la 
@@ -1128,79 +3323,24 @@ cdef class PDI:
             num_columnas: int. Ancho de la cuadricula
             num_filas: int. Alto de la cuadricula'''
 
-        cdef int i,j,r,g,b
-        cdef int[:] new_rgb
-        cdef int pos_x = 0
-        cdef int pos_y = 0
-
-        cache = [] # Imagenes ya creadas
-
-        num_imgs_ancho = self.ancho // num_columnas + (1 if self.ancho % num_columnas > 0 else 0)
-        num_imgs_alto = self.alto // num_filas + (1 if self.alto % num_filas > 0 else 0)
-
-        cnv_recursiva = Image.new("RGBA",(num_imgs_ancho * ancho,num_imgs_alto * alto),(255, 255, 255))        
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
-
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')
-        # Variables de la barra de progreso. Fin
-
-        img_recursiva = Image.fromarray(np.array(self.img_m)).resize((ancho,alto),Image.ANTIALIAS)
-
-        self.img_m = np.array(img_recursiva)        
-
-        for j in range(0,self.alto,num_filas):
-            for i in range(0,self.ancho,num_columnas):    
-
-                if (i + num_columnas > self.ancho) and (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,self.alto,False)
-
-                elif (i + num_columnas > self.ancho):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,j+num_filas,False)
-
-                elif (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,self.alto,False)
-
-                else:
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,j+num_filas,False)
-
-                r = new_rgb[0]
-                g = new_rgb[1]
-                b = new_rgb[2]
-
-                self.capa_rgb(r,g,b,False,False)
-
-                img_pil = Image.fromarray(np.array(self.img_m),'RGB')
-
-                cnv_recursiva.paste(img_pil.convert('RGBA'),(pos_x,pos_y))
-
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
-
-                num_pixel += 1
-                # Avance barra de progreso. Fin
-
-                self.img_m = np.array(img_recursiva)
-
-                pos_x += ancho
+        img_recursiva = np.asarray(Image.fromarray(np.array(self.img_m)).resize((ancho,alto),Image.LANCZOS))[:, :, :3]
 
-            pos_x = 0
-            pos_y += alto
+        promedios = self.__promedios_cuadricula(num_columnas,num_filas,False).astype(np.uint8)
+        filas, columnas = promedios.shape[0], promedios.shape[1]
 
-        n_r,n_g,n_b,a = cnv_recursiva.split()
-        cnv_recursiva = Image.merge("RGB",(n_r,n_g,n_b))
-        self.img_m = np.array(cnv_recursiva)
+        # Cada celda es el AND de la imagen reducida con su color promedio;
+        # se escriben todas directamente en el lienzo visto como
+        # (filas, alto, columnas, ancho, 3)
+        cnv_recursiva = np.empty((filas * alto,columnas * ancho,3),dtype=np.uint8)
+        np.bitwise_and(img_recursiva[None, :, None, :, :],promedios[:, None, :, None, :],
+                       out=cnv_recursiva.reshape(filas,alto,columnas,ancho,3))
 
-        win.close()
+        self.img_m = cnv_recursiva
+        self.__img_m_modificada()
 
 
+    @_perfilado
+    @_en_cache
     def aplica_img_recursiva(self, bint tipo_filtro, int ancho, int alto, int num_columnas, int num_filas):
         ''' Funcion que aplica el filtro de imagen recursiva.
             Si tipo_filtro es True, se aplica el filtro en tonos de gris.
@@ -1213,86 +3353,35 @@ cdef class PDI:
             num_filas: int. Alto de la cuadricula'''
 
         if tipo_filtro:
-            self.imgs_recursivas_gris(ancho,alto)
             self.dibuja_imgs_gris(ancho,alto,num_columnas,num_filas)
         else:
             self.imgs_recursivas_color(ancho,alto,num_columnas,num_filas)
 
 
-    def __selecciona_nueve_pts(self, int tono):
-        ''' Funcion que selecciona la imagen correspondiente de cantidad de puntos 
-            de acuerdo al tono de gris ingresado
-            
-            tono: int. Valor de tono de gris''' 
-
-        if 0 <= tono < 26:
-            return './resources/img/b9.jpg'
-        elif 26 <= tono < 52:
-            return './resources/img/b8.jpg'
-        elif 52 <= tono < 77:
-            return './resources/img/b7.jpg'
-        elif 77 <= tono < 103:
-            return './resources/img/b6.jpg'
-        elif 103 <= tono < 128:
-            return './resources/img/b5.jpg'
-        elif 128 <= tono < 154:
-            return './resources/img/b4.jpg'
-        elif 154 <= tono < 179:
-            return './resources/img/b3.jpg'
-        elif 179 <= tono < 205:
-            return './resources/img/b2.jpg'
-        elif 205 <= tono < 230:
-            return './resources/img/b1.jpg'
-        elif 230 <= tono < 256:
-            return './resources/img/b0.jpg'
-
-
-    def __selecciona_cuatro_pts(self, int tono):
-        ''' Funcion que selecciona la imagen correspondiente de cantidad de puntos 
-            de acuerdo al tono de gris ingresado
-            
-            tono: int. Valor de tono de gris'''    
-
-        if 0 <= tono < 52:
-            return './resources/img/c4.jpg'
-        elif 52 <= tono < 103:
-            return './resources/img/c3.jpg'        
-        elif 103 <= tono < 154:
-            return './resources/img/c2.jpg'
-        elif 154 <= tono < 205:
-            return './resources/img/c1.jpg'
-        elif 205 <= tono < 256:
-            return './resources/img/c0.jpg'
-
-
-    def __selecciona_tamanio_pts(self, int tono):
-        ''' Funcion que selecciona la imagen correspondiente de puntos de 
-            diferentes tamanios de acuerdo al tono de gris ingresado
-            
-            tono: int. Valor de tono de gris'''
-        
-        if 0 <= tono < 26:
-            return './resources/img/a1.jpg'
-        elif 26 <= tono < 52:
-            return './resources/img/a2.jpg'
-        elif 52 <= tono < 77:
-            return './resources/img/a3.jpg'
-        elif 77 <= tono < 103:
-            return './resources/img/a4.jpg'
-        elif 103 <= tono < 128:
-            return './resources/img/a5.jpg'
-        elif 128 <= tono < 154:
-            return './resources/img/a6.jpg'
-        elif 154 <= tono < 179:
-            return './resources/img/a7.jpg'
-        elif 179 <= tono < 205:
-            return './resources/img/a8.jpg'
-        elif 205 <= tono < 230:
-            return './resources/img/a9.jpg'
-        elif 230 <= tono < 256:
-            return './resources/img/a10.jpg'
+    @_perfilado
+    def fotomosaico(self, biblioteca, int num_columnas, int num_filas, int ancho = 0, int alto = 0):
+        ''' Funcion que arma un fotomosaico: cambia cada región de la
+            cuadricula por la imagen de la biblioteca con el color promedio
+            más cercano. Por omisión cada imagen se dibuja del tamaño de las
+            miniaturas de la biblioteca
+
+            biblioteca: str. Directorio del índice de la biblioteca de mosaicos
+            num_columnas: int. Ancho de la cuadricula
+            num_filas: int. Alto de la cuadricula
+            ancho: int. Ancho de cada imagen, 0 para el de las miniaturas
+            alto: int. Alto de cada imagen, 0 para el de las miniaturas'''
+
+        if ancho < 0 or alto < 0:
+            raise ValueError("El tamaño de las imágenes no puede ser negativo!")
+
+        promedios = self.__promedios_cuadricula(num_columnas,num_filas,False)
 
+        self.img_m = abrir_biblioteca(biblioteca).mosaico(promedios,self.hilos,ancho,alto)
+        self.__img_m_modificada()
 
+
+    @_perfilado
+    @_en_cache
     def semitono(self, int bib, int ancho, int alto, int num_columnas, int num_filas):
         ''' Funcion que aplica el filtro de semitono en una imagen con las dimensiones 
             especificadas de los puntos y de la cuadricula para calcular el color
@@ -1304,140 +3393,30 @@ cdef class PDI:
             num_columnas: int. Ancho de la cuadricula
             num_filas: int. Alto de la cuadricula'''
 
-        cdef int i,j,r,g,b
-        cdef int[:] new_rgb
-        cdef int pos_x = 0
-        cdef int pos_y = 0
-
-        num_imgs_ancho = self.ancho // num_columnas + (1 if self.ancho % num_columnas > 0 else 0)
-        num_imgs_alto = self.alto // num_filas + (1 if self.alto % num_filas > 0 else 0)
-
-        cnv_semitono = Image.new("RGBA",(num_imgs_ancho * ancho,num_imgs_alto * alto),(255, 255, 255))        
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
-
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')
-        # Variables de la barra de progreso. Fin
-
-        self.gris(3,False)
-
-        for j in range(0,self.alto,num_filas):
-            for i in range(0,self.ancho,num_columnas):    
-
-                if (i + num_columnas > self.ancho) and (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,self.alto,False)
+        if bib not in IMAGENES_SEMITONO:
+            raise ValueError("Ese tipo de semitono no existe!")
 
-                elif (i + num_columnas > self.ancho):
-                    new_rgb = self.__color_promedio(i,j,self.ancho,j+num_filas,False)
+        tonos = self.__promedios_cuadricula(num_columnas,num_filas,False)[:, :, 0]
+        indices = np.searchsorted(LIMITES_SEMITONO[bib], tonos, side='right')
 
-                elif (j + num_filas > self.alto):
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,self.alto,False)
-
-                else:
-                    new_rgb = self.__color_promedio(i,j,i+num_columnas,j+num_filas,False)
-
-                tono = new_rgb[0]
-
-                if bib == 0:
-                    img_pto = self.__selecciona_nueve_pts(tono)
-                elif bib == 1:
-                    img_pto = self.__selecciona_cuatro_pts(tono)
-                elif bib == 2:
-                    img_pto = self.__selecciona_tamanio_pts(tono)
-
-                pto_selec = Image.open(img_pto).resize((ancho,alto),Image.ANTIALIAS)
-                cnv_semitono.paste(pto_selec.convert('RGBA'),(pos_x,pos_y))
-
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += ((self.ancho/num_columnas) * (self.alto/num_filas)) / 20
-
-                num_pixel += 1
-                # Avance barra de progreso. Fin
-
-                pos_x += ancho
-
-            pos_x = 0
-            pos_y += alto
-
-        n_r,n_g,n_b,a = cnv_semitono.split()
-        cnv_semitono = Image.merge("RGB",(n_r,n_g,n_b))
-        self.img_m = np.array(cnv_semitono)
-
-        win.close()        
+        self.img_m = mosaico_atlas(atlas_imagenes(IMAGENES_SEMITONO[bib],ancho,alto),indices)
+        self.__img_m_modificada()
 
 
     cdef void __erosion(self, bint maxmin):
-        ''' Funcion que pasa a tonos de gris la imagen y aplica 
-            el filtro de erosion maximo o minimo
+        ''' Funcion que aplica el filtro de erosion maximo o minimo
 
             maxmin: bint. Valor booleano que determina si aplicar 
                           el filtro maximo o minimo '''
 
-        self.gris(3,False)
-
-        cdef int x,y
-        cdef int img_x,img_y,f_x,f_y,tono
-
-        cdef int[:] new_rgb
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = (self.ancho * self.alto) / 20
-
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')        
-        # Variables de la barra de progreso. Fin
-
-        lista_tonos = []
+        self.__img_m_escribible()
 
-        for y in range(0,self.alto):
-            for x in range(0,self.ancho):
-
-                for f_y in range(0,3):
-                    for f_x in range(0,3):
-                        
-                        if f_x == 1 and f_y == 1:
-                            continue
-
-                        img_x = int((x - 3 / 2 + f_x + self.ancho) % self.ancho)
-                        img_y = int((y - 3 / 2 + f_y + self.alto) % self.alto)
-
-                        tono = self.img_o[img_y,img_x,0]
-
-                        lista_tonos.append(tono)
-
-                lista_tonos.sort()                    
-
-                if maxmin:
-                    pxl_selec = lista_tonos[0]
-                else: 
-                    pxl_selec = lista_tonos[-1]
-
-                new_rgb = np.array([pxl_selec] * 3, dtype = np.intc)
-
-                lista_tonos = []
-
-                self.__modificar_rgb(y,x,new_rgb)
-
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += (self.ancho * self.alto) / 20
-
-                num_pixel += 1                
-                # Avance barra de progreso. Fin
-
-        win.close()
+        with self.__reporte('Aplicando filtro',self.alto) as reporte:
+            np.asarray(self.img_m)[:, :, :3] = erosion(self.img_o,maxmin,self.hilos,reporte)
+        self.__img_m_modificada()
 
+    @_perfilado
+    @_en_cache
     def erosion(self,bint maxmin):
         ''' Funcion auxiliar que realiza la llamada a la funcion principal
 
@@ -1446,7 +3425,31 @@ cdef class PDI:
 
         self.__erosion(maxmin)
 
+    @_perfilado
+    @_en_cache
+    def morfologia(self, operacion, forma, int alto, int ancho = 0, bint ciclico = True):
+        ''' Función que aplica una operación morfológica a cada canal de
+            la imagen con un elemento estructurante de la forma indicada
+
+            operacion: str. 'erosion', 'dilatacion', 'apertura', 'cierre' o
+                       'gradiente'
+            forma: str. 'rectangulo', 'cruz' o 'disco'
+            alto: int. Número de filas del elemento estructurante
+            ancho: int. Número de columnas del elemento, 0 para usar el alto
+            ciclico: bint. Valor que indica si los pixeles fuera de la imagen
+                     se toman del otro extremo o si se repite el del borde'''
+
+        elemento = elemento_estructurante(forma, alto, ancho)
+
+        self.__img_m_escribible()
+
+        with self.__reporte('Aplicando filtro',self.alto) as reporte:
+            np.asarray(self.img_m)[:, :, :3] = morfologia(self.img_o,operacion,elemento,None,ciclico,self.hilos,reporte)
+        self.__img_m_modificada()
 
+
+    @_perfilado
+    @_en_cache
     def dit_ord_disp(self, bint tipo):
         ''' Función que aplica el dithering de tipo ordenado o disperso
             en la imagen de acuerdo al parametro ingresado
@@ -1455,91 +3458,35 @@ cdef class PDI:
                         True. Dithering ordenado
                         False. Dithering disperso'''
 
-        cdef int x,y
-        cdef int img_x,img_y,f_x,f_y,t,umbral
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = (self.ancho * self.alto) / 20
-
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')        
-        # Variables de la barra de progreso. Fin
-
-        self.gris(3,False)
-
-        if tipo:
-            matriz = [[8, 3, 4],
-                      [6, 1, 2],
-                      [7, 5, 9]]
-        else:
-            matriz = [[1, 7, 4],
-                      [5, 8, 3],
-                      [6, 2, 9]]
-
-        for y in range(0,self.alto,3):
-            for x in range(0,self.ancho,3):
-
-                for f_y in range(3):
-                    for f_x in range(3):
+        matriz = MATRIZ_ORDENADO if tipo else MATRIZ_DISPERSO
 
-                        img_x = int((x - 3 / 2 + f_x + self.ancho) % self.ancho)
-                        img_y = int((y - 3 / 2 + f_y + self.alto) % self.alto)
+        self.__aplicar_tono(dither_ordenado(np.asarray(self.img_o)[:, :, 0],matriz,0,-1,self.hilos))
 
-                        t = int(self.img_o[img_y,img_x,0] / 28.3)
-                        umbral = matriz[f_y][f_x]
+    @_perfilado
+    def dit_azar(self, semilla = None):
+        ''' Función que aplica dithering de tipo azaroso en la imagen
 
-                        if t < umbral:
-                            self.__modificar_rgb(img_y,img_x,(0,0,0))
-                        else:
-                            self.__modificar_rgb(img_y,img_x,(255,255,255))
+            semilla: int. Semilla de los números al azar, con la misma
+                     semilla se obtiene la misma imagen'''
 
-                        # Avance barra de progreso. Inicio
-                        if num_pixel == int(pb_progress):
-                            pb.update(pb_value)
-                            pb_value += 5
-                            pb_progress += (self.ancho * self.alto) / 20
+        self.__aplicar_tono(dither_azar(np.asarray(self.img_o)[:, :, 0],semilla))
 
-                        num_pixel += 1                
-                        # Avance barra de progreso. Fin
-        
-        win.close()
-
-    def dit_azar(self):
-        ''' Función que aplica dithering de tipo azaroso en la imagen'''
-
-        cdef int y,x,r,t
-
-        # Variables de la barra de progreso. Inicio
-        cdef int pb_value = 5
-        cdef int num_pixel = 1
-        cdef double pb_progress = (self.ancho * self.alto) / 20
+    @_perfilado
+    @_en_cache
+    def dit_bayer(self, int orden):
+        ''' Función que aplica dithering ordenado con la matriz de Bayer
+            al tono de gris de la imagen
 
-        win = self.__crear_barra_de_progreso()
-        pb = win.FindElement('progress')        
-        # Variables de la barra de progreso. Fin
+            orden: int. Lado de la matriz, 2, 4 u 8'''
 
-        self.gris(3,False)
-
-        for y in range(0,self.alto):
-            for x in range(0,self.ancho):
-
-                r = randint(0,256)
-                t = self.img_o[y,x,0]
-
-                if r > t:
-                    self.__modificar_rgb(y,x,(0,0,0))
-                else:
-                    self.__modificar_rgb(y,x,(255,255,255))
+        self.__aplicar_tono(dither_bayer(tono_gris(np.asarray(self.img_o),3),orden,0,self.hilos))
 
-                # Avance barra de progreso. Inicio
-                if num_pixel == int(pb_progress):
-                    pb.update(pb_value)
-                    pb_value += 5
-                    pb_progress += (self.ancho * self.alto) / 20
+    @_perfilado
+    @_en_cache
+    def dit_difusion(self, metodo):
+        ''' Función que aplica dithering por difusión del error al tono de
+            gris de la imagen
 
-                num_pixel += 1                
-                # Avance barra de progreso. Fin
+            metodo: str. 'floyd-steinberg' o 'atkinson' '''
 
-        win.close()
\ No newline at end of file
+        self.__aplicar_tono(dither_difusion(tono_gris(np.asarray(self.img_o),3),metodo))
\ No newline at end of file
@@ -0,0 +1,611 @@
+''' Servicio local de TRENT. Atiende por HTTP (en un puerto o en un socket
+    Unix) los trabajos de un sitio web o de otros programas sin abrir la
+    interfaz gráfica ni crear un proceso por trabajo.
+
+    Las imágenes se suben una vez y se decodifican a memoria compartida, de
+    donde las leen directamente los procesos trabajadores. Los trabajadores
+    se crean al iniciar el servicio con las fuentes ya cargadas y conservan
+    entre trabajos las bibliotecas de mosaicos y las máscaras de texto. Si
+    llegan a la vez varios trabajos iguales, la cadena se aplica una sola vez
+    y todos reciben el mismo resultado.
+
+    Rutas:
+
+        POST   /imagenes        Sube una imagen jpg/png. Regresa su id en JSON
+        GET    /imagenes/<id>   Datos de la imagen en JSON
+        DELETE /imagenes/<id>   Quita la imagen
+        POST   /render          Aplica una cadena de filtros a una imagen:
+                                {"imagen": id, "cadena": "gris:3 | mosaico:8x8",
+                                 "formato": "png"}. Regresa la imagen codificada
+        GET    /estado          Estadísticas del servicio en JSON
+
+    Ejemplo:
+
+        python trent_servicio.py --puerto 8750 -p 4
+        curl --data-binary @foto.jpg localhost:8750/imagenes
+        curl -d '{"imagen": "<id>", "cadena": "gris:3"}' localhost:8750/render > gris.jpg
+'''
+
+import io
+import os
+import sys
+import json
+import signal
+import socket
+import hashlib
+import argparse
+import threading
+import socketserver
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from PIL import Image
+
+from trent_procesador import HILOS, TAMANIO_CACHE, PDI, cargar_fuente, estadisticas_cache, usar_cache
+from trent_lote import aplica_cadena, imprime_cache, parsea_cadena
+
+# Puerto por omisión del servicio
+PUERTO = 8750
+
+# Memoria compartida máxima para las imágenes subidas; al pasarla se quitan
+# las imágenes usadas hace más tiempo
+MEMORIA_IMAGENES = 1024 * 2 ** 20
+
+# Tamaño máximo del cuerpo de una petición
+MAX_CUERPO = 256 * 2 ** 20
+
+# Segundos que se espera el resultado de un trabajo
+TIEMPO_MAXIMO = 300
+
+# Formatos de salida: nombre -> (formato de PIL, tipo MIME)
+FORMATOS = {'png': ('PNG', 'image/png'),
+            'jpeg': ('JPEG', 'image/jpeg'),
+            'jpg': ('JPEG', 'image/jpeg')}
+
+# Opciones de letra cuyas fuentes se cargan al crear los trabajadores
+OPCIONES_FUENTE = ('db', 'dn', 'nps', 'm-cl')
+
+
+class ErrorServicio(Exception):
+    ''' Excepción con el código HTTP con el que se responde
+
+        estado: int. Código HTTP
+        mensaje: str. Descripción del error'''
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def codificar(arreglo, formato):
+    ''' Función que regresa la imagen codificada en el formato de PIL
+
+        arreglo: ndarray. Arreglo (alto, ancho, canales) uint8 de la imagen
+        formato: str. Formato de PIL, 'PNG' o 'JPEG' '''
+
+    img_pil = Image.fromarray(arreglo)
+
+    if formato == 'JPEG' and img_pil.mode not in ('L', 'RGB'):
+        img_pil = img_pil.convert('RGB')
+
+    salida = io.BytesIO()
+    img_pil.save(salida, format=formato, quality=95)
+
+    return salida.getvalue()
+
+
+class _ImagenCompartida:
+    ''' Imagen decodificada en un bloque de memoria compartida. El bloque se
+        libera cuando la imagen se quita y ningún trabajo la está usando'''
+
+    def __init__(self, arreglo, formato):
+        self.memoria = shared_memory.SharedMemory(create=True, size=max(1, arreglo.nbytes))
+        self.forma = arreglo.shape
+        self.tipo = arreglo.dtype.str
+        self.formato = formato
+        self.usos = 0
+        self.quitada = False
+
+        np.ndarray(self.forma, dtype=self.tipo, buffer=self.memoria.buf)[...] = arreglo
+
+    def datos(self, id_imagen):
+        return {'id': id_imagen,
+                'ancho': self.forma[1],
+                'alto': self.forma[0],
+                'canales': self.forma[2] if len(self.forma) > 2 else 1,
+                'formato': self.formato}
+
+    def liberar(self):
+        self.memoria.close()
+        self.memoria.unlink()
+
+
+class AlmacenImagenes:
+    ''' Imágenes subidas al servicio, identificadas por el hash de su
+        archivo, así que subir dos veces la misma imagen no la duplica
+
+        memoria: int. Bytes máximos de memoria compartida'''
+
+    def __init__(self, memoria = MEMORIA_IMAGENES):
+        self.memoria = memoria
+        self.usada = 0
+        self.imagenes = OrderedDict()
+        self.candado = threading.Lock()
+
+    def agregar(self, datos):
+        ''' Función que decodifica la imagen a memoria compartida y regresa
+            sus datos. Si ya se había subido solo regresa sus datos
+
+            datos: bytes. Archivo de la imagen'''
+
+        id_imagen = hashlib.sha256(datos).hexdigest()[:32]
+
+        with self.candado:
+            if id_imagen in self.imagenes:
+                self.imagenes.move_to_end(id_imagen)
+                return self.imagenes[id_imagen].datos(id_imagen)
+
+        try:
+            with Image.open(io.BytesIO(datos)) as img_pil:
+                formato = img_pil.format
+                arreglo = np.array(img_pil)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ErrorServicio(400, 'No se pudo leer la imagen: %s' % e)
+
+        if arreglo.nbytes > self.memoria:
+            raise ErrorServicio(413, 'La imagen no cabe en la memoria del servicio')
+
+        imagen = _ImagenCompartida(arreglo, formato)
+        del arreglo
+
+        with self.candado:
+            if id_imagen in self.imagenes:
+                imagen.liberar()
+            else:
+                self.imagenes[id_imagen] = imagen
+                self.usada += imagen.memoria.size
+                self.__reducir()
+
+            return self.imagenes[id_imagen].datos(id_imagen)
+
+    def datos(self, id_imagen):
+        ''' Función que regresa los datos de la imagen
+
+            id_imagen: str. Id de la imagen'''
+
+        with self.candado:
+            return self.__buscar(id_imagen).datos(id_imagen)
+
+    def tomar(self, id_imagen):
+        ''' Función que regresa la imagen y la marca como usada por un
+            trabajo, para que no se libere hasta que se suelte
+
+            id_imagen: str. Id de la imagen'''
+
+        with self.candado:
+            imagen = self.__buscar(id_imagen)
+            imagen.usos += 1
+            self.imagenes.move_to_end(id_imagen)
+
+            return imagen
+
+    def soltar(self, imagen):
+        ''' Función que indica que un trabajo terminó de usar la imagen
+
+            imagen: _ImagenCompartida. Imagen de tomar'''
+
+        with self.candado:
+            imagen.usos -= 1
+
+            if imagen.quitada and imagen.usos == 0:
+                imagen.liberar()
+
+            self.__reducir()
+
+    def quitar(self, id_imagen):
+        ''' Función que quita la imagen del almacén
+
+            id_imagen: str. Id de la imagen'''
+
+        with self.candado:
+            self.__quitar(id_imagen, self.__buscar(id_imagen))
+
+    def cerrar(self):
+        ''' Función que libera todas las imágenes'''
+
+        with self.candado:
+            for id_imagen, imagen in list(self.imagenes.items()):
+                imagen.usos = 0
+                self.__quitar(id_imagen, imagen)
+
+    def estadisticas(self):
+        with self.candado:
+            return {'imagenes': len(self.imagenes), 'memoria': self.usada, 'memoria_maxima': self.memoria}
+
+    def __buscar(self, id_imagen):
+        if id_imagen not in self.imagenes:
+            raise ErrorServicio(404, "La imagen '%s' no existe" % id_imagen)
+
+        return self.imagenes[id_imagen]
+
+    def __quitar(self, id_imagen, imagen):
+        del self.imagenes[id_imagen]
+        self.usada -= imagen.memoria.size
+        imagen.quitada = True
+
+        if imagen.usos == 0:
+            imagen.liberar()
+
+    def __reducir(self):
+        # Se quitan las imágenes usadas hace más tiempo que no estén en uso
+        for id_imagen in list(self.imagenes):
+            if self.usada <= self.memoria:
+                break
+
+            if self.imagenes[id_imagen].usos == 0:
+                self.__quitar(id_imagen, self.imagenes[id_imagen])
+
+
+# Número de hilos de los PDI de cada trabajador
+_hilos = 1
+
+
+def _inicia_trabajador(hilos, cache, tamanio_cache):
+    ''' Función que prepara un proceso trabajador: carga de una vez las
+        fuentes de letra para que el primer trabajo no espere
+
+        hilos: int. Número de hilos de los PDI
+        cache: str. Directorio de la cache de resultados, None para no usarla
+        tamanio_cache: int. Bytes máximos de la cache de resultados'''
+
+    global _hilos
+
+    # Ctrl+C lo atiende el proceso principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _hilos = hilos
+    usar_cache(cache, tamanio_cache)
+
+    pdi = PDI(np.zeros((1, 1, 3), dtype=np.uint8))
+
+    for opcion in OPCIONES_FUENTE:
+        cargar_fuente(*pdi.selecciona_fuente(opcion))
+
+
+def _aplica(buffer, forma, tipo, pasos, formato):
+    try:
+        pdi = PDI(np.ndarray(forma, dtype=tipo, buffer=buffer), copiar=False)
+        pdi.set_hilos(_hilos)
+        aplica_cadena(pdi, pasos)
+
+        return codificar(pdi.get_arreglo(), formato), None
+
+    except Exception as e:
+        return None, '%s: %s' % (type(e).__name__, e)
+
+
+def _render(nombre, forma, tipo, pasos, formato):
+    ''' Función que aplica la cadena de filtros a la imagen de la memoria
+        compartida en un proceso trabajador. Regresa una tupla
+        (imagen codificada, error, cache), con cache una tupla (id del
+        proceso, estadísticas de su cache de resultados)
+
+        nombre: str. Nombre del bloque de memoria compartida
+        forma: tuple. Forma del arreglo de la imagen
+        tipo: str. Tipo de dato del arreglo
+        pasos: list. Lista de tuplas (nombre, argumentos) de parsea_cadena
+        formato: str. Formato de PIL de la imagen resultante'''
+
+    try:
+        memoria = shared_memory.SharedMemory(name=nombre)
+    except Exception as e:
+        return None, '%s: %s' % (type(e).__name__, e), (os.getpid(), estadisticas_cache())
+
+    # El PDI lee la imagen directamente de la memoria compartida sin copiarla;
+    # el bloque se cierra cuando _aplica ya soltó todas las referencias a ella
+    try:
+        datos, error = _aplica(memoria.buf, forma, tipo, pasos, formato)
+    finally:
+        memoria.close()
+
+    return datos, error, (os.getpid(), estadisticas_cache())
+
+
+class ServicioRender:
+    ''' Conjunto de procesos trabajadores que aplican las cadenas de filtros
+        a las imágenes del almacén
+
+        procesos: int. Número de procesos trabajadores
+        hilos: int. Número de hilos de cada trabajador. Por omisión se
+               reparten los núcleos entre los trabajadores
+        memoria: int. Bytes máximos de memoria compartida para las imágenes
+        tiempo_maximo: float. Segundos que se espera el resultado de un trabajo
+        cache: str. Directorio de la cache de resultados de los filtros,
+               compartida por los trabajadores. None para no usarla
+        tamanio_cache: int. Bytes máximos de la cache de resultados'''
+
+    def __init__(self, procesos = 1, hilos = None, memoria = MEMORIA_IMAGENES, tiempo_maximo = TIEMPO_MAXIMO,
+                 cache = None, tamanio_cache = TAMANIO_CACHE):
+        if hilos is None:
+            hilos = max(1, HILOS // procesos)
+
+        # Los trabajadores deben compartir el rastreador de la memoria
+        # compartida del proceso principal; si no, al terminar liberarían
+        # las imágenes que abrieron
+        resource_tracker.ensure_running()
+
+        self.procesos = procesos
+        self.tiempo_maximo = tiempo_maximo
+        self.almacen = AlmacenImagenes(memoria)
+        self.pool = multiprocessing.Pool(procesos, _inicia_trabajador, (hilos, cache, tamanio_cache))
+        self.en_curso = {}     # (id, pasos, formato) -> Future del trabajo
+        self.caches = {}       # Id del trabajador -> estadísticas de su cache
+        self.candado = threading.Lock()
+        self.trabajos = 0
+        self.coalescidos = 0
+        self.errores = 0
+
+    def render(self, id_imagen, cadena, formato = None):
+        ''' Función que aplica la cadena de filtros a la imagen y regresa una
+            tupla (imagen codificada, tipo MIME, coalescido). coalescido
+            indica si el resultado se compartió con un trabajo igual que ya
+            estaba en curso
+
+            id_imagen: str. Id de la imagen
+            cadena: str. Descripción de la cadena de filtros, p. ej. "gris:3 | mosaico:8x8"
+            formato: str. 'png' o 'jpeg'. Por omisión el de la imagen subida'''
+
+        try:
+            pasos = parsea_cadena(cadena)
+        except ValueError as e:
+            raise ErrorServicio(400, str(e))
+
+        imagen = self.almacen.tomar(id_imagen)
+
+        if formato is None:
+            formato = 'jpeg' if imagen.formato == 'JPEG' else 'png'
+
+        if formato not in FORMATOS:
+            self.almacen.soltar(imagen)
+            raise ErrorServicio(400, "El formato '%s' no existe" % formato)
+
+        formato_pil, tipo_mime = FORMATOS[formato]
+        clave = (id_imagen, tuple(pasos), formato_pil)
+
+        with self.candado:
+            futuro = self.en_curso.get(clave)
+            coalescido = futuro is not None
+
+            if coalescido:
+                self.coalescidos += 1
+            else:
+                futuro = self.en_curso[clave] = Future()
+                self.trabajos += 1
+
+        if coalescido:
+            self.almacen.soltar(imagen)
+        else:
+            terminar = lambda resultado: self.__terminar(clave, imagen, futuro, resultado)
+            self.pool.apply_async(_render, (imagen.memoria.name, imagen.forma, imagen.tipo, pasos, formato_pil),
+                                  callback=terminar, error_callback=lambda e: terminar((None, str(e), (None, None))))
+
+        try:
+            datos, error, _ = futuro.result(self.tiempo_maximo)
+        except TimeoutError:
+            raise ErrorServicio(504, 'El trabajo no terminó en %d s' % self.tiempo_maximo)
+
+        if error is not None:
+            raise ErrorServicio(422, error)
+
+        return datos, tipo_mime, coalescido
+
+    def estadisticas(self):
+        ''' Función que regresa las estadísticas del servicio'''
+
+        with self.candado:
+            estadisticas = {'procesos': self.procesos,
+                            'trabajos': self.trabajos,
+                            'coalescidos': self.coalescidos,
+                            'errores': self.errores,
+                            'en_curso': len(self.en_curso)}
+
+            if self.caches:
+                estadisticas['cache'] = {campo: sum(cache[campo] for cache in self.caches.values())
+                                         for campo in ('aciertos', 'fallos', 'escrituras', 'expulsados')}
+
+        estadisticas.update(self.almacen.estadisticas())
+
+        return estadisticas
+
+    def cerrar(self):
+        ''' Función que detiene los trabajadores y libera las imágenes'''
+
+        self.pool.terminate()
+        self.pool.join()
+        self.almacen.cerrar()
+
+    def __terminar(self, clave, imagen, futuro, resultado):
+        # Se llama en el hilo de resultados del pool
+        with self.candado:
+            del self.en_curso[clave]
+
+            if resultado[1] is not None:
+                self.errores += 1
+
+            proceso, cache = resultado[2]
+
+            if cache is not None:
+                self.caches[proceso] = cache
+
+        self.almacen.soltar(imagen)
+        futuro.set_result(resultado)
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    ''' Atiende las peticiones HTTP del servicio'''
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'TRENT'
+
+    def do_GET(self):
+        self.__atender(self.__get)
+
+    def do_POST(self):
+        self.__atender(self.__post)
+
+    def do_DELETE(self):
+        self.__atender(self.__delete)
+
+    def address_string(self):
+        # En un socket Unix no hay dirección del cliente
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def __get(self, servicio, partes):
+        if partes == ['estado']:
+            return self.__json(200, servicio.estadisticas())
+
+        if len(partes) == 2 and partes[0] == 'imagenes':
+            return self.__json(200, servicio.almacen.datos(partes[1]))
+
+        raise ErrorServicio(404, 'Ruta desconocida')
+
+    def __post(self, servicio, partes):
+        if partes == ['imagenes']:
+            return self.__json(201, servicio.almacen.agregar(self.__cuerpo()))
+
+        if partes == ['render']:
+            try:
+                trabajo = json.loads(self.__cuerpo())
+                datos, tipo_mime, coalescido = servicio.render(trabajo['imagen'], trabajo['cadena'],
+                                                               trabajo.get('formato'))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise ErrorServicio(400, 'Trabajo inválido: %s' % e)
+
+            return self.__responder(200, datos, tipo_mime, {'X-TRENT-Coalescido': int(coalescido)})
+
+        raise ErrorServicio(404, 'Ruta desconocida')
+
+    def __delete(self, servicio, partes):
+        if len(partes) == 2 and partes[0] == 'imagenes':
+            servicio.almacen.quitar(partes[1])
+            return self.__responder(204, b'')
+
+        raise ErrorServicio(404, 'Ruta desconocida')
+
+    def __atender(self, metodo):
+        partes = [parte for parte in self.path.split('?')[0].split('/') if parte]
+
+        try:
+            metodo(self.server.servicio, partes)
+        except ErrorServicio as e:
+            self.__json(e.estado, {'error': str(e)})
+        except Exception as e:
+            self.__json(500, {'error': '%s: %s' % (type(e).__name__, e)})
+
+    def __cuerpo(self):
+        largo = int(self.headers.get('Content-Length', 0))
+
+        if largo > MAX_CUERPO:
+            self.close_connection = True
+            raise ErrorServicio(413, 'La petición pasa de %d bytes' % MAX_CUERPO)
+
+        return self.rfile.read(largo)
+
+    def __json(self, estado, valor):
+        self.__responder(estado, json.dumps(valor, ensure_ascii=False).encode('utf-8'),
+                         'application/json; charset=utf-8')
+
+    def __responder(self, estado, datos, tipo = None, encabezados = {}):
+        self.send_response(estado)
+
+        if tipo is not None:
+            self.send_header('Content-Type', tipo)
+
+        for nombre, valor in encabezados.items():
+            self.send_header(nombre, str(valor))
+
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+
+class _ServidorUnix(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def crear_servidor(servicio, host = '127.0.0.1', puerto = PUERTO, unix = None):
+    ''' Función que regresa el servidor HTTP del servicio, en el puerto o en
+        el socket Unix
+
+        servicio: ServicioRender. Servicio que atiende los trabajos
+        host: str. Dirección donde se escucha
+        puerto: int. Puerto donde se escucha
+        unix: str. Ruta del socket Unix. Si se da, no se usa el puerto'''
+
+    if unix is not None:
+        if os.path.exists(unix):
+            os.unlink(unix)
+
+        servidor = _ServidorUnix(unix, _Manejador)
+    else:
+        servidor = ThreadingHTTPServer((host, puerto), _Manejador)
+
+    servidor.servicio = servicio
+
+    return servidor
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Servicio local que aplica cadenas de filtros de TRENT por HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='dirección donde se escucha (por omisión, %(default)s)')
+    parser.add_argument('--puerto', type=int, default=PUERTO, help='puerto donde se escucha (por omisión, %(default)s)')
+    parser.add_argument('--unix', metavar='RUTA', help='escucha en un socket Unix en lugar del puerto')
+    parser.add_argument('-p', '--procesos', type=int, default=os.cpu_count() or 1,
+                        help='número de procesos trabajadores (por omisión, uno por núcleo)')
+    parser.add_argument('--hilos', type=int, help='hilos de cada trabajador (por omisión, se reparten los núcleos)')
+    parser.add_argument('--memoria', type=int, default=MEMORIA_IMAGENES // 2 ** 20, metavar='MB',
+                        help='memoria para las imágenes subidas (por omisión, %(default)s MB)')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='guarda los resultados de los filtros en DIR y los reutiliza entre sesiones')
+    parser.add_argument('--cache-mb', type=int, default=TAMANIO_CACHE // 2 ** 20, metavar='MB',
+                        help='tamaño máximo de la cache (por omisión, %(default)s MB)')
+    args = parser.parse_args(argv)
+
+    if args.unix is not None and not hasattr(socket, 'AF_UNIX'):
+        parser.error('Este sistema no tiene sockets Unix')
+
+    servicio = ServicioRender(max(1, args.procesos), args.hilos, args.memoria * 2 ** 20,
+                              cache=args.cache, tamanio_cache=args.cache_mb * 2 ** 20)
+
+    try:
+        servidor = crear_servidor(servicio, args.host, args.puerto, args.unix)
+    except OSError as e:
+        servicio.cerrar()
+        print(e, file=sys.stderr)
+        return 1
+
+    print('Servicio de TRENT en %s con %d procesos' % (args.unix or '%s:%d' % (args.host, args.puerto),
+                                                      servicio.procesos))
+
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servicio.cerrar()
+
+        if servicio.caches:
+            imprime_cache(servicio.caches)
+
+        if args.unix is not None and os.path.exists(args.unix):
+            os.unlink(args.unix)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
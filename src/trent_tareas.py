@@ -0,0 +1,201 @@
+''' Ejecución en segundo plano de los filtros de TRENT para la interfaz.
+
+    Las tareas se ejecutan una a la vez y en orden en un hilo aparte, así que
+    el ciclo de eventos de la ventana nunca se bloquea. El resultado y el
+    avance de cada tarea se mandan a la ventana como eventos con
+    write_event_value, y el ciclo de eventos llama a despachar para ejecutar
+    en su hilo la función que recibe el resultado.
+
+    Una tarea nueva de un grupo reemplaza a las tareas pendientes del mismo
+    grupo y cancela la que se esté ejecutando, para que los cambios rápidos de
+    un control no se acumulen en la fila.
+'''
+
+import threading
+
+from trent_procesador import Progreso
+
+# Evento con el resultado de una tarea: (id, resultado, error)
+EVENTO_TAREA = '-TAREA-'
+
+# Evento con el avance de una tarea: (titulo, fraccion), fraccion None al terminar
+EVENTO_PROGRESO = '-PROGRESO-'
+
+
+class ProgresoEventos(Progreso):
+    ''' Suscriptor del avance que manda el avance de los filtros a la ventana
+        como eventos y cancela el filtro si su tarea fue reemplazada o
+        cancelada
+
+        trabajador: Trabajador. Trabajador que ejecuta los filtros'''
+
+    def __init__(self, trabajador):
+        self.trabajador = trabajador
+        self.titulo = None
+
+    def inicio(self, titulo):
+        self.titulo = titulo
+        self.trabajador.publicar(EVENTO_PROGRESO, (titulo, 0.0))
+
+    def avance(self, fraccion):
+        self.trabajador.publicar(EVENTO_PROGRESO, (self.titulo, fraccion))
+        return not self.trabajador.cancelada()
+
+    def fin(self):
+        self.trabajador.publicar(EVENTO_PROGRESO, (self.titulo, None))
+
+
+class Trabajador:
+    ''' Hilo que ejecuta las tareas de la interfaz una tras otra.
+
+        Las tareas no deben tocar la ventana; su resultado se entrega en el
+        hilo de la ventana a la función al_terminar cuando el ciclo de
+        eventos llama a despachar
+
+        ventana: sg.Window. Ventana que recibe los eventos'''
+
+    def __init__(self, ventana):
+        self.ventana = ventana
+        self.condicion = threading.Condition()
+        self.pendientes = []     # Lista de tuplas (id, grupo, funcion, argumentos)
+        self.actual = None       # (id, grupo) de la tarea en ejecución
+        self.canceladas = set()  # Ids de las tareas que se deben detener
+        self.descartadas = set() # Ids de las tareas cuyo resultado ya no se entrega
+        self.al_terminar = {}    # id -> función que recibe el resultado
+        self.ultimo_id = 0
+        self.activo = True
+
+        self.hilo = threading.Thread(target=self.__ejecutar, daemon=True)
+        self.hilo.start()
+
+    def publicar(self, evento, valor):
+        ''' Función que manda un evento a la ventana desde cualquier hilo
+
+            evento: str. Nombre del evento
+            valor: object. Valor del evento'''
+
+        if self.activo:
+            self.ventana.write_event_value(evento, valor)
+
+    def enviar(self, funcion, *args, grupo = None, al_terminar = None):
+        ''' Función que agrega una tarea a la fila. Regresa su id
+
+            funcion: function. Función a ejecutar en segundo plano
+            args: tuple. Argumentos de la función
+            grupo: str. Grupo de la tarea; la tarea reemplaza a las pendientes
+                   del mismo grupo y cancela la que se esté ejecutando
+            al_terminar: function. Función que recibe el resultado en el
+                         hilo de la ventana'''
+
+        with self.condicion:
+            self.ultimo_id += 1
+
+            if grupo is not None:
+                for tarea in self.pendientes:
+                    if tarea[1] == grupo:
+                        self.al_terminar.pop(tarea[0], None)
+
+                self.pendientes = [tarea for tarea in self.pendientes if tarea[1] != grupo]
+
+                if self.actual is not None and self.actual[1] == grupo:
+                    self.canceladas.add(self.actual[0])
+
+            self.pendientes.append((self.ultimo_id, grupo, funcion, args))
+
+            if al_terminar is not None:
+                self.al_terminar[self.ultimo_id] = al_terminar
+
+            self.condicion.notify()
+
+            return self.ultimo_id
+
+    def cancelar(self, descartar = False):
+        ''' Función que descarta las tareas pendientes y cancela la que se
+            esté ejecutando
+
+            descartar: bool. Valor que indica si tampoco entregar el
+                       resultado ni el error de la tarea en ejecución aunque
+                       termine, para cuando ya no existe lo que modificaba'''
+
+        with self.condicion:
+            for tarea in self.pendientes:
+                self.al_terminar.pop(tarea[0], None)
+
+            self.pendientes = []
+
+            if self.actual is not None:
+                self.canceladas.add(self.actual[0])
+
+                if descartar:
+                    self.al_terminar.pop(self.actual[0], None)
+                    self.descartadas.add(self.actual[0])
+
+    def cancelada(self):
+        ''' Función que indica si la tarea en ejecución se debe detener'''
+
+        with self.condicion:
+            return self.actual is not None and self.actual[0] in self.canceladas
+
+    def ocupado(self):
+        ''' Función que indica si hay tareas pendientes o en ejecución'''
+
+        with self.condicion:
+            return self.actual is not None or len(self.pendientes) > 0
+
+    def despachar(self, valor):
+        ''' Función que se llama en el hilo de la ventana con el valor de
+            EVENTO_TAREA. Entrega el resultado a la función al_terminar de la
+            tarea y regresa el error de la tarea, None si terminó bien o se
+            descartó
+
+            valor: tuple. Valor del evento (id, resultado, error)'''
+
+        id_tarea, resultado, error = valor
+
+        with self.condicion:
+            al_terminar = self.al_terminar.pop(id_tarea, None)
+
+            if id_tarea in self.descartadas:
+                self.descartadas.discard(id_tarea)
+                return None
+
+        if error is None and al_terminar is not None:
+            al_terminar(resultado)
+
+        return error
+
+    def cerrar(self):
+        ''' Función que cancela las tareas y detiene el hilo'''
+
+        self.cancelar(True)
+
+        with self.condicion:
+            self.activo = False
+            self.condicion.notify()
+
+    def __ejecutar(self):
+        while True:
+            with self.condicion:
+                while self.activo and not self.pendientes:
+                    self.condicion.wait()
+
+                if not self.activo:
+                    return
+
+                id_tarea, grupo, funcion, args = self.pendientes.pop(0)
+                self.actual = (id_tarea, grupo)
+
+            resultado = error = None
+
+            try:
+                resultado = funcion(*args)
+            except Exception as e:
+                error = e
+
+            # Si la tarea terminó aunque se pidió cancelarla, su resultado
+            # ya cambió el historial, así que se entrega de todas formas
+            with self.condicion:
+                self.actual = None
+                self.canceladas.discard(id_tarea)
+
+            self.publicar(EVENTO_TAREA, (id_tarea, resultado, error))
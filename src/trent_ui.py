@@ -1,11 +1,31 @@
+import time
+
+# Momento en que arranca el programa, para medir el tiempo de arranque
+INICIO = time.perf_counter()
+
 import PySimpleGUI as sg
 
 from tkinter import Tk
 from tkinter.filedialog import askopenfilename,asksaveasfilename
 
+import os
+import os.path
 from sys import platform
-from trent_procesador import PDI
-from matplotlib.font_manager import fontManager
+from random import randrange
+from trent_procesador import PDI,FiltroCancelado,ANCHO_VISTA,ALTO_VISTA,INDICE_BIBLIOTECA,activar_perfil,desactivar_perfil
+from trent_historial import Historial
+from trent_tareas import Trabajador,ProgresoEventos,EVENTO_TAREA,EVENTO_PROGRESO
+
+# Directorio donde se guarda el índice de una carpeta de mosaicos
+DIR_INDICE = '.trent_mosaicos'
+
+# Variable de entorno con la que el programa termina en cuanto se muestra la
+# ventana e imprime el tiempo de arranque, para medirlo con trent_benchmark
+VARIABLE_ARRANQUE = 'TRENT_SOLO_ARRANQUE'
+
+# Variable de entorno con el archivo donde se guarda el perfil de la sesión,
+# .json para abrirlo en chrome://tracing o Perfetto y .jsonl para procesarlo
+VARIABLE_PERFIL = 'TRENT_PERFIL'
 
 
 def abrir_imagen():
@@ -24,7 +44,153 @@ def guardar_imagen():
     return ruta_carpeta
 
 
+def muestra_imagen(data):
+    ''' Función que muestra en la ventana la imagen recibida
+
+        data: bytes. Imagen codificada de get_img'''
+
+    window["ORI-IMG"].update(data = data)
+
+
+def _agrega_filtro(historial, filtro, args):
+    historial.agregar(filtro,*args)
+    return historial.pdi_vista.get_img('o')
+
+
+def aplica_filtro(filtro, *args):
+    ''' Función que manda a segundo plano agregar un filtro al historial
+        de la imagen y muestra el resultado al terminar. Si el usuario lo
+        cancela la imagen queda como estaba
+
+        filtro: str. Nombre del método del PDI a aplicar
+        args: tuple. Argumentos del filtro'''
+
+    trabajador.enviar(_agrega_filtro,historial,filtro,args,al_terminar = muestra_imagen)
+
+
+def _vista_filtro(historial, estado, filtro, args):
+    if 'paso' in estado:
+        historial.modificar(estado['paso'],*args)
+    else:
+        historial.agregar(filtro,*args)
+        estado['paso'] = len(historial) - 1
+
+    return historial.pdi_vista.get_img('o')
+
+
+def vista_filtro(estado, filtro, *args):
+    ''' Función que aplica el filtro como un paso del historial que se
+        puede seguir ajustando: la primera vez lo agrega y después solo cambia
+        sus argumentos. Cada llamada reemplaza a la anterior si todavía no
+        termina, así que mover un control rápido no acumula filtros en la fila
+
+        estado: dict. Estado del paso, vacío antes de la primera llamada
+        filtro: str. Nombre del método del PDI a aplicar
+        args: tuple. Argumentos del filtro'''
+
+    trabajador.enviar(_vista_filtro,historial,estado,filtro,args,grupo = filtro,al_terminar = muestra_imagen)
+
+
+def _quita_vista(historial, estado):
+    if 'paso' in estado and len(historial) == estado['paso'] + 1:
+        historial.deshacer()
+
+    return historial.pdi_vista.get_img('o')
+
+
+def atiende_tarea(event, values):
+    ''' Función que atiende los eventos del trabajador: muestra el avance
+        de los filtros y entrega el resultado de las tareas. Regresa True si
+        el evento era del trabajador
+
+        event: str. Evento de la ventana
+        values: dict. Valores de la ventana'''
+
+    if event == EVENTO_TAREA:
+        error = trabajador.despachar(values[event])
+
+        if error is not None and not isinstance(error,FiltroCancelado):
+            sg.popup('No se pudo completar la operación: %s' % error,title = 'Error',keep_on_top = True)
+
+    elif event == EVENTO_PROGRESO:
+        titulo, fraccion = values[event]
+        ocupado = fraccion is not None
+
+        window['-TITULO-'].update(titulo if ocupado else '')
+        window['-AVANCE-'].update(int(fraccion * 100) if ocupado else 0,visible = ocupado)
+        window['-CANCELAR-'].update(visible = ocupado)
+
+    elif event == '-CANCELAR-':
+        trabajador.cancelar()
+
+    else:
+        return False
+
+    return True
+
+
+def atiende_ventana():
+    ''' Función que atiende los eventos pendientes del trabajador mientras
+        está abierto un diálogo'''
+
+    event, values = window.read(timeout = 0)
+    atiende_tarea(event,values)
+
+
+def _agrega_fotomosaico(historial, carpeta, num_columnas, num_filas):
+    from trent_biblioteca import construir_biblioteca
+
+    indice = os.path.join(carpeta,DIR_INDICE)
+
+    # El índice de la carpeta se crea la primera vez que se usa
+    if not os.path.isfile(os.path.join(indice,INDICE_BIBLIOTECA)):
+        construir_biblioteca(carpeta,indice)
+
+    return _agrega_filtro(historial,'fotomosaico',(indice,num_columnas,num_filas))
+
+
+def _abre_imagen(ruta):
+    pdi = PDI(ruta,ProgresoEventos(trabajador))
+    historial = Historial(pdi,vista = (ANCHO_VISTA,ALTO_VISTA))
+    historial.pdi_vista.set_progreso(ProgresoEventos(trabajador))
+
+    return pdi, historial, historial.pdi_vista.get_img('o')
+
+
+def _imagen_abierta(resultado):
+    global pdi, historial
+
+    pdi, historial, data = resultado
+    muestra_imagen(data)
+
+
+def _guarda_imagen(historial, ruta):
+    return historial.completa().guardar(ruta)
+
+
+def _imagen_guardada(guardada):
+    if guardada:
+        sg.popup("Guardado correctamente")
+    else:
+        sg.popup("Formato de guardado no coincide con el formato nativo de la imagen",title = 'Error',keep_on_top = True)
+
+
+def _muestra_paso(historial, deshacer):
+    if not (historial.deshacer() if deshacer else historial.rehacer()):
+        return None
+
+    return historial.pdi_vista.get_img('o')
+
+
+def _paso_mostrado(data):
+    if data is not None:
+        muestra_imagen(data)
+
+
 def seleccionador_fuente():
+    # matplotlib tarda en cargar la lista de fuentes, así que se importa
+    # hasta que se abre el seleccionador
+    from matplotlib.font_manager import fontManager
 
     dict_fonts = {}
 
@@ -89,20 +255,26 @@ menu_def = [['Archivo', ['Abrir', 'Guardar', 'Cerrar']],
                         'Encontrar bordes',
                         'Sharpen',
                         'Emboss',
-                        'Erosion',['Maximo','Minimo']],
+                        'Erosion',['Maximo','Minimo'],
+                        'Morfologia'],
                     'Convertir a letras',
                     'Marca de agua',
                     'Convertir a imagen recursiva',['Tonos de gris','Color'],
                     'Convertir a semitonos',['Nueve puntos','Cuatro puntos','Un punto de distintos tamaños'],
-                    'Dithering',['Ordenado','Disperso','Azaroso'],
+                    'Fotomosaico',
+                    'Dithering',['Ordenado','Disperso','Azaroso','Bayer 2x2','Bayer 4x4','Bayer 8x8','Floyd-Steinberg','Atkinson'],
                     'Brillo',
-                    'Deshacer']]]
+                    'Deshacer',
+                    'Rehacer']]]
 
 
 # Organizacion de los componentes de la interfaz
 layout = [
     [sg.Menu(menu_def)],
     [sg.Image(key='ORI-IMG',size = (700,400))],
+    [sg.Text('',size = (20,1),key = '-TITULO-'),
+     sg.ProgressBar(100,orientation = 'h',size = (20,10),key = '-AVANCE-',visible = False),
+     sg.Button('Cancelar',key = '-CANCELAR-',visible = False)],
 ]
 
 # Genera la ventana
@@ -114,8 +286,23 @@ if platform == "win32":
 elif platform in ["linux","linux2"]:
     window.set_icon("./icon/logo1.png")
 
+# Los filtros se aplican en segundo plano para no bloquear la ventana
+trabajador = Trabajador(window)
+
+if os.environ.get(VARIABLE_ARRANQUE):
+    window.finalize()
+    print('arranque %.3f' % (time.perf_counter() - INICIO))
+    trabajador.cerrar()
+    window.close()
+    raise SystemExit(0)
+
+# Se miden las etapas de los filtros de toda la sesión
+if os.environ.get(VARIABLE_PERFIL):
+    activar_perfil()
+
 img = None
 pdi = None
+historial = None
 
 # Loop para procesar los eventos y obtener los valores de los posibles inputs
 while True:
@@ -123,6 +310,9 @@ while True:
 
     if event == sg.WIN_CLOSED or event == 'Salir': # if user closes window or clicks cancel
         break
+
+    elif atiende_tarea(event,values):
+        continue
     
     elif event == 'Abrir':
 
@@ -130,8 +320,8 @@ while True:
 
         if isinstance(ruta,str) and ruta != '':
             if ruta.lower().endswith((".png", ".jpg", ".jpeg")):
-                pdi = PDI(ruta)
-                window["ORI-IMG"].update(data = pdi.get_img('o'))
+                trabajador.cancelar(descartar = True)
+                trabajador.enviar(_abre_imagen,ruta,al_terminar = _imagen_abierta)
             else:
                 sg.popup('Formato de archivo inválido! (solo .png .jpg y .jpeg)',title = 'Error',keep_on_top = True)
 
@@ -140,10 +330,7 @@ while True:
         if pdi != None:
             ruta = guardar_imagen()
             if ruta.endswith((".png", ".jpg", ".jpeg")):
-                if pdi.guardar(ruta):
-                    sg.popup("Guardado correctamente")
-                else:
-                    sg.popup("Formato de guardado no coincide con el formato nativo de la imagen",title = 'Error',keep_on_top = True)
+                trabajador.enviar(_guarda_imagen,historial,ruta,al_terminar = _imagen_guardada)
             else:
                 sg.popup("Nombre de archivo inválido",title = 'Error',keep_on_top = True)
         else:
@@ -152,14 +339,15 @@ while True:
 
     elif event == 'Cerrar':
 
+        trabajador.cancelar(descartar = True)
         pdi = None
+        historial = None
         window["ORI-IMG"].update(data = None)
 
     elif event in ('Tono 1' , 'Tono 2' , 'Tono 3' , 'Tono 4' , 'Tono 5' , 'Tono 6' , 'Tono 7' , 'Tono 8' , 'Tono 9'):
 
         if pdi != None:
-            pdi.gris(int(event[-1]),True)
-            window["ORI-IMG"].update(data = pdi.get_img('m',True))
+            aplica_filtro('gris',int(event[-1]),True)
         else:
             sg.popup('No se ha abierto ninguna imagen',title = 'Error',keep_on_top = True)
 
@@ -191,8 +379,7 @@ while True:
                         continue
 
                     win_mosaico.hide()
-                    pdi.mosaico(v_c,v_f)
-                    window["ORI-IMG"].update(data = pdi.get_img('m',True))
+                    aplica_filtro('mosaico',v_c,v_f)
                     win_mosaico.close()
 
         else:
@@ -203,39 +390,43 @@ while True:
         if pdi != None:
             # Organización de los componentes del widget de brillo
             layout_b = [
-                [sg.Slider(range = (-100,100),default_value = 0,orientation = 'horizontal',key = 'v-brillo')],
+                [sg.Slider(range = (-100,100),default_value = 0,orientation = 'horizontal',key = 'v-brillo',enable_events = True)],
                 [sg.Button('Aplicar',key = 'apl-brillo')]
             ]
             
             win_brillo = sg.Window('Brillo',layout_b,element_justification = 'center',keep_on_top = True,modal = True)
 
+            # El brillo se ve en la imagen mientras se mueve el control
+            vista_brillo = {}
+
             while True:
-                event2,values2 = win_brillo.read()
+                event2,values2 = win_brillo.read(timeout = 50)
+                atiende_ventana()
 
                 if event2 == sg.WIN_CLOSED:
+                    trabajador.enviar(_quita_vista,historial,vista_brillo,grupo = 'modificar_brillo',al_terminar = muestra_imagen)
                     break
-                elif event2 == 'apl-brillo':
-                    v = values2['v-brillo']
-                    win_brillo.hide()
-                    pdi.modificar_brillo(v,True,False)
-                    window["ORI-IMG"].update(data = pdi.get_img('m',True))                    
-                    win_brillo.close()
+                elif event2 in ('v-brillo','apl-brillo'):
+                    v = int(values2['v-brillo'])
+                    vista_filtro(vista_brillo,'modificar_brillo',v,True,False)
+
+                    if event2 == 'apl-brillo':
+                        win_brillo.close()
+                        break
         else:
             sg.popup('No se ha abierto ninguna imagen',title = 'Error',keep_on_top = True)
 
     elif event == 'Alto contraste':
     
         if pdi != None:
-            pdi.alto_contraste(True)
-            window["ORI-IMG"].update(data = pdi.get_img('m',True))
+            aplica_filtro('alto_contraste',True)
         else:
             sg.popup('No se ha abierto ninguna imagen',title = 'Error',keep_on_top = True)
 
     elif event == 'Inverso':
         
         if pdi != None:
-            pdi.inverso(True)
-            window["ORI-IMG"].update(data = pdi.get_img('m',True))
+            aplica_filtro('inverso',True)
         else:
             sg.popup('No se ha abierto ninguna imagen',title = 'Error',keep_on_top = True)
 
@@ -264,8 +455,7 @@ while True:
                     n_b = int(val_rgb['v-azul'])
 
                     win_rgb.hide()
-                    pdi.capa_rgb(n_r,n_g,n_b,True,True)
-                    window["ORI-IMG"].update(data = pdi.get_img('m',True))
+                    aplica_filtro('capa_rgb',n_r,n_g,n_b,True,True)
                     win_rgb.close()
         else:
             sg.popup('No se ha abierto ninguna imagen',title = 'Error',keep_on_top = True)
@@ -273,8 +463,7 @@ while True:
     elif event in ('Suave','Fuerte','Motion Blur','Encontrar bordes','Sharpen','Emboss'):
         
         if pdi != None:
-            pdi.filtros_convolucion(event)
-            window["ORI-IMG"].update(data = pdi.get_img('m',True))
+            aplica_filtro('filtros_convolucion',event)
 
     elif event == 'Convertir a letras':
         if pdi != None:
@@ -372,8 +561,7 @@ while True:
                                     win_cdr.hide()
                                     win_letras.hide()
 
-                                    pdi.filtros_letras(v_c,v_f,opciones[i],txt)
-                                    window["ORI-IMG"].update(data = pdi.get_img('m',True))
+                                    aplica_filtro('filtros_letras',v_c,v_f,opciones[i],txt)
 
                                     win_cdr.close()
                                     win_letras.close()
@@ -468,9 +656,7 @@ while True:
                 sg.popup('No se ha seleccionado ninguna fuente!',title = 'Error',keep_on_top = True)
                 continue
 
-            pdi.marca_de_agua(txt_ma,f,v_x,v_y)
-
-            window["ORI-IMG"].update(data = pdi.get_img('m',False))
+            aplica_filtro('marca_de_agua',txt_ma,f,v_x,v_y)
 
             win_ma.close()
             win_coords.close()
@@ -541,11 +727,9 @@ while True:
                 continue
 
             if event == 'Tonos de gris':
-                pdi.aplica_img_recursiva(True, v_ancho, v_alto, v_c, v_f)
+                aplica_filtro('aplica_img_recursiva',True, v_ancho, v_alto, v_c, v_f)
             else:
-                pdi.aplica_img_recursiva(False, v_ancho, v_alto, v_c, v_f)
-
-            window["ORI-IMG"].update(data = pdi.get_img('m',True))
+                aplica_filtro('aplica_img_recursiva',False, v_ancho, v_alto, v_c, v_f)
 
             win_rcsv.close()
 
@@ -614,13 +798,11 @@ while True:
                 continue
 
             if event == 'Nueve puntos':
-                pdi.semitono(0, v_ancho, v_alto, v_c, v_f)
+                aplica_filtro('semitono',0, v_ancho, v_alto, v_c, v_f)
             elif event == 'Cuatro puntos':
-                pdi.semitono(1, v_ancho, v_alto, v_c, v_f)
+                aplica_filtro('semitono',1, v_ancho, v_alto, v_c, v_f)
             elif event == 'Un punto de distintos tamaños':
-                pdi.semitono(2, v_ancho, v_alto, v_c, v_f)
-
-            window["ORI-IMG"].update(data = pdi.get_img('m',True))
+                aplica_filtro('semitono',2, v_ancho, v_alto, v_c, v_f)
 
             win_rcsv.close()        
 
@@ -628,33 +810,126 @@ while True:
 
         if pdi != None:
             if event == 'Maximo':
-                pdi.erosion(True)
+                aplica_filtro('erosion',True)
             else:
-                pdi.erosion(False)
+                aplica_filtro('erosion',False)
+
+    elif event == 'Morfologia':
+
+        if pdi != None:
+            # Organización de los componentes del widget de morfología
+            layout_mf = [
+                [sg.Text('Operación'),sg.Combo(['erosion','dilatacion','apertura','cierre','gradiente'],default_value = 'apertura',readonly = True,key = 'operacion')],
+                [sg.Text('Forma'),sg.Combo(['rectangulo','cruz','disco'],default_value = 'disco',readonly = True,key = 'forma')],
+                [sg.Text('Alto'),sg.In('5',size = (5,1),key = 'alto'),sg.Text('Ancho'),sg.In('5',size = (5,1),key = 'ancho')],
+                [sg.Checkbox('Borde cíclico',default = True,key = 'ciclico')],
+                [sg.Button('Aplicar',key = 'apl-morfologia')]
+            ]
+
+            win_mf = sg.Window('Morfologia',layout_mf,element_justification = 'center',keep_on_top = True,modal = True)
+
+            while True:
+                event_mf,values_mf = win_mf.read()
+
+                if event_mf == sg.WIN_CLOSED:
+                    break
+
+                elif event_mf == 'apl-morfologia':
+
+                    try:
+                        v_alto = int(values_mf['alto'])
+                        v_ancho = int(values_mf['ancho'])
 
-            window["ORI-IMG"].update(data = pdi.get_img('m'))
+                        if v_alto <= 0 or v_ancho <= 0:
+                            sg.popup('Los valores ingresados no son validos',title = 'Error',keep_on_top = True)
+                            continue
+                    except:
+                        sg.popup('Valor ingresado no es un entero',title = 'Error',keep_on_top = True)
+                        continue
+
+                    win_mf.hide()
+                    aplica_filtro('morfologia',values_mf['operacion'],values_mf['forma'],v_alto,v_ancho,values_mf['ciclico'])
+                    win_mf.close()
+
+        else:
+            sg.popup('No se ha abierto ninguna imagen',title = 'Error',keep_on_top = True)
 
     elif event in ['Ordenado','Disperso']:
 
         if pdi != None:
             if event == 'Ordenado':
-                pdi.dit_ord_disp(True)
+                aplica_filtro('dit_ord_disp',True)
             else:
-                pdi.dit_ord_disp(False)
-
-            window["ORI-IMG"].update(data = pdi.get_img('m'))
+                aplica_filtro('dit_ord_disp',False)
 
     elif event == 'Azaroso':
 
         if pdi != None:
-            pdi.dit_azar()
-            window["ORI-IMG"].update(data = pdi.get_img('m'))        
+            # La semilla queda en el historial para obtener la misma imagen al guardar
+            aplica_filtro('dit_azar',randrange(2 ** 32))
+
+    elif event in ['Bayer 2x2','Bayer 4x4','Bayer 8x8']:
+
+        if pdi != None:
+            aplica_filtro('dit_bayer',int(event[-1]))
+
+    elif event in ['Floyd-Steinberg','Atkinson']:
+
+        if pdi != None:
+            aplica_filtro('dit_difusion',event.lower())
+
+    elif event == 'Fotomosaico':
+
+        if pdi != None:
+            layout_fm = [
+                [sg.Text('Carpeta de mosaicos'),sg.In(size = (25,1),key = 'carpeta'),sg.FolderBrowse('Buscar')],
+                [sg.Text('No. de columnas'),sg.In('16',size = (5,1),key = 'num_columnas')],
+                [sg.Text('No. de filas'),sg.In('16',size = (5,1),key = 'num_filas')],
+                [sg.Button('Aplicar',key = 'apl-fm')]
+            ]
+
+            win_fm = sg.Window('Fotomosaico',layout_fm,element_justification = 'center',keep_on_top = True,modal = True)
+
+            while True:
+                event_fm,values_fm = win_fm.read()
+
+                if event_fm == sg.WIN_CLOSED:
+                    break
+
+                elif event_fm == 'apl-fm':
+
+                    try:
+                        v_c = int(values_fm['num_columnas'])
+                        v_f = int(values_fm['num_filas'])
+                    except:
+                        sg.popup('Valor ingresado no es un entero',title = 'Error',keep_on_top = True)
+                        continue
+
+                    if v_c <= 0 or v_f <= 0 or not os.path.isdir(values_fm['carpeta']):
+                        sg.popup('Los valores ingresados no son validos',title = 'Error',keep_on_top = True)
+                        continue
+
+                    win_fm.close()
+                    trabajador.enviar(_agrega_fotomosaico,historial,values_fm['carpeta'],v_c,v_f,al_terminar = muestra_imagen)
+                    break
+        else:
+            sg.popup('No se ha abierto ninguna imagen',title = 'Error',keep_on_top = True)
 
     elif event == 'Deshacer':
 
         if pdi != None:
-            pdi.deshacer_filtro()
-            window["ORI-IMG"].update(data = pdi.get_img('o'))
+            trabajador.enviar(_muestra_paso,historial,True,al_terminar = _paso_mostrado)
+
+    elif event == 'Rehacer':
+
+        if pdi != None:
+            trabajador.enviar(_muestra_paso,historial,False,al_terminar = _paso_mostrado)
 
 # Se cierra la ventana
-window.close()
\ No newline at end of file
+trabajador.cerrar()
+window.close()
+
+perfilador = desactivar_perfil()
+
+if perfilador is not None:
+    perfilador.guardar(os.environ[VARIABLE_PERFIL])
\ No newline at end of file